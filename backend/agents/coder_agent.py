@@ -1,23 +1,30 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.models.gemini import GeminiModel
 from backend.utils import get_file_content
 from backend.agents.utils import send_usage
+from backend.agents.structured_output import parse_structured_output, structured_output_stats
 from backend.agents.models import CodeChunkUpdate, CodeChunkUpdates, FullCodeUpdate, FullCodeUpdates
-from backend.agents.review_agent import ReviewAgent, ReviewFeedback
+from backend.agents.review_agent import ReviewAgent, ReviewFeedback, combine_reviews
+from backend.config import env_int
 import asyncio
 import logging
 from backend.agents.merge_agent import MergeAgent
+from backend.static_check import StaticChecker, static_notes, static_review
 
 logger = logging.getLogger(__name__)
 
+def merge_concurrency() -> int:
+    """Number of files merged (and reviewed) at once, from CODEPILOT_MERGE_CONCURRENCY (default 4)."""
+    return env_int("CODEPILOT_MERGE_CONCURRENCY", 4, minimum=1)
+
 class CoderAgent:
     MAIN_MODEL_NAME = "o1-mini"
     PARSER_MODEL_NAME = "gpt-4o-mini"
 
-    def __init__(self, review: bool = True, max_iterations: int = 1, comm=None, root_directory: str = "."):
+    def __init__(self, review: bool = True, max_iterations: int = 1, comm=None, root_directory: str = ".", concurrency: Optional[int] = None, repo_map=None):
         self.model = OpenAIModel(self.MAIN_MODEL_NAME)
         self.agent = Agent(self.model, result_type=str)
         self.parser_model = OpenAIModel(self.PARSER_MODEL_NAME)
@@ -28,6 +35,9 @@ class CoderAgent:
         self.comm = comm
         self.merge_agent = MergeAgent(comm=comm, root_directory=root_directory)  # Pass root_directory to MergeAgent
         self.root_directory = root_directory
+        self.concurrency = concurrency or merge_concurrency()
+        # RepoMap used to resolve imports in the static checks before review, if available.
+        self.repo_map = repo_map
 
     async def update_code(self, task: str, context: str) -> FullCodeUpdates:
         iteration = 0
@@ -62,36 +72,47 @@ class CoderAgent:
             raw_output = raw_output_response.data
             logger.info(f"Raw output from coder agent (iteration {iteration + 1}): {raw_output}")
             
-            structured_updates_response = await self.parser_agent.run(raw_output)
-            await send_usage(self.comm, structured_updates_response, "coder-parser", self.PARSER_MODEL_NAME)
-            chunk_updates = structured_updates_response.data
+            # The answer is usually valid JSON already; the parser model only handles the rest.
+            chunk_updates = parse_structured_output(raw_output, CodeChunkUpdates, "coder")
+            if chunk_updates is None:
+                fallbacks = structured_output_stats()["coder"]["fallback"]
+                logger.info(f"Could not parse the coder output locally, falling back to the parser model ({fallbacks} fallbacks so far).")
+                if self.comm:
+                    await self.comm.send("log", f"[Coder] Output was not valid JSON, using the parser model ({fallbacks} fallbacks so far).")
+                structured_updates_response = await self.parser_agent.run(raw_output)
+                await send_usage(self.comm, structured_updates_response, "coder-parser", self.PARSER_MODEL_NAME)
+                chunk_updates = structured_updates_response.data
 
             # Group updates by filename and apply changes
             updates_by_file = {}
             for update in chunk_updates.updates:
                 updates_by_file.setdefault(update.filename, []).append(update)
 
-            full_updates = []
-            for filename, file_updates in updates_by_file.items():
-                try:
-                    original_code = get_file_content(filename, root_directory=self.root_directory)
-                except Exception as e:
-                    logger.error(f"Error reading file {filename}: {e}")
-                    continue
-                
-                # Use merge agent to apply updates
-                updated_code = await self.merge_agent.apply_code_updates(original_code, file_updates)
-                full_updates.append(FullCodeUpdate(
-                    filename=filename,
-                    original_code=original_code,
-                    updated_code=updated_code
-                ))
-
+            # Merge the files concurrently; each file is reviewed as soon as it is merged.
+            merge_slots = asyncio.Semaphore(self.concurrency)
+            review_slots = asyncio.Semaphore(self.concurrency)
+            checker = StaticChecker(
+                self.root_directory, self.repo_map.repo_map if self.repo_map is not None else None, updates_by_file
+            )
+            tasks = [
+                asyncio.ensure_future(self._merge_and_review(filename, file_updates, task, merge_slots, review_slots, checker))
+                for filename, file_updates in updates_by_file.items()
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # A failing file cancels the others and its error is raised, as when files were merged in turn.
+                for pending in tasks:
+                    pending.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            full_updates = [update for update, _ in results if update is not None]
             updates = FullCodeUpdates(updates=full_updates)
 
             # Review the updates if enabled
             if self.review and self.review_agent:
-                review_result = await self.review_agent.review(updates, task)
+                reviews = [(update.filename, review) for update, review in results if review is not None]
+                review_result = combine_reviews(reviews) if reviews else await self.review_agent.review(updates, task)
                 
                 if review_result.passed:
                     logger.info("Code review passed")
@@ -126,3 +147,33 @@ class CoderAgent:
                 "=========================================="
             ))
         return updates  # Return the last attempt
+
+    async def _merge_and_review(self, filename: str, file_updates: List[CodeChunkUpdate], task: str,
+                                merge_slots: asyncio.Semaphore, review_slots: asyncio.Semaphore,
+                                checker: StaticChecker) -> Tuple[Optional[FullCodeUpdate], Optional[ReviewFeedback]]:
+        """
+        Merge the updates of one file, then review the result if reviews are enabled. A file
+        with definite static check errors gets their feedback instead of an LLM review; advisory
+        problems are passed on to the review.
+        """
+        try:
+            original_code = await asyncio.to_thread(get_file_content, filename, root_directory=self.root_directory)
+        except Exception as e:
+            logger.error(f"Error reading file {filename}: {e}")
+            return None, None
+        async with merge_slots:
+            merged = await self.merge_agent.merge(original_code, file_updates)
+        update = FullCodeUpdate(filename=filename, original_code=original_code, updated_code=merged.code)
+        if not (self.review and self.review_agent):
+            return update, None
+        problems = await asyncio.to_thread(checker.check, filename, merged.code)
+        failed = static_review(problems)
+        if failed is not None:
+            errors = sum(not problem.advisory for problem in problems)
+            logger.info(f"Static checks failed for {filename}: {errors} errors")
+            if self.comm:
+                await self.comm.send("log", f"[Static check] {filename}: {errors} errors, skipping the LLM review.")
+            return update, failed
+        async with review_slots:
+            review = await self.review_agent.review(FullCodeUpdates(updates=[update]), task, static_notes(problems))
+        return update, review
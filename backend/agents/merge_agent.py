@@ -1,13 +1,19 @@
-from typing import List
+from typing import List, NamedTuple
 from pydantic import BaseModel
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from backend.agents.models import CodeChunkUpdate
 from backend.agents.utils import send_usage
+from backend.patching import apply_update
 import logging
 
 logger = logging.getLogger(__name__)
 
+class MergeResult(NamedTuple):
+    """A merged file and how each update was placed ("exact", "fuzzy", "anchor", ... or "llm (reason)")."""
+    code: str
+    methods: List[str]
+
 class MergeAgent:
     MODEL_NAME = "gpt-4o-mini"
 
@@ -41,6 +47,35 @@ class MergeAgent:
         return code.strip()
 
     async def apply_code_updates(self, original_code: str, updates: List[CodeChunkUpdate]) -> str:
+        """Apply the updates to original_code and return the merged code."""
+        return (await self.merge(original_code, updates)).code
+
+    async def merge(self, original_code: str, updates: List[CodeChunkUpdate]) -> MergeResult:
+        """
+        Apply the updates locally where their old code or anchor can be placed unambiguously,
+        and merge the remaining ones with a single LLM call. The path each update took is logged.
+        """
+        code = original_code
+        methods = []
+        unplaced = []
+        for update in updates:
+            result = apply_update(code, update.old_code, update.new_code, update.anchor_context)
+            if result.applied:
+                code = result.code
+                methods.append(result.method)
+            else:
+                methods.append(f"llm ({result.error})")
+                unplaced.append(update)
+        if unplaced:
+            code = await self._merge_with_llm(code, unplaced)
+        filename = updates[0].filename if updates else ""
+        summary = ", ".join(f"update {i} {method}" for i, method in enumerate(methods, 1))
+        logger.info(f"Merged {filename}: {summary}")
+        if self.comm:
+            await self.comm.send("log", f"[Merge] {filename}: {summary}")
+        return MergeResult(code, methods)
+
+    async def _merge_with_llm(self, original_code: str, updates: List[CodeChunkUpdate]) -> str:
         """Apply all code updates in a single LLM call."""
         # Construct a detailed prompt with all updates
         updates_description = []
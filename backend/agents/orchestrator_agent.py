@@ -6,24 +6,30 @@ from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from backend.agents.planner_agent import PlannerAgent, Plan
 from backend.agents.coder_agent import CoderAgent, FullCodeUpdates
-from backend.utils import build_full_context, get_file_content, get_relevant_snippets
+from backend.utils import build_full_context, get_context_content, get_relevant_snippets, mark_files_changed, search_cache_stats
 from backend.agents.utils import send_usage
 from backend.repo_map import RepoMap
+from backend.symbols import definition_source
 from backend.models.shared import RelevantFiles, RelevantFile
 from backend.communication import WebSocketCommunicator
 
 class OrchestratorAgent:
     MODEL_NAME = "gpt-4o"
+    # Limits on what find_symbol returns, so an ambiguous name or a huge class stays cheap.
+    MAX_SYMBOL_MATCHES = 5
+    MAX_SYMBOL_LINES = 200
 
-    def __init__(self, repo_stub: str, comm: WebSocketCommunicator, review: bool = True, max_iterations: int = 1, root_directory: str = "."):
+    def __init__(self, repo_stub: str, comm: WebSocketCommunicator, review: bool = True, max_iterations: int = 1, root_directory: str = ".", repo_map: RepoMap = None, stub_max_tokens: int = None):
         self.model = OpenAIModel(self.MODEL_NAME)
         self.repo_stub = repo_stub
+        self.repo_map = repo_map
+        self.stub_max_tokens = stub_max_tokens
         self.comm = comm
         self.planner = PlannerAgent(comm=comm)
         self.review = review
         self.max_iterations = max_iterations
         self.root_directory = root_directory
-        self.coder = CoderAgent(review=self.review, max_iterations=self.max_iterations, comm=comm, root_directory=root_directory)  # Pass comm to CoderAgent
+        self.coder = CoderAgent(review=self.review, max_iterations=self.max_iterations, comm=comm, root_directory=root_directory, repo_map=repo_map)  # Pass comm to CoderAgent
         self.user_prompt = None
         self.agent = Agent(
             self.model,
@@ -35,6 +41,8 @@ class OrchestratorAgent:
                 Iterate using the tools until the user request is completely resolved. Only change the codebase when necessary, 
                 if the user simply asks for explanation, don't use the 'update_the_code' tool.
                 Always use the 'read_file' tool to read the content of files that are relevant to fulfill the user's request.
+                Use the 'find_symbol' tool to get the source of a specific function, class or method (e.g. 'SearchIndex.query')
+                without reading the whole file.
                 Use the 'search' tool to find specific code snippets in the codebase as needed. This is not a websearch!"""
             )
         )
@@ -68,7 +76,8 @@ class OrchestratorAgent:
             context += f"\n\nOriginal User Request:\n{self.user_prompt}\n"
             await self.comm.send("log", f"[Tool Call: update_code] with task: {task}\nuser_prompt: {self.user_prompt}\n{files}")
 
-            # Get code updates from the coder agent.
+            # Get code updates from the coder agent, which checks imports against the current map.
+            self.coder.repo_map = self.repo_map
             updates: FullCodeUpdates = await self.coder.update_code(task, context)
             await self.comm.send("log", f"[Tool Call: update_code] received updates for: {[u.filename for u in updates.updates]}")
             results = []
@@ -115,9 +124,7 @@ class OrchestratorAgent:
                                     f.write(update.updated_code)
                                 results.append(f"Updated {update.filename}. Feedback provided: {feedback}")
                                 # Refresh repository stub
-                                rm = RepoMap(self.root_directory)
-                                rm.build_map()
-                                self.repo_stub = rm.to_python_stub()
+                                await asyncio.to_thread(self._refresh_repo_stub, [full_path])
                             except Exception as e:
                                 results.append(f"Failed to update {update.filename}: {e}")
                         else:
@@ -132,9 +139,7 @@ class OrchestratorAgent:
                                 f.write(update.updated_code)
                             results.append(f"Updated {update.filename}.")
                             # Refresh repository stub
-                            rm = RepoMap(self.root_directory)
-                            rm.build_map()
-                            self.repo_stub = rm.to_python_stub()
+                            await asyncio.to_thread(self._refresh_repo_stub, [full_path])
                         except Exception as e:
                             results.append(f"Failed to update {update.filename}: {e}")
                     elif choice == "n":
@@ -159,31 +164,79 @@ class OrchestratorAgent:
                 return ""
 
         async def read_file_tool(ctx: RunContext[str], file_path: str) -> str:
-            """Reads the content of a file."""
+            """Reads the content of a file. Very large files are truncated."""
             # Ensure absolute path
             if not os.path.isabs(file_path):
                 file_path = os.path.join(self.root_directory, file_path)
             await self.comm.send("log", f"[Tool Call: read_file] with filepath: {file_path}")
-            content = get_file_content(file_path, root_directory=self.root_directory)
+            content = get_context_content(file_path, root_directory=self.root_directory)
             return content
 
-        async def search_tool(ctx: RunContext[str], search_terms: str) -> List[Dict[str, str]]:
-            """Searches the codebase for the given search terms and returns relevant snippets with filenames."""
+        async def search_tool(ctx: RunContext[str], search_terms: str, context_lines: int = 0) -> List[Dict[str, Any]]:
+            """
+            Searches the codebase for the given search terms and returns the matching code snippets
+            with their filenames, line ranges and symbols. Set context_lines to also include that
+            many lines around each match. Use read_file for a whole file.
+            """
             await self.comm.send("log", f"[Tool Call: search] with search_terms: {search_terms}")
             try:
-                snippets = await asyncio.to_thread(get_relevant_snippets, search_terms, self.root_directory)
-                await self.comm.send("log", f"[Tool Call: search] found {len(snippets)} snippets.")
+                snippets = await asyncio.to_thread(
+                    get_relevant_snippets, search_terms, self.root_directory, context_lines=max(0, context_lines)
+                )
+                stats = search_cache_stats()
+                await self.comm.send(
+                    "log", f"[Tool Call: search] found {len(snippets)} snippets (result cache: {stats['hits']} hits, {stats['misses']} misses)."
+                )
                 return snippets
             except Exception as e:
                 await self.comm.send("error", f"Search tool failed: {str(e)}")
                 return []
 
+        async def find_symbol_tool(ctx: RunContext[str], name: str) -> List[Dict[str, Any]]:
+            """
+            Finds where a function, class or method is defined and returns only its source lines.
+            name can be bare ("query"), qualified ("SearchIndex.query") or module-prefixed
+            ("backend.utils.SearchIndex.query"). Each match lists the files that import the symbol.
+            """
+            await self.comm.send("log", f"[Tool Call: find_symbol] with name: {name}")
+            if self.repo_map is None:
+                self.repo_map = RepoMap(self.root_directory, model_name=self.MODEL_NAME)
+                await asyncio.to_thread(self.repo_map.build_map)
+            symbols = self.repo_map.symbol_index()
+            definitions = symbols.find(name)
+            matches = [
+                {
+                    "filename": d.rel_path,
+                    "symbol": d.qualname,
+                    "kind": d.kind,
+                    "lines": f"{d.lineno}-{d.end_lineno}",
+                    "source": definition_source(d, self.root_directory, self.MAX_SYMBOL_LINES),
+                    "imported_by": symbols.references(d),
+                }
+                for d in definitions[:self.MAX_SYMBOL_MATCHES]
+            ]
+            await self.comm.send("log", f"[Tool Call: find_symbol] found {len(definitions)} definitions.")
+            return matches
+
         # Register our wrapper functions as tools.
         #self.agent.tool(create_plan_tool)
         self.agent.tool(update_code_tool)
         self.agent.tool(ask_user_tool)
         self.agent.tool(read_file_tool)
         self.agent.tool(search_tool)
+        self.agent.tool(find_symbol_tool)
+
+    def _refresh_repo_stub(self, changed_paths: List[str]):
+        """Update the repository map and search index for the written files and regenerate the stub."""
+        mark_files_changed(self.root_directory, changed_paths)
+        if self.repo_map is None:
+            self.repo_map = RepoMap(self.root_directory, model_name=self.MODEL_NAME)
+            self.repo_map.build_map()
+        else:
+            self.repo_map.refresh(changed_paths)
+        self.repo_stub = self.repo_map.to_python_stub(
+            max_tokens=self.stub_max_tokens, focus=[self.user_prompt, *changed_paths]
+        )
 
     async def run(self, user_prompt: str):
         """Starts the agentic process to solve the user request."""
@@ -4,6 +4,7 @@ from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.models.gemini import GeminiModel
 from backend.agents.utils import send_usage
+from backend.agents.structured_output import parse_structured_output
 
 # Pydantic models for structured plan output.
 class Task(BaseModel):
@@ -31,14 +32,17 @@ class PlannerAgent:
             "Given the above context, create a detailed yet minimal plan consisting of tasks with names and descriptions. Exclude testing and installation tasks; focus on file-creating tasks when feature implementations are requested, and explanation tasks when user requests are for explanations.\n"
             "Address the following user request:\n"
             f"{user_prompt}\n"
-            "Output the plan in plain text."
+            "Output only the plan as JSON, in the form "
+            '{"tasks": [{"name": "...", "description": "..."}]}.'
         )
         raw_plan_response = await self.agent.run(system_prompt)
         raw_plan = raw_plan_response.data
         await send_usage(self.comm, raw_plan_response, "planner", self.MAIN_MODEL_NAME)
 
-        structured_plan_response = await self.parser_agent.run(raw_plan)
-        structured_plan = structured_plan_response.data
-        await send_usage(self.comm, structured_plan_response, "planner-parser", self.PARSER_MODEL_NAME)
+        structured_plan = parse_structured_output(raw_plan, Plan, "planner")
+        if structured_plan is None:
+            structured_plan_response = await self.parser_agent.run(raw_plan)
+            structured_plan = structured_plan_response.data
+            await send_usage(self.comm, structured_plan_response, "planner-parser", self.PARSER_MODEL_NAME)
 
         return structured_plan
@@ -1,14 +1,83 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from backend.agents.models import ReviewFeedback, FullCodeUpdates
 from backend.agents.utils import send_usage
+from backend.config import env_int
+from backend.diffs import diff_hunks
+from backend.tokens import count_tokens, encoding_name_for_model
+
+def review_context_lines() -> int:
+    """Lines of context around each changed region in review prompts (CODEPILOT_REVIEW_CONTEXT_LINES)."""
+    return env_int("CODEPILOT_REVIEW_CONTEXT_LINES", 3)
+
+def review_max_tokens() -> int:
+    """Token budget of the changes in one review prompt (CODEPILOT_REVIEW_MAX_TOKENS), 0 for no limit."""
+    return env_int("CODEPILOT_REVIEW_MAX_TOKENS", 8000)
+
+def format_changes(updates: FullCodeUpdates, context_lines: int = 3, max_tokens: Optional[int] = None, encoding_name: Optional[str] = None) -> str:
+    """
+    Render the updates as unified-diff hunks per file, each headed by its enclosing symbol.
+
+    With max_tokens, hunks are kept whole in file order, those changing more than whitespace
+    first. A hunk that no longer fits is replaced by a one-line summary, and dropped once even
+    the summaries do not fit.
+    """
+    count = (lambda text: count_tokens(text, encoding_name)) if encoding_name else count_tokens
+    files = []
+    for update in updates.updates:
+        title = f"File: {update.filename}" + (" (new file)" if not update.original_code else "")
+        files.append((title, diff_hunks(update.filename, update.original_code, update.updated_code, context_lines)))
+    keys = [(f, h) for f, (_, hunks) in enumerate(files) for h in range(len(hunks))]
+    kept: Dict[Tuple[int, int], str] = {(f, h): files[f][1][h].text() for f, h in keys}
+    if max_tokens:
+        budget = max_tokens - sum(count(title) for title, _ in files)
+        by_priority = sorted(keys, key=lambda key: (files[key[0]][1][key[1]].whitespace_only, key))
+        full = set()
+        for key in by_priority:
+            cost = count(kept[key])
+            if cost <= budget:
+                full.add(key)
+                budget -= cost
+        for key in by_priority:
+            if key in full:
+                continue
+            hunk = files[key[0]][1][key[1]]
+            summary = f"{hunk.header} (omitted: {hunk.added} lines added, {hunk.removed} removed)"
+            cost = count(summary)
+            if cost <= budget:
+                kept[key] = summary
+                budget -= cost
+            else:
+                del kept[key]
+    sections = []
+    for f, (title, hunks) in enumerate(files):
+        lines = [title]
+        if not hunks:
+            lines.append("(no changes)")
+        lines.extend(kept[(f, h)] for h in range(len(hunks)) if (f, h) in kept)
+        dropped = sum(1 for h in range(len(hunks)) if (f, h) not in kept)
+        if dropped:
+            lines.append(f"({dropped} more hunks omitted)")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+def combine_reviews(reviews: List[Tuple[str, ReviewFeedback]]) -> ReviewFeedback:
+    """Combine per-file reviews into one that passes only if every file passed."""
+    if len(reviews) == 1:
+        return reviews[0][1]
+    suggestions = [f"{filename}: {review.suggestions}" for filename, review in reviews if review.suggestions]
+    return ReviewFeedback(
+        passed=all(review.passed for _, review in reviews),
+        feedback="\n".join(f"{filename}: {review.feedback}" for filename, review in reviews),
+        suggestions="\n".join(suggestions) or None,
+    )
 
 class ReviewAgent:
     MODEL_NAME = "gpt-4o-mini"
 
-    def __init__(self, comm=None):
+    def __init__(self, comm=None, context_lines: Optional[int] = None, max_tokens: Optional[int] = None):
         self.model = OpenAIModel(self.MODEL_NAME)  # Using a more capable model for review
         self.agent = Agent(
             self.model,
@@ -27,23 +96,24 @@ class ReviewAgent:
             )
         )
         self.comm = comm
+        self.context_lines = context_lines if context_lines is not None else review_context_lines()
+        self.max_tokens = max_tokens if max_tokens is not None else review_max_tokens()
 
-    async def review(self, updates: FullCodeUpdates, task: str) -> ReviewFeedback:
+    async def review(self, updates: FullCodeUpdates, task: str, static_notes: str = "") -> ReviewFeedback:
         """Review code updates and provide feedback.
         
         Args:
             updates: The code updates to review
             task: The task these changes are meant to implement
+            static_notes: Possible problems reported by the static checks, to be confirmed or dismissed
             
         Returns:
             ReviewFeedback containing passed status, feedback and suggestions
         """
-        # Format the updates for review
-        updates_text = ""
-        for update in updates.updates:
-            updates_text += f"\nFile: {update.filename}\n"
-            updates_text += f"Original:\n{update.original_code}\n"
-            updates_text += f"Updated:\n{update.updated_code}\n"
+        # Only the changed regions are sent, as diff hunks within the token budget.
+        changes = format_changes(
+            updates, self.context_lines, self.max_tokens or None, encoding_name_for_model(self.MODEL_NAME)
+        )
 
         prompt = (
             f"Task to implement:\n{task}\n\n"
@@ -52,8 +122,15 @@ class ReviewAgent:
             "2. Best practices\n"
             "3. Potential bugs\n"
             "4. Side effects\n\n"
-            f"Changes to review:\n{updates_text}"
+            "The changes are unified diffs per file: lines starting with '-' were removed, lines starting "
+            "with '+' were added, and each @@ header names the function or class the hunk is in.\n\n"
+            f"Changes to review:\n{changes}"
         )
+        if static_notes:
+            prompt += (
+                "\n\nStatic checks reported these possible problems. They may be false positives "
+                f"(for example modules generated at build time); fail the review only for real ones:\n{static_notes}"
+            )
 
         review_response = await self.agent.run(prompt)
         await send_usage(self.comm, review_response, "review", self.MODEL_NAME)
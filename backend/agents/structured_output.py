@@ -0,0 +1,130 @@
+"""
+Local parsing of the JSON that agents are asked to answer with, so the parser model is only
+called when the answer cannot be read directly.
+
+The JSON is looked for in the whole answer, in its fenced code blocks and from each opening
+brace or bracket, ignoring prose after it. Control characters in strings, trailing commas,
+// comments and Python literals (True, False, None) are tolerated. A bare list, or a single
+item, is accepted for a model whose only field is a list of such items.
+"""
+import json
+import re
+import threading
+import typing
+from collections import defaultdict
+from typing import Any, Dict, Iterator, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+# Opening brace or bracket positions tried per candidate text, for answers with bracketed prose.
+MAX_JSON_STARTS = 20
+
+_FENCE_RE = re.compile(r"```[\w+-]*[ \t]*\n(.*?)```", re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_decoder = json.JSONDecoder(strict=False)
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"local": 0, "fallback": 0})
+_stats_lock = threading.Lock()
+
+def parse_structured_output(text: str, model: Type[M], agent_name: str = "") -> Optional[M]:
+    """
+    Return the model parsed from an agent's answer, or None if no JSON value in it validates.
+    Counts the outcome under agent_name: "local" on success, "fallback" when the caller has
+    to ask the parser model instead.
+    """
+    result = None
+    for value in _json_values(text or ""):
+        result = _validate(value, model)
+        if result is not None:
+            break
+    with _stats_lock:
+        _stats[agent_name]["local" if result is not None else "fallback"] += 1
+    return result
+
+def structured_output_stats() -> Dict[str, Dict[str, int]]:
+    """Local parses and parser-model fallbacks so far, per agent name."""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+def _json_values(text: str) -> Iterator[Any]:
+    """
+    Yield the JSON values found in text, most likely first. Values nested in one already
+    yielded are skipped, so a part of an invalid answer is not taken for the whole.
+    """
+    candidates = [text] + _FENCE_RE.findall(text)
+    for candidate in candidates:
+        for variant in (candidate, _repair(candidate)):
+            decoded_to = 0
+            for start in _json_starts(variant):
+                if start < decoded_to:
+                    continue
+                try:
+                    value, decoded_to = _decoder.raw_decode(variant, start)
+                except ValueError:
+                    continue
+                yield value
+
+def _json_starts(text: str) -> Iterator[int]:
+    count = 0
+    for match in re.finditer(r"[{\[]", text):
+        yield match.start()
+        count += 1
+        if count >= MAX_JSON_STARTS:
+            return
+
+def _repair(text: str) -> str:
+    """Drop trailing commas and // comments and replace Python literals, outside of strings."""
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if char == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+            continue
+        elif char == ",":
+            following = i + 1
+            while following < n and text[following].isspace():
+                following += 1
+            if following == n or text[following] not in "}]":
+                out.append(char)
+        elif char.isalpha():
+            end = i
+            while end < n and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[i:end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i = end
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+def _validate(value: Any, model: Type[M]) -> Optional[M]:
+    """Validate value as model, also trying it as the items of a model's only list field."""
+    attempts = [value]
+    fields = model.model_fields
+    if len(fields) == 1:
+        name, field = next(iter(fields.items()))
+        if typing.get_origin(field.annotation) is list:
+            attempts.append({name: value if isinstance(value, list) else [value]})
+    for attempt in attempts:
+        try:
+            return model.model_validate(attempt)
+        except ValidationError:
+            continue
+    return None
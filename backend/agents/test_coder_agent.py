@@ -1,7 +1,10 @@
+import asyncio
 import pytest
 import pytest_asyncio
 from unittest.mock import Mock, AsyncMock, patch
 from .coder_agent import CoderAgent, CodeChunkUpdate, CodeChunkUpdates, FullCodeUpdates
+from .merge_agent import MergeResult
+from .review_agent import ReviewFeedback, combine_reviews
 
 @pytest_asyncio.fixture
 async def mock_coder_agent():
@@ -100,4 +103,105 @@ async def test_update_code_with_insertion(mock_coder_agent):
         assert len(result.updates) == 1
         assert result.updates[0].filename == "test.py"
         assert result.updates[0].original_code == original_code
-        assert 'return "Hello, World!"' in result.updates[0].updated_code
\ No newline at end of file
+        assert 'return "Hello, World!"' in result.updates[0].updated_code
+
+@pytest.mark.asyncio
+async def test_files_are_merged_concurrently_and_reviewed_as_they_finish():
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'), patch('backend.agents.coder_agent.OpenAIModel'), \
+            patch('backend.agents.merge_agent.OpenAIModel'), patch('backend.agents.review_agent.OpenAIModel'):
+        agent = CoderAgent(concurrency=2)
+    filenames = ["slow.py", "a.py", "b.py"]
+    agent.agent.run = AsyncMock(return_value=Mock(data="{}"))
+    agent.parser_agent.run = AsyncMock(return_value=Mock(data=CodeChunkUpdates(updates=[
+        CodeChunkUpdate(filename=name, old_code="x = 1", new_code="x = 2", explanation="") for name in filenames
+    ])))
+    events = []
+    running = []
+
+    async def merge(original_code, updates):
+        running.append(updates[0].filename)
+        assert len(running) <= 2
+        await asyncio.sleep(0.2 if updates[0].filename == "slow.py" else 0.01)
+        running.remove(updates[0].filename)
+        events.append(("merged", updates[0].filename))
+        return MergeResult(original_code.replace("x = 1", "x = 2"), ["exact"])
+
+    async def review(updates, task, static_notes=""):
+        events.append(("reviewed", updates.updates[0].filename))
+        return ReviewFeedback(passed=updates.updates[0].filename != "b.py", feedback="checked", suggestions="fix b")
+
+    agent.merge_agent.merge = merge
+    agent.review_agent.review = review
+    with patch('backend.agents.coder_agent.get_file_content', return_value="x = 1\n"):
+        result = await agent.update_code(task="Bump x", context="")
+
+    assert [u.filename for u in result.updates] == filenames
+    assert all(u.updated_code == "x = 2\n" for u in result.updates)
+    # The fast files are reviewed while slow.py is still being merged.
+    assert events.index(("reviewed", "a.py")) < events.index(("merged", "slow.py"))
+    assert len([e for e in events if e[0] == "reviewed"]) == 3
+
+@pytest.mark.asyncio
+async def test_a_failing_merge_cancels_the_other_files():
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'), patch('backend.agents.coder_agent.OpenAIModel'), \
+            patch('backend.agents.merge_agent.OpenAIModel'), patch('backend.agents.review_agent.OpenAIModel'):
+        agent = CoderAgent(review=False)
+    agent.agent.run = AsyncMock(return_value=Mock(data=CodeChunkUpdates(updates=[
+        CodeChunkUpdate(filename=name, old_code="x = 1", new_code="x = 2", explanation="") for name in ("bad.py", "slow.py")
+    ]).model_dump_json()))
+    cancelled = []
+
+    async def merge(original_code, updates):
+        if updates[0].filename == "bad.py":
+            await asyncio.sleep(0.05)
+            raise RuntimeError("merge failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(updates[0].filename)
+            raise
+
+    agent.merge_agent.merge = merge
+    with patch('backend.agents.coder_agent.get_file_content', return_value="x = 1\n"):
+        with pytest.raises(RuntimeError, match="merge failed"):
+            await agent.update_code(task="Bump x", context="")
+    assert cancelled == ["slow.py"]
+
+def test_combined_review_passes_only_if_every_file_passed():
+    combined = combine_reviews([
+        ("a.py", ReviewFeedback(passed=True, feedback="fine")),
+        ("b.py", ReviewFeedback(passed=False, feedback="broken", suggestions="fix it")),
+    ])
+    assert not combined.passed
+    assert combined.feedback == "a.py: fine\nb.py: broken" and combined.suggestions == "b.py: fix it"
+
+@pytest.mark.asyncio
+async def test_files_failing_static_checks_are_not_sent_to_review():
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'), patch('backend.agents.coder_agent.OpenAIModel'), \
+            patch('backend.agents.merge_agent.OpenAIModel'), patch('backend.agents.review_agent.OpenAIModel'):
+        agent = CoderAgent(max_iterations=2)
+    agent.agent.run = AsyncMock(return_value=Mock(data=CodeChunkUpdates(updates=[
+        CodeChunkUpdate(filename="ok.py", old_code="x = 1", new_code="x = 2", explanation=""),
+        CodeChunkUpdate(filename="broken.py", old_code="x = 1", new_code="x = (2", explanation=""),
+    ]).model_dump_json()))
+    agent.review_agent.review = AsyncMock(return_value=ReviewFeedback(passed=True, feedback="looks good"))
+    with patch('backend.agents.coder_agent.get_file_content', return_value="x = 1\n"):
+        await agent.update_code(task="Bump x", context="")
+    reviewed = [call.args[0].updates[0].filename for call in agent.review_agent.review.call_args_list]
+    assert reviewed == ["ok.py", "ok.py"]
+    prompt = agent.agent.run.call_args.args[0]
+    assert "broken.py:1: syntax error" in prompt  # the static feedback went back to the coder
+
+@pytest.mark.asyncio
+async def test_advisory_static_problems_are_passed_to_the_review():
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'), patch('backend.agents.coder_agent.OpenAIModel'), \
+            patch('backend.agents.merge_agent.OpenAIModel'), patch('backend.agents.review_agent.OpenAIModel'):
+        agent = CoderAgent()
+    agent.agent.run = AsyncMock(return_value=Mock(data=CodeChunkUpdates(updates=[
+        CodeChunkUpdate(filename="gen.py", old_code="x = 1", new_code="x = generated_value", explanation=""),
+    ]).model_dump_json()))
+    agent.review_agent.review = AsyncMock(return_value=ReviewFeedback(passed=True, feedback="generated at build time"))
+    with patch('backend.agents.coder_agent.get_file_content', return_value="x = 1\n"):
+        result = await agent.update_code(task="Use the generated value", context="")
+    assert result.updates[0].updated_code == "x = generated_value\n"
+    assert agent.review_agent.review.call_args.args[2] == "gen.py:1: undefined name 'generated_value'"
@@ -0,0 +1,40 @@
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from .merge_agent import MergeAgent
+from .models import CodeChunkUpdate
+
+ORIGINAL = """def hello():
+    print("Hello")
+"""
+
+@pytest.fixture
+def merge_agent():
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'):
+        with patch('backend.agents.merge_agent.OpenAIModel'):
+            agent = MergeAgent()
+    agent.agent.run = AsyncMock(return_value=Mock(data='```python\nmerged by llm\n```'))
+    return agent
+
+def _update(old_code, new_code, anchor_context=None):
+    return CodeChunkUpdate(filename="test.py", old_code=old_code, new_code=new_code, explanation="", anchor_context=anchor_context)
+
+@pytest.mark.asyncio
+async def test_placeable_updates_are_applied_without_the_llm(merge_agent):
+    result = await merge_agent.merge(ORIGINAL, [
+        _update('print("Hello")', 'print("Hello, World!")'),
+        _update("", '    return "Hello"', anchor_context='print("Hello, World!")'),
+    ])
+    assert result.code == 'def hello():\n    print("Hello, World!")\n    return "Hello"\n'
+    assert result.methods == ["exact", "anchor"]
+    merge_agent.agent.run.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_only_unplaced_updates_go_to_the_llm(merge_agent):
+    result = await merge_agent.merge(ORIGINAL, [
+        _update('print("Hello")', 'print("Hi")'),
+        _update('print("Bye")', 'print("Ciao")'),
+    ])
+    assert result.code == "merged by llm"
+    assert result.methods == ["exact", "llm (old_code not found)"]
+    prompt = merge_agent.agent.run.call_args.args[0]
+    assert 'print("Hi")' in prompt and 'print("Ciao")' in prompt and 'Update 2' not in prompt
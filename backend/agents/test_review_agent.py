@@ -0,0 +1,38 @@
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from . import review_agent
+from .review_agent import ReviewAgent, ReviewFeedback, format_changes
+from .models import FullCodeUpdate, FullCodeUpdates
+
+def _word_count(text, *args):
+    return len(text.split())
+
+def _file(n_functions):
+    return "".join(f"def f{i}():\n    return {i}\n\n" for i in range(n_functions))
+
+@pytest.mark.asyncio
+async def test_review_prompt_contains_only_the_changed_region(monkeypatch):
+    monkeypatch.setattr(review_agent, "count_tokens", _word_count)
+    with patch('pydantic_ai.models.cohere.AsyncClientV2'), patch('backend.agents.review_agent.OpenAIModel'):
+        agent = ReviewAgent(context_lines=1, max_tokens=0)
+    agent.agent.run = AsyncMock(return_value=Mock(data=ReviewFeedback(passed=True, feedback="ok")))
+    original = _file(300)
+    update = FullCodeUpdate(filename="big.py", original_code=original, updated_code=original.replace("return 150", "return -150"))
+    await agent.review(FullCodeUpdates(updates=[update]), "Negate f150")
+    prompt = agent.agent.run.call_args.args[0]
+    assert "@@ -451,3 +451,3 @@ f150\n def f150():\n-    return 150\n+    return -150\n " in prompt
+    assert "def f149" not in prompt and len(prompt) < 1000
+
+def test_changes_over_budget_are_summarized_then_dropped(monkeypatch):
+    monkeypatch.setattr(review_agent, "count_tokens", _word_count)
+    original = _file(30)
+    updated = original.replace("return 3\n", "return 33\n").replace("return 20", "return  20").replace("return 25", "return 52")
+    updates = FullCodeUpdates(updates=[FullCodeUpdate(filename="m.py", original_code=original, updated_code=updated)])
+    everything = format_changes(updates, context_lines=0)
+    assert everything.count("@@") == 6
+    # The whitespace-only hunk in f20 is the one summarized.
+    tight = format_changes(updates, context_lines=1, max_tokens=40)
+    assert "+    return 33" in tight and "+    return 52" in tight
+    assert "@@ -61,3 +61,3 @@ f20 (omitted: 1 lines added, 1 removed)" in tight
+    dropped = format_changes(updates, context_lines=1, max_tokens=21)
+    assert "+    return 33" in dropped and dropped.endswith("(2 more hunks omitted)")
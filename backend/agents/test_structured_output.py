@@ -0,0 +1,35 @@
+from .models import CodeChunkUpdates
+from .planner_agent import Plan
+from .structured_output import parse_structured_output, structured_output_stats
+
+UPDATE = '{"filename": "a.py", "old_code": "x = 1", "new_code": "x = 2", "explanation": "bump"}'
+
+def test_plain_json_is_parsed():
+    result = parse_structured_output('{"updates": [%s]}' % UPDATE, CodeChunkUpdates)
+    assert result.updates[0].new_code == "x = 2"
+
+def test_fences_prose_and_syntax_slips_are_tolerated():
+    text = (
+        "Here are the [two] changes:\n```json\n"
+        '{"updates": [\n  // bump x\n  {"filename": "a.py", "old_code": "def f():\n    pass", "new_code": "", '
+        '"explanation": "remove f", "anchor_context": None,},\n]}\n```\nLet me know if you need more.'
+    )
+    result = parse_structured_output(text, CodeChunkUpdates)
+    assert result.updates[0].old_code == "def f():\n    pass" and result.updates[0].anchor_context is None
+
+def test_bracketed_prose_before_the_json_is_skipped():
+    result = parse_structured_output('I made [1] change:\n{"updates": [%s]}' % UPDATE, CodeChunkUpdates)
+    assert result is not None and result.updates[0].new_code == "x = 2"
+
+def test_bare_lists_and_single_items_fill_the_only_list_field():
+    assert len(parse_structured_output("[%s, %s]" % (UPDATE, UPDATE), CodeChunkUpdates).updates) == 2
+    assert len(parse_structured_output(UPDATE, CodeChunkUpdates).updates) == 1
+    plan = parse_structured_output('[{"name": "Add flag", "description": "Add a --dry-run flag"}]', Plan)
+    assert plan.tasks[0].name == "Add flag"
+
+def test_fallbacks_are_counted():
+    before = structured_output_stats().get("test", {"local": 0, "fallback": 0})
+    assert parse_structured_output("I could not decide on a change.", CodeChunkUpdates, "test") is None
+    assert parse_structured_output('{"updates": [{"filename": "a.py"}]}', CodeChunkUpdates, "test") is None
+    parse_structured_output(UPDATE, CodeChunkUpdates, "test")
+    assert structured_output_stats()["test"] == {"local": before["local"] + 1, "fallback": before["fallback"] + 2}
@@ -0,0 +1,127 @@
+import os
+import sys
+import struct
+import marshal
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+from backend.repo_records import pack, unpack
+
+# Bump whenever the shape of parsed repo map entries changes so stale caches are discarded.
+REPO_MAP_CACHE_VERSION = 4
+# File header: magic bytes and format version.
+_CACHE_HEADER = struct.Struct("<4sI")
+_CACHE_MAGIC = b"CPRM"
+
+def get_cache_dir() -> str:
+    """
+    Return the directory used for on-disk caches, creating it if needed.
+    Defaults to ~/.cache/ai-codepilot and can be overridden with CODEPILOT_CACHE_DIR.
+    """
+    cache_dir = os.getenv("CODEPILOT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "ai-codepilot")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def root_cache_key(root_dir: str) -> str:
+    """Return a short stable key identifying a workspace root."""
+    return hashlib.sha1(os.path.abspath(root_dir).encode("utf-8")).hexdigest()[:16]
+
+def file_digest(filepath: str) -> Optional[str]:
+    """Return the blake2b content hash of a file, or None if it cannot be read."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+class RepoMapCache:
+    """
+    Persistent cache of parsed repo map entries for one workspace root.
+
+    Entries are keyed by relative path and validated against (mtime, size, content hash):
+    a matching mtime and size is trusted as-is, otherwise the content hash decides whether
+    the cached parse can be reused.
+
+    The file is a small header followed by a marshal payload of packed records (see
+    backend.repo_records), so loading is a single C-level decode; each entry is turned back
+    into typed records only when it is first requested.
+    """
+
+    def __init__(self, root_dir: str, cache_dir: Optional[str] = None):
+        self.root_dir = os.path.abspath(root_dir)
+        cache_dir = cache_dir or get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"repo_map_{root_cache_key(self.root_dir)}.bin")
+        # rel_path -> [mtime_ns, size, hash, packed record, unpacked record or None]
+        self.entries: Dict[str, List[Any]] = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load the cache file, discarding it if it is unreadable or from another version."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, version = _CACHE_HEADER.unpack_from(data)
+            if magic != _CACHE_MAGIC or version != REPO_MAP_CACHE_VERSION:
+                return
+            root, entries = marshal.loads(data[_CACHE_HEADER.size:])
+        except (OSError, ValueError, EOFError, TypeError, struct.error):
+            return
+        if root != self.root_dir:
+            return
+        self.entries = {rel_path: [mtime, size, digest, packed, None] for rel_path, mtime, size, digest, packed in entries}
+
+    def save(self):
+        """Atomically write the cache file if anything changed since the last save."""
+        if not self._dirty:
+            return
+        entries = tuple((rel_path, e[0], e[1], e[2], e[3]) for rel_path, e in self.entries.items())
+        data = _CACHE_HEADER.pack(_CACHE_MAGIC, REPO_MAP_CACHE_VERSION) + marshal.dumps((self.root_dir, entries))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Failed to write repo map cache {self.path}: {e}", file=sys.stderr)
+
+    def get(self, rel_path: str, filepath: str, st: os.stat_result) -> Optional[Any]:
+        """Return the cached record for rel_path if it is still valid for the file on disk."""
+        entry = self.entries.get(rel_path)
+        if entry is None or entry[1] != st.st_size:
+            return None
+        if entry[0] != st.st_mtime_ns:
+            # Touched but possibly unchanged (checkout, save without edits): compare contents.
+            if file_digest(filepath) != entry[2]:
+                return None
+            entry[0] = st.st_mtime_ns
+            self._dirty = True
+        if entry[4] is None:
+            entry[4] = unpack(entry[3])
+        return entry[4]
+
+    def put(self, rel_path: str, filepath: str, st: os.stat_result, info: Any):
+        """Store a freshly parsed record."""
+        digest = file_digest(filepath)
+        if digest is None:
+            return
+        self.entries[rel_path] = [st.st_mtime_ns, st.st_size, digest, pack(info), info]
+        self._dirty = True
+
+    def discard(self, rel_path: str):
+        """Forget a single entry."""
+        if self.entries.pop(rel_path, None) is not None:
+            self._dirty = True
+
+    def prune(self, keep: Iterable[str]):
+        """Drop every entry whose path is not in keep (deleted or newly ignored files)."""
+        keep = set(keep)
+        stale = [rel_path for rel_path in self.entries if rel_path not in keep]
+        for rel_path in stale:
+            del self.entries[rel_path]
+        if stale:
+            self._dirty = True
@@ -0,0 +1,254 @@
+"""
+Syntax-aware chunking of source files for the search index.
+
+Files are split on top-level symbol boundaries so that a chunk is a whole function, class or
+block: the AST for Python, and line heuristics for script, style and function boundaries in
+JS/TS, Svelte, HTML and CSS. Symbols larger than the chunk size are sub-split (classes by
+method, anything else by lines). Code between symbols is kept as unnamed chunks, or joins
+the next symbol when it is small.
+Every chunk knows its symbol name and 1-based, inclusive line range.
+"""
+import ast
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Target maximum size of a chunk in characters.
+MAX_CHUNK_CHARS = 1500
+# Code between symbols (or a bare <script>/<style> tag line) smaller than this joins a neighbouring chunk.
+MIN_FILLER_CHARS = 100
+
+class Chunk(NamedTuple):
+    text: str
+    start_line: int
+    end_line: int
+    symbol: str = ""  # e.g. "SearchIndex.query", "<script>", or "" for code between symbols
+
+# A top-level piece of a file before size limits are applied: (start line, end line, symbol).
+Piece = Tuple[int, int, str]
+
+def chunk_source(filepath: str, text: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Chunk]:
+    """Split a file's text into chunks on symbol boundaries, choosing the splitter by extension."""
+    lines = text.splitlines()
+    if not lines:
+        return []
+    if filepath.endswith(".py"):
+        pieces = _python_pieces(text, lines, max_chars)
+    elif filepath.endswith((".js", ".ts")):
+        pieces = _script_pieces(lines, 1, len(lines))
+    elif filepath.endswith(".css"):
+        pieces = _css_pieces(lines, 1, len(lines))
+    elif filepath.endswith((".svelte", ".html")):
+        pieces = _markup_pieces(lines)
+    else:
+        pieces = None
+    if pieces is None:
+        pieces = [(1, len(lines), "")]
+    return _build_chunks(lines, _fill_gaps(pieces, len(lines)), max_chars)
+
+def _build_chunks(lines: List[str], pieces: List[Piece], max_chars: int) -> List[Chunk]:
+    """
+    Merge neighbouring pieces with the same symbol (e.g. the code between two functions) while
+    they fit in max_chars, fold small filler pieces into a neighbour, split oversized pieces by
+    lines, and drop blank chunks and the blank lines at chunk edges.
+    """
+    merged: List[List] = []
+    for start, end, symbol in pieces:
+        last = merged[-1] if merged else None
+        if last is not None and last[2] == symbol and _size(lines, last[0], end) <= max_chars:
+            last[1] = end
+        else:
+            merged.append([start, end, symbol])
+    # Fold small filler pieces into the following piece, or the previous one at the end.
+    i = 0
+    while i < len(merged):
+        start, end, symbol = merged[i]
+        if _is_filler(symbol) and len(merged) > 1 and _size(lines, start, end) < MIN_FILLER_CHARS:
+            neighbour = merged[i + 1] if i + 1 < len(merged) else merged[i - 1]
+            if _size(lines, min(start, neighbour[0]), max(end, neighbour[1])) <= max_chars:
+                neighbour[0], neighbour[1] = min(start, neighbour[0]), max(end, neighbour[1])
+                del merged[i]
+                continue
+        i += 1
+    chunks = []
+    for start, end, symbol in merged:
+        chunks.extend(_split_lines(lines, start, end, symbol, max_chars))
+    return [_trim(chunk) for chunk in chunks if chunk.text.strip()]
+
+def _trim(chunk: Chunk) -> Chunk:
+    """Drop blank lines at either end of a (non-blank) chunk, adjusting its line range."""
+    chunk_lines = chunk.text.split("\n")
+    first = next(i for i, line in enumerate(chunk_lines) if line.strip())
+    last = max(i for i, line in enumerate(chunk_lines) if line.strip())
+    if first == 0 and last == len(chunk_lines) - 1:
+        return chunk
+    return Chunk("\n".join(chunk_lines[first:last + 1]), chunk.start_line + first, chunk.start_line + last, chunk.symbol)
+
+def _is_filler(symbol: str) -> bool:
+    return not symbol or symbol in ("<script>", "<style>")
+
+def _size(lines: List[str], start: int, end: int) -> int:
+    return sum(len(line) + 1 for line in lines[start - 1:end])
+
+def _split_lines(lines: List[str], start: int, end: int, symbol: str, max_chars: int) -> List[Chunk]:
+    """Return lines start..end as one chunk, or as consecutive chunks of at most max_chars (at least one line each)."""
+    chunks = []
+    chunk_start, size = start, 0
+    for lineno in range(start, end + 1):
+        length = len(lines[lineno - 1]) + 1
+        if size and size + length > max_chars:
+            chunks.append(Chunk("\n".join(lines[chunk_start - 1:lineno - 1]), chunk_start, lineno - 1, symbol))
+            chunk_start, size = lineno, 0
+        size += length
+    chunks.append(Chunk("\n".join(lines[chunk_start - 1:end]), chunk_start, end, symbol))
+    return chunks
+
+def _fill_gaps(pieces: List[Piece], n_lines: int) -> List[Piece]:
+    """Sort pieces and add unnamed pieces for the lines no piece covers."""
+    return _fill_range(pieces, 1, n_lines, "")
+
+def _fill_range(pieces: List[Piece], first: int, last: int, symbol: str) -> List[Piece]:
+    """Sort pieces within first..last and cover the remaining lines with pieces named symbol."""
+    filled = []
+    next_line = first
+    for start, end, name in sorted(pieces):
+        start = max(start, next_line)
+        if start > end:
+            continue
+        if start > next_line:
+            filled.append((next_line, start - 1, symbol))
+        filled.append((start, end, name))
+        next_line = end + 1
+    if next_line <= last:
+        filled.append((next_line, last, symbol))
+    return filled
+
+def _python_pieces(text: str, lines: List[str], max_chars: int) -> Optional[List[Piece]]:
+    """Top-level functions and classes from the AST; classes too large for one chunk are split by method."""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    pieces = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        if isinstance(node, ast.ClassDef) and _size(lines, start, node.end_lineno) > max_chars:
+            pieces.extend(_class_pieces(node, start))
+        else:
+            pieces.append((start, node.end_lineno, node.name))
+    return pieces
+
+def _class_pieces(node: ast.ClassDef, start: int) -> List[Piece]:
+    """One piece per method (named Class.method); the rest of the class body is named after the class."""
+    pieces = []
+    body_start = start
+    for item in node.body:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            item_start = min([item.lineno] + [d.lineno for d in item.decorator_list])
+            if item_start > body_start:
+                pieces.append((body_start, item_start - 1, node.name))
+            pieces.append((item_start, item.end_lineno, f"{node.name}.{item.name}"))
+            body_start = item.end_lineno + 1
+    if body_start <= node.end_lineno:
+        pieces.append((body_start, node.end_lineno, node.name))
+    return pieces
+
+# Top-level declarations that start a new symbol in JS/TS.
+_SCRIPT_DECLARATION_RE = re.compile(
+    r"^(?:export\s+(?:default\s+)?)?(?:declare\s+)?(?:abstract\s+)?"
+    r"(?:async\s+)?(?:function\s*\*?\s*(?P<function>[\w$]+)|class\s+(?P<class>[\w$]+)"
+    r"|(?:interface|type|enum)\s+(?P<type>[\w$]+)"
+    r"|(?:const|let|var)\s+(?P<variable>[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\(|[\w$]+\s*=>|class\b))"
+)
+
+def _script_pieces(lines: List[str], first: int, last: int) -> List[Piece]:
+    """
+    Split lines first..last of JS/TS at declarations that start at the block's indentation and
+    end where the braces they open are closed. Leading comments stay with the declaration.
+    """
+    indent = _common_indent(lines, first, last)
+    pieces = []
+    lineno = first
+    while lineno <= last:
+        line = lines[lineno - 1]
+        match = _SCRIPT_DECLARATION_RE.match(line[indent:]) if _indent(line) == indent else None
+        if match is None:
+            lineno += 1
+            continue
+        name = next(group for group in match.groups() if group)
+        end = _block_end(lines, lineno, last)
+        pieces.append((_comment_start(lines, lineno, first), end, name))
+        lineno = end + 1
+    return pieces
+
+def _css_pieces(lines: List[str], first: int, last: int) -> List[Piece]:
+    """Split lines first..last of CSS into top-level rules named after their selector."""
+    pieces = []
+    lineno = first
+    while lineno <= last:
+        stripped = lines[lineno - 1].strip()
+        if stripped and not stripped.startswith(("/*", "*", "}")) and "{" in stripped:
+            end = _block_end(lines, lineno, last)
+            pieces.append((_comment_start(lines, lineno, first), end, stripped.split("{")[0].strip()[:80]))
+            lineno = end + 1
+        else:
+            lineno += 1
+    return pieces
+
+_OPEN_BLOCK_RE = re.compile(r"<(script|style)\b[^>]*>", re.IGNORECASE)
+
+def _markup_pieces(lines: List[str]) -> List[Piece]:
+    """
+    Split Svelte/HTML into <script> and <style> blocks and the markup between them. Block
+    contents are further split into declarations or rules; the rest of a block is named after its tag.
+    """
+    pieces = []
+    lineno = 1
+    while lineno <= len(lines):
+        match = _OPEN_BLOCK_RE.search(lines[lineno - 1])
+        if match is None:
+            lineno += 1
+            continue
+        tag = match.group(1).lower()
+        close = re.compile(rf"</{tag}\s*>", re.IGNORECASE)
+        end = lineno
+        while end < len(lines) and not close.search(lines[end - 1]):
+            end += 1
+        inner = _script_pieces if tag == "script" else _css_pieces
+        body = inner(lines, lineno + 1, end - 1) if end - 1 > lineno else []
+        pieces.extend(_fill_range(body, lineno, end, f"<{tag}>"))
+        lineno = end + 1
+    return pieces
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+def _common_indent(lines: List[str], first: int, last: int) -> int:
+    indents = [_indent(line) for line in lines[first - 1:last] if line.strip()]
+    return min(indents) if indents else 0
+
+def _comment_start(lines: List[str], lineno: int, first: int) -> int:
+    """Return the first line of the comment block directly above lineno (or lineno itself)."""
+    start = lineno
+    while start > first and lines[start - 2].strip().startswith(("//", "/*", "*", "*/")):
+        start -= 1
+    return start
+
+def _block_end(lines: List[str], lineno: int, last: int) -> int:
+    """
+    Return the line where the braces opened from lineno are balanced again, or the end of a
+    statement that opens none. Braces in strings and comments are not special-cased; this is
+    a heuristic for reasonably formatted code.
+    """
+    depth = 0
+    opened = False
+    for end in range(lineno, last + 1):
+        line = lines[end - 1]
+        depth += line.count("{") - line.count("}")
+        opened = opened or "{" in line
+        if opened and depth <= 0:
+            return end
+        if not opened and line.rstrip().endswith(";"):
+            return end
+    return last
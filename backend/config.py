@@ -0,0 +1,19 @@
+"""Settings read from CODEPILOT_* environment variables."""
+import os
+
+# Values that turn a boolean setting off; anything else turns it on.
+_FALSE_VALUES = ("0", "false", "no", "off")
+
+def env_int(name: str, default: int, minimum: int = 0) -> int:
+    """Return the integer value of an environment variable, at least minimum, or default if it is unset or invalid."""
+    try:
+        return max(minimum, int(os.getenv(name, "")))
+    except ValueError:
+        return default
+
+def env_bool(name: str, default: bool) -> bool:
+    """Return False if an environment variable is 0, false, no or off, True for other values, or default if it is unset."""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    return value.lower() not in _FALSE_VALUES
@@ -0,0 +1,81 @@
+"""
+Unified-diff hunks between two versions of a file, each labelled with the symbol (function,
+class or method) it falls in, as found by the search chunker.
+"""
+import difflib
+from typing import List, NamedTuple
+
+from backend.chunking import Chunk, chunk_source
+
+class Hunk(NamedTuple):
+    """One hunk: 1-based start lines and line counts of both sides, its diff lines and enclosing symbol."""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str]  # prefixed with " ", "-" or "+"
+    symbol: str = ""
+
+    @property
+    def header(self) -> str:
+        header = f"@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@"
+        return f"{header} {self.symbol}" if self.symbol else header
+
+    @property
+    def added(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("+"))
+
+    @property
+    def removed(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("-"))
+
+    @property
+    def whitespace_only(self) -> bool:
+        """True if the hunk changes nothing but whitespace."""
+        removed = "".join("".join(line[1:].split()) for line in self.lines if line.startswith("-"))
+        added = "".join("".join(line[1:].split()) for line in self.lines if line.startswith("+"))
+        return removed == added
+
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+def diff_hunks(filename: str, original: str, updated: str, context_lines: int = 3) -> List[Hunk]:
+    """Return the hunks turning original into updated, with context_lines of context around changes."""
+    old_lines, new_lines = original.splitlines(), updated.splitlines()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    old_chunks = new_chunks = None
+    hunks = []
+    for group in matcher.get_grouped_opcodes(context_lines):
+        lines = []
+        changed_old = changed_new = None
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines.extend(" " + line for line in old_lines[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                lines.extend("-" + line for line in old_lines[i1:i2])
+                changed_old = i1 + 1 if changed_old is None else changed_old
+            if tag in ("replace", "insert"):
+                lines.extend("+" + line for line in new_lines[j1:j2])
+                changed_new = j1 + 1 if changed_new is None else changed_new
+        # Name the hunk after the symbol around its first change, in the new version if it adds lines.
+        if changed_new is not None:
+            new_chunks = new_chunks if new_chunks is not None else chunk_source(filename, updated)
+            symbol = _symbol_at(new_chunks, changed_new)
+        else:
+            old_chunks = old_chunks if old_chunks is not None else chunk_source(filename, original)
+            symbol = _symbol_at(old_chunks, changed_old)
+        first, last = group[0], group[-1]
+        old_count, new_count = last[2] - first[1], last[4] - first[3]
+        hunks.append(Hunk(
+            first[1] + 1 if old_count else first[1], old_count,
+            first[3] + 1 if new_count else first[3], new_count,
+            lines, symbol,
+        ))
+    return hunks
+
+def _symbol_at(chunks: List[Chunk], lineno: int) -> str:
+    for chunk in chunks:
+        if chunk.start_line <= lineno <= chunk.end_line:
+            return chunk.symbol
+    return ""
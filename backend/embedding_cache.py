@@ -0,0 +1,194 @@
+"""
+Content-addressed on-disk cache of embedding vectors, shared by every workspace.
+
+Vectors are keyed by the blake2b hash of the embedded text, in one directory per embedding
+model, so a chunk seen in any branch, worktree or repository is embedded only once. Each
+directory holds an append-only array of float16 vectors, read through a memory map, and an
+append-only file of the matching 16-byte keys. Keys are written after their vectors, so a key
+always refers to a complete row. Removing the directory simply empties the cache.
+"""
+import hashlib
+import os
+import re
+import struct
+import sys
+import threading
+import warnings
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only coordinated within the process
+    fcntl = None
+
+# Keys file header: magic bytes, format version and vector dimension.
+_KEYS_HEADER = struct.Struct("<4sII")
+_KEYS_MAGIC = b"CPEC"
+EMBEDDING_CACHE_VERSION = 1
+_KEY_BYTES = 16
+_DTYPE = np.float16
+
+def text_key(text: str) -> bytes:
+    """Return the cache key of a text: its 16-byte blake2b digest."""
+    return hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=_KEY_BYTES).digest()
+
+def embedding_model_id(embedding_function) -> str:
+    """Return a stable id of the model behind an embedding function, naming its cache directory."""
+    for attr in ("model_name", "MODEL_NAME"):
+        value = getattr(embedding_function, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    model_id = f"{type(embedding_function).__module__}.{type(embedding_function).__qualname__}"
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)  # chroma warns for functions without name()
+            name = embedding_function.name()
+    except Exception:
+        name = None
+    return f"{model_id}:{name}" if isinstance(name, str) else model_id
+
+class EmbeddingCache:
+    """
+    Embedding vectors of one model, keyed by text hash. embed() returns cached vectors and
+    calls the model only for texts it has never seen. Safe to share between threads; appends
+    from several processes are serialized with a file lock where available.
+    """
+
+    def __init__(self, directory: str, model_id: str):
+        self.model_id = model_id
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]+", "_", model_id))
+        os.makedirs(self.directory, exist_ok=True)
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self.vectors_path = os.path.join(self.directory, "vectors.f16")
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[bytes, int] = {}
+        self._keys_offset = 0  # bytes of the keys file already loaded
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _refresh(self):
+        """Load keys appended since the last refresh (possibly by another process). Holds self._lock."""
+        try:
+            size = os.path.getsize(self.keys_path)
+        except OSError:
+            return
+        if size <= self._keys_offset:
+            return
+        try:
+            with open(self.keys_path, "rb") as f:
+                if self.dim is None:
+                    magic, version, dim = _KEYS_HEADER.unpack(f.read(_KEYS_HEADER.size))
+                    if magic != _KEYS_MAGIC or version != EMBEDDING_CACHE_VERSION:
+                        return
+                    self.dim = dim
+                    self._keys_offset = _KEYS_HEADER.size
+                f.seek(self._keys_offset)
+                data = f.read(size - self._keys_offset)
+        except (OSError, struct.error) as e:
+            print(f"Ignoring unreadable embedding cache {self.keys_path}: {e}", file=sys.stderr)
+            return
+        data = data[:len(data) - len(data) % _KEY_BYTES]
+        # Rows follow file order; a key appended twice (by racing processes) keeps its first row.
+        row = (self._keys_offset - _KEYS_HEADER.size) // _KEY_BYTES
+        for i in range(0, len(data), _KEY_BYTES):
+            self._rows.setdefault(data[i:i + _KEY_BYTES], row)
+            row += 1
+        self._keys_offset += len(data)
+        self._vectors = None  # remapped with the new rows on the next read
+
+    def _mapped(self) -> Optional[np.memmap]:
+        if self._vectors is None and self._rows and self.dim:
+            rows = (self._keys_offset - _KEYS_HEADER.size) // _KEY_BYTES
+            self._vectors = np.memmap(self.vectors_path, dtype=_DTYPE, mode="r", shape=(rows, self.dim))
+        return self._vectors
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """Return the cached float32 vector of each key, or None where it is not cached."""
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            rows = [self._rows.get(key) for key in keys]
+            vectors = self._mapped() if any(row is not None for row in rows) else None
+            return [None if row is None else np.array(vectors[row], dtype=np.float32) for row in rows]
+
+    def put_many(self, keys: Sequence[bytes], vectors: Sequence) -> int:
+        """Append the vectors of keys that are not cached yet. Returns the number appended."""
+        array = np.asarray(vectors, dtype=np.float32)
+        if array.ndim != 2 or len(array) != len(keys):
+            return 0
+        with self._lock, open(self.keys_path, "ab") as keys_file:
+            if fcntl is not None:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = array.shape[1]
+                    keys_file.write(_KEYS_HEADER.pack(_KEYS_MAGIC, EMBEDDING_CACHE_VERSION, self.dim))
+                    self._keys_offset = _KEYS_HEADER.size
+                if array.shape[1] != self.dim:
+                    return 0
+                new = {}
+                for key, vector in zip(keys, array):
+                    if key not in self._rows and key not in new:
+                        new[key] = vector
+                if not new:
+                    return 0
+                n_rows = (self._keys_offset - _KEYS_HEADER.size) // _KEY_BYTES
+                with open(self.vectors_path, "ab") as vectors_file:
+                    # Drop vectors whose keys were never written (an interrupted append).
+                    vectors_file.truncate(n_rows * self.dim * np.dtype(_DTYPE).itemsize)
+                    vectors_file.write(np.asarray(list(new.values()), dtype=_DTYPE).tobytes())
+                    vectors_file.flush()
+                keys_file.write(b"".join(new))
+                keys_file.flush()
+                for key in new:
+                    self._rows[key] = n_rows
+                    n_rows += 1
+                self._keys_offset += len(new) * _KEY_BYTES
+                self._vectors = None
+                return len(new)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def embed(self, documents: Sequence[str], embed: Callable[[List[str]], Sequence]) -> List[np.ndarray]:
+        """Return a vector per document, calling embed only for the distinct texts that are not cached."""
+        keys = [text_key(document) for document in documents]
+        vectors = self.get_many(keys)
+        missing: Dict[bytes, int] = {}
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None and key not in missing:
+                missing[key] = i
+        with self._lock:
+            self.hits += len(documents) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            computed = [np.asarray(vector, dtype=np.float32) for vector in embed([documents[i] for i in missing.values()])]
+            try:
+                self.put_many(list(missing), computed)
+            except OSError as e:
+                print(f"Failed to write embedding cache {self.directory}: {e}", file=sys.stderr)
+            by_key = dict(zip(missing, computed))
+            vectors = [by_key[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return vectors
+
+_caches: Dict[Tuple[str, str], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(directory: str, model_id: str) -> EmbeddingCache:
+    """Return the process-wide EmbeddingCache of a model in directory, opening it once."""
+    path = os.path.abspath(directory)
+    with _caches_lock:
+        cache = _caches.get((path, model_id))
+        if cache is None:
+            cache = _caches[(path, model_id)] = EmbeddingCache(path, model_id)
+        return cache
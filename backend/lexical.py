@@ -0,0 +1,199 @@
+"""
+In-process lexical index over code chunks, for the identifier-like queries embeddings handle poorly.
+
+Chunks are tokenized into identifiers, each of which is indexed whole and split into its
+snake_case and camelCase words ("sendUsage" -> sendusage, send, usage), and ranked with BM25.
+A trigram index over the vocabulary expands query words that are not themselves indexed terms
+to the terms containing them, so "INDEX_CACHE" finds "_INDEX_CACHE_TTL".
+"""
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+# BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Most vocabulary terms a substring query word expands to.
+MAX_SUBSTRING_TERMS = 50
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]*|\d+")
+_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+def tokenize(text: str) -> List[str]:
+    """Return the lowercased terms of text: every identifier, followed by its words if it has several."""
+    terms = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        terms.append(identifier.lower())
+        words = _WORD_RE.findall(identifier)
+        if len(words) > 1:
+            terms.extend(word.lower() for word in words)
+    return terms
+
+def _trigrams(term: str) -> Set[str]:
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+class LexicalDocument(NamedTuple):
+    """An indexed chunk: where it comes from, its text and its length in terms."""
+    filepath: str
+    start_line: int
+    end_line: int
+    symbol: str
+    text: str
+    length: int
+
+class LexicalIndex:
+    """
+    BM25 inverted index of chunks keyed by chunk id.
+
+    Postings map each term to the term frequency per chunk. Chunks are added and removed per
+    file, mirroring the SearchIndex collection, so the index never has to be rebuilt.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, LexicalDocument] = {}
+        self._lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._file_chunks: Dict[str, List[str]] = defaultdict(list)
+        self._total_length = 0
+
+    def add(self, chunk_id: str, text: str, metadata: Dict):
+        """Index one chunk; metadata carries the chunk's filepath, symbol and line range."""
+        if chunk_id in self.documents:
+            self._remove_chunk(chunk_id)
+        terms = tokenize(text)
+        counts: Dict[str, int] = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        for term, count in counts.items():
+            postings = self.postings[term]
+            if not postings:
+                for trigram in _trigrams(term):
+                    self.trigrams[trigram].add(term)
+            postings[chunk_id] = count
+        filepath = metadata.get("filepath", chunk_id.split("::")[0])
+        self.documents[chunk_id] = LexicalDocument(
+            filepath, metadata.get("start_line", 1), metadata.get("end_line", text.count("\n") + 1),
+            metadata.get("symbol", ""), text, len(terms),
+        )
+        self._lengths[chunk_id] = len(terms)
+        self._file_chunks[filepath].append(chunk_id)
+        self._total_length += len(terms)
+
+    def remove_file(self, filepath: str):
+        """Forget every chunk of one file."""
+        for chunk_id in self._file_chunks.pop(filepath, ()):
+            self._remove_chunk(chunk_id)
+
+    def _remove_chunk(self, chunk_id: str):
+        document = self.documents.pop(chunk_id, None)
+        if document is None:
+            return
+        del self._lengths[chunk_id]
+        self._total_length -= document.length
+        for term in set(tokenize(document.text)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(chunk_id, None)
+            if not postings:
+                del self.postings[term]
+                for trigram in _trigrams(term):
+                    terms = self.trigrams.get(trigram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self.trigrams[trigram]
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _query_terms(self, query: str) -> Tuple[Dict[str, float], Set[str]]:
+        """
+        Map the query's terms to weights, and return the indexed terms matching a whole query
+        identifier (itself, or the terms containing it). Words that are not indexed terms are
+        expanded to the terms containing them (found through the trigram index), with their
+        weight split between them.
+        """
+        weights: Dict[str, float] = defaultdict(float)
+        expansions: Dict[str, List[str]] = {}
+        identifiers: Set[str] = set()
+        for identifier in _IDENTIFIER_RE.findall(query):
+            identifier = identifier.lower()
+            if identifier in self.postings:
+                identifiers.add(identifier)
+            else:
+                expansions[identifier] = self._substring_terms(identifier)
+                identifiers.update(expansions[identifier])
+        for term in tokenize(query):
+            if term in self.postings:
+                weights[term] += 1.0
+                continue
+            matches = expansions.get(term)
+            if matches is None:
+                matches = expansions[term] = self._substring_terms(term)
+            for match in matches:
+                weights[match] += 1.0 / len(matches)
+        return weights, identifiers
+
+    def _substring_terms(self, word: str) -> List[str]:
+        """Return up to MAX_SUBSTRING_TERMS indexed terms containing word (at least three characters)."""
+        grams = _trigrams(word)
+        if not grams:
+            return []
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.trigrams.get(g, ()))):
+            terms = self.trigrams.get(gram)
+            if not terms:
+                return []
+            candidates = set(terms) if candidates is None else candidates & terms
+            if not candidates:
+                return []
+        return sorted(term for term in candidates if word in term)[:MAX_SUBSTRING_TERMS]
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return up to n_results (chunk id, BM25 score) pairs for query, best first.
+
+        When some query identifiers match indexed terms, only the chunks containing one of those
+        terms are ranked: an identifier lookup then touches that identifier's few postings rather
+        than those of the common words it splits into.
+        """
+        n_documents = len(self.documents)
+        if not n_documents:
+            return []
+        average_length = self._total_length / n_documents or 1.0
+        weights, identifiers = self._query_terms(query)
+        candidates = None
+        if identifiers:
+            candidates = set()
+            for identifier in identifiers:
+                candidates.update(self.postings[identifier])
+        # BM25 term score: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        norm_base = BM25_K1 * (1 - BM25_B)
+        norm_per_term = BM25_K1 * BM25_B / average_length
+        lengths = self._lengths
+        scores: Dict[str, float] = defaultdict(float)
+        for term, weight in weights.items():
+            postings = self.postings.get(term, {})
+            idf = math.log(1 + (n_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            factor = weight * idf * (BM25_K1 + 1)
+            if candidates is None:
+                matches = postings.items()
+            elif len(candidates) < len(postings):
+                matches = [(chunk_id, postings[chunk_id]) for chunk_id in candidates if chunk_id in postings]
+            else:
+                matches = [(chunk_id, tf) for chunk_id, tf in postings.items() if chunk_id in candidates]
+            for chunk_id, tf in matches:
+                scores[chunk_id] += factor * tf / (tf + norm_base + norm_per_term * lengths[chunk_id])
+        return heapq.nsmallest(n_results, scores.items(), key=lambda item: (-item[1], item[0]))
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several rankings of ids into one: each id scores the sum of 1 / (k + rank) over the rankings."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
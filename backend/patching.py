@@ -0,0 +1,143 @@
+"""
+Deterministic application of CodeChunkUpdates to a file's text.
+
+A replacement looks for its old_code verbatim as whole lines (give or take indentation), then
+line by line ignoring indentation and runs of whitespace (and blank lines), re-indenting the new code to the matched location. An
+insertion places its new code after the line where anchor_context ends, found the same way.
+A match must be unique: an update whose old code or anchor is missing or occurs more than
+once is reported as not placed, for the caller to resolve otherwise.
+"""
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# How an update was placed.
+EXACT = "exact"
+FUZZY = "fuzzy"
+ANCHOR = "anchor"
+FUZZY_ANCHOR = "fuzzy-anchor"
+NEW_FILE = "new-file"
+
+class PatchResult(NamedTuple):
+    """The text after one update, how the update was placed, and why it was not if method is empty."""
+    code: str
+    method: str = ""
+    error: str = ""
+
+    @property
+    def applied(self) -> bool:
+        return bool(self.method)
+
+def apply_update(code: str, old_code: str, new_code: str, anchor_context: Optional[str] = None) -> PatchResult:
+    """Apply one replacement (old_code set) or insertion (old_code empty) to code."""
+    if old_code.strip():
+        return _replace(code, old_code, new_code)
+    if not code.strip():
+        return PatchResult(new_code, NEW_FILE)
+    if not anchor_context or not anchor_context.strip():
+        return PatchResult(code, error="insertion without anchor_context")
+    return _insert(code, new_code, anchor_context)
+
+def _replace(code: str, old_code: str, new_code: str) -> PatchResult:
+    starts = _exact_matches(code, old_code)
+    if len(starts) == 1:
+        start, end = starts[0], starts[0] + len(old_code)
+        line_start = code.rfind("\n", 0, start) + 1
+        if line_start < start and not old_code.startswith("\n"):
+            # old_code was given without the indentation of its first line: move new_code there.
+            old_indent = _indent(old_code)
+            lines = _reindent(new_code.split("\n"), old_indent, code[line_start:start] + old_indent)
+            return PatchResult(code[:line_start] + "\n".join(lines) + code[end:], EXACT)
+        return PatchResult(code[:start] + new_code + code[end:], EXACT)
+    if len(starts) > 1:
+        return PatchResult(code, error=f"old_code occurs {len(starts)} times")
+    lines = code.split("\n")
+    spans = find_lines(lines, old_code)
+    if len(spans) != 1:
+        return PatchResult(code, error=_not_unique("old_code", lines, spans))
+    start, end = spans[0]
+    old_indent = _indent(next(line for line in old_code.split("\n") if line.strip()))
+    replacement = _reindent(_strip_blank_edges(new_code), old_indent, _indent(lines[start]))
+    return PatchResult("\n".join(lines[:start] + replacement + lines[end + 1:]), FUZZY)
+
+def _insert(code: str, new_code: str, anchor_context: str) -> PatchResult:
+    lines = code.split("\n")
+    starts = _exact_matches(code, anchor_context)
+    if len(starts) == 1:
+        # The line holding the end of the anchor (an anchor ending with a newline ends before it).
+        end = code[:starts[0] + len(anchor_context.rstrip("\n"))].count("\n")
+        method = ANCHOR
+    elif len(starts) > 1:
+        return PatchResult(code, error=f"anchor_context occurs {len(starts)} times")
+    else:
+        spans = find_lines(lines, anchor_context)
+        if len(spans) != 1:
+            return PatchResult(code, error=_not_unique("anchor_context", lines, spans))
+        end = spans[0][1]
+        method = FUZZY_ANCHOR
+    return PatchResult("\n".join(lines[:end + 1] + _strip_blank_edges(new_code) + lines[end + 1:]), method)
+
+def _exact_matches(code: str, snippet: str) -> List[int]:
+    """
+    Return the offsets where snippet occurs verbatim in code with only indentation before it
+    and only whitespace after it on its first and last lines, so that "x = 1" does not match
+    inside "max = 10".
+    """
+    starts = []
+    start = code.find(snippet)
+    while start != -1:
+        end = start + len(snippet)
+        before = code[code.rfind("\n", 0, start) + 1:start]
+        after = code[end:code.find("\n", end) if "\n" in code[end:] else len(code)]
+        if (snippet.startswith("\n") or not before.strip()) and (snippet.endswith("\n") or not after.strip()):
+            starts.append(start)
+        start = code.find(snippet, start + 1)
+    return starts
+
+def find_lines(lines: Sequence[str], snippet: str) -> List[Tuple[int, int]]:
+    """
+    Return the (first, last) line indexes of every place where the non-blank lines of snippet
+    occur as consecutive non-blank lines of lines, comparing lines without indentation and
+    with runs of whitespace collapsed.
+    """
+    wanted = [_normalize(line) for line in snippet.split("\n") if line.strip()]
+    if not wanted:
+        return []
+    content = [(i, _normalize(line)) for i, line in enumerate(lines) if line.strip()]
+    spans = []
+    for k in range(len(content) - len(wanted) + 1):
+        if content[k][1] == wanted[0] and all(content[k + j][1] == wanted[j] for j in range(1, len(wanted))):
+            spans.append((content[k][0], content[k + len(wanted) - 1][0]))
+    return spans
+
+def _not_unique(what: str, lines: Sequence[str], spans: List[Tuple[int, int]]) -> str:
+    if not spans:
+        return f"{what} not found"
+    return f"{what} is ambiguous, it matches lines " + ", ".join(f"{start + 1}-{end + 1}" for start, end in spans)
+
+def _normalize(line: str) -> str:
+    return " ".join(line.split())
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+def _strip_blank_edges(code: str) -> List[str]:
+    """The lines of code without the blank lines at either end (none at all for blank code)."""
+    lines = code.split("\n")
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+def _reindent(lines: List[str], old_indent: str, new_indent: str) -> List[str]:
+    """Move lines written at old_indent to new_indent, keeping their relative indentation."""
+    if old_indent == new_indent:
+        return lines
+    moved = []
+    for line in lines:
+        if not line.strip():
+            moved.append(line)
+        elif line.startswith(old_indent):
+            moved.append(new_indent + line[len(old_indent):])
+        else:
+            moved.append(new_indent + line.lstrip())
+    return moved
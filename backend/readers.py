@@ -0,0 +1,111 @@
+"""
+Size-aware file readers shared by the repo map parsers, the search index and context building.
+
+Small files are read normally. Larger ones are accessed through mmap so that sniffing for
+binary or minified content and cutting a head at a line boundary never loads the whole file;
+callers get a truncated head (or a stub) instead of multi-megabyte bundles.
+"""
+import os
+import mmap
+from typing import Iterator, NamedTuple, Optional
+from backend.config import env_int
+
+# Bytes inspected to decide whether a file is binary or minified.
+SNIFF_BYTES = 8192
+# Files at least this large are accessed through mmap instead of being read.
+MMAP_MIN_BYTES = 1 << 20
+# A sample whose average line is longer than this is treated as minified or generated.
+MINIFIED_LINE_LENGTH = 500
+# Lines longer than this are cut when streaming stub lines.
+MAX_STUB_LINE_LENGTH = 200
+
+def max_context_bytes() -> int:
+    """Cap on the bytes of one file pasted into prompts, from CODEPILOT_MAX_CONTEXT_FILE_BYTES (0 disables it)."""
+    return env_int("CODEPILOT_MAX_CONTEXT_FILE_BYTES", 200_000)
+
+def max_parse_bytes() -> int:
+    """Cap on the bytes of one file handed to a parser, from CODEPILOT_MAX_PARSE_FILE_BYTES (0 disables it)."""
+    return env_int("CODEPILOT_MAX_PARSE_FILE_BYTES", 2_000_000)
+
+class FileText(NamedTuple):
+    """Text read from a file: the (possibly truncated) content and the file's full size in bytes."""
+    text: str
+    size: int
+    truncated: bool = False
+    binary: bool = False
+    minified: bool = False
+
+def is_binary(sample: bytes) -> bool:
+    """Return True if a leading sample of a file looks binary (NUL bytes or undecodable UTF-8)."""
+    if b"\0" in sample:
+        return True
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is not evidence of binary data.
+        return e.start < len(sample) - 3
+    return False
+
+def is_minified(sample: bytes) -> bool:
+    """Return True if a leading sample of a text file has the very long lines of minified or generated code."""
+    if len(sample) < MINIFIED_LINE_LENGTH:
+        return False
+    return len(sample) / (sample.count(b"\n") + 1) > MINIFIED_LINE_LENGTH
+
+def _head(data, max_bytes: Optional[int]):
+    """Return the first max_bytes of data (bytes or mmap), cut back to the last complete line."""
+    if not max_bytes or len(data) <= max_bytes:
+        return data[:], False
+    cut = data.rfind(b"\n", 0, max_bytes)
+    return data[:cut + 1 if cut >= 0 else max_bytes], True
+
+def read_text(filepath: str, max_bytes: Optional[int] = None) -> Optional[FileText]:
+    """
+    Read a text file, keeping at most max_bytes (cut at a line boundary). Files of
+    MMAP_MIN_BYTES or more are mapped rather than read, so only the kept head is copied.
+    Binary files return an empty text with binary=True. Returns None if the file cannot be read.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_MIN_BYTES:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    sample = mm[:SNIFF_BYTES]
+                    if is_binary(sample):
+                        return FileText("", size, binary=True)
+                    data, truncated = _head(mm, max_bytes)
+            else:
+                data = f.read()
+                sample = data[:SNIFF_BYTES]
+                if is_binary(sample):
+                    return FileText("", size, binary=True)
+                data, truncated = _head(data, max_bytes)
+    except (OSError, ValueError):
+        return None
+    return FileText(data.decode("utf-8", errors="replace"), size, truncated, minified=is_minified(sample))
+
+def iter_lines(filepath: str, max_lines: Optional[int] = None, max_line_length: Optional[int] = None) -> Iterator[str]:
+    """
+    Stream the lines of a text file without their line endings, stopping after max_lines.
+    Lines are read in bounded pieces, so a single huge line (minified code) is never held
+    whole: with max_line_length the rest of a long line is skipped.
+    Raises OSError if the file cannot be opened.
+    """
+    with open(filepath, "r", encoding="utf-8", errors="replace", newline=None) as f:
+        count = 0
+        while max_lines is None or count < max_lines:
+            line = f.readline(max_line_length or -1)
+            if not line:
+                return
+            if max_line_length and not line.endswith("\n"):
+                # Skip the remainder of an overlong line.
+                while True:
+                    rest = f.readline(1 << 16)
+                    if not rest or rest.endswith("\n"):
+                        break
+            count += 1
+            yield line.rstrip("\r\n")
+
+def truncation_notice(text: FileText) -> str:
+    """Return the marker appended to truncated content shown to the model."""
+    return f"\n... [truncated: showing {len(text.text.encode('utf-8'))} of {text.size} bytes]"
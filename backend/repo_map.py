@@ -2,11 +2,75 @@
 import os
 import sys
 import ast
-from typing import Any, List, Dict, Set
-import tiktoken
-from bs4 import BeautifulSoup
-import fnmatch
+from typing import Any, List, Dict
 import re
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+if __package__ in (None, ""):
+    # Allow running as `python backend/repo_map.py` from the project root.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.cache import RepoMapCache
+from backend.readers import MAX_STUB_LINE_LENGTH, iter_lines, max_parse_bytes, read_text
+from backend.repo_records import (
+    AssetFileRecord, AttributeRecord, ClassRecord, FunctionRecord, HtmlFileRecord, ParamRecord,
+    PythonFileRecord, SvelteFileRecord, intern, intern_all,
+)
+from backend.workspace import Workspace
+from backend.repo_rank import ImportGraph, focus_seeds, symbol_score
+from backend.symbols import SymbolIndex, build_symbol_index
+from backend.config import env_int
+from backend.tokens import count_tokens, encoding_name_for_model
+
+SUPPORTED_EXTENSIONS = (".py", ".html", ".svelte", ".js", ".css")
+# Below this many files to parse, process pool startup costs more than it saves.
+PARALLEL_MIN_FILES = 200
+
+def get_parse_workers() -> int:
+    """Return the number of parser processes, from CODEPILOT_PARSE_WORKERS or the CPU count."""
+    return env_int("CODEPILOT_PARSE_WORKERS", os.cpu_count() or 1, minimum=1)
+
+# Tokens reserved for the "# ... N more symbols omitted" line of a partially included file.
+OMISSION_LINE_TOKENS = 12
+# Parameter defaults longer than this are shown as "..." in stubs.
+MAX_DEFAULT_LENGTH = 40
+# How many omitted files are listed by name at the end of a budgeted stub.
+MAX_LISTED_OMISSIONS = 20
+
+def _synchronized(method):
+    """Run a RepoMap method under the map's lock, so a watcher thread can refresh it safely."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+@dataclass
+class StubReport:
+    """What a token-budgeted stub included and left out."""
+    max_tokens: int
+    tokens: int = 0
+    included_files: List[str] = field(default_factory=list)
+    omitted_files: List[str] = field(default_factory=list)
+    omitted_symbols: List[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        """Return the comment appended to the stub, or "" if nothing was omitted."""
+        if not self.omitted_files and not self.omitted_symbols:
+            return ""
+        lines = [
+            f"# Omitted to fit the token budget: {len(self.omitted_files)} files, "
+            f"{len(self.omitted_symbols)} symbols. Use the read_file or search tools to inspect them."
+        ]
+        for filepath in self.omitted_files[:MAX_LISTED_OMISSIONS]:
+            lines.append(f"#   {filepath}")
+        if len(self.omitted_files) > MAX_LISTED_OMISSIONS:
+            lines.append(f"#   ... and {len(self.omitted_files) - MAX_LISTED_OMISSIONS} more files")
+        return "\n".join(lines)
 
 def unparse_annotation(annotation):
     """
@@ -19,67 +83,77 @@ def unparse_annotation(annotation):
 
 def format_parameters(parameters):
     """
-    Format a list of parameter dicts into a Python parameter list string.
-    Each parameter is output as: name: type.
-    If no type is available, "Any" is used.
+    Format a sequence of ParamRecords into a Python parameter list string.
+    Each parameter is output as: name: type, followed by " = default" when it has one.
+    If no type is available, "Any" is used. The "/" and "*" markers are inserted
+    for positional-only and keyword-only parameters.
     """
     params = []
+    previous_kind = None
     for param in parameters:
-        ptype = param.get("type") or "Any"
-        params.append(f"{param['name']}: {ptype}")
+        if previous_kind == "posonly" and param.kind != "posonly":
+            params.append("/")
+        if param.kind == "kwonly" and previous_kind not in ("kwonly", "vararg"):
+            params.append("*")
+        text = f"{param.name}: {param.type or 'Any'}"
+        if param.default is not None:
+            text += f" = {param.default}"
+        params.append(text)
+        previous_kind = param.kind
+    if previous_kind == "posonly":
+        params.append("/")
     return ", ".join(params)
 
 def format_function(func):
     """
-    Return a Python stub-like function declaration.
+    Return a Python stub-like function declaration, preceded by its decorators.
     Example:
-        async def foo(a: int, b: Any) -> str: ...
+        @staticmethod
+        async def foo(a: int, b: Any = None) -> str: ...
     """
-    async_keyword = "async " if func.get("async") else ""
-    ret = func.get("return") or "Any"
-    param_str = format_parameters(func.get("parameters", []))
-    return f"{async_keyword}def {func['name']}({param_str}) -> {ret}: ..."
+    lines = [f"@{decorator}" for decorator in func.decorators]
+    async_keyword = "async " if func.is_async else ""
+    lines.append(f"{async_keyword}def {func.name}({format_parameters(func.parameters)}) -> {func.returns or 'Any'}: ...")
+    return "\n".join(lines)
 
 def format_class(cls):
     """
-    Return a Python stub-like class declaration.
-    Attributes and methods are indented inside the class.
+    Return a Python stub-like class declaration, preceded by its decorators.
+    Attributes, nested classes and methods are indented inside the class.
     """
-    lines = []
-    lines.append(f"class {cls['name']}:")
+    lines = [f"@{decorator}" for decorator in cls.decorators]
+    lines.append(f"class {cls.name}({', '.join(cls.bases)}):" if cls.bases else f"class {cls.name}:")
     # Attributes
-    if cls.get("attributes"):
-        for attr in cls["attributes"]:
-            atype = attr.get("type") or "Any"
-            lines.append(f"    {attr['name']}: {atype}")
+    for attr in cls.attributes:
+        lines.append(f"    {attr.name}: {attr.type or 'Any'}")
+    # Nested classes
+    for nested in cls.classes:
+        lines.extend("    " + line for line in format_class(nested).split("\n"))
     # Methods
-    if cls.get("methods"):
-        for meth in cls["methods"]:
-            lines.append("    " + format_function(meth))
+    for meth in cls.methods:
+        lines.extend("    " + line for line in format_function(meth).split("\n"))
     # If there is nothing inside, put an ellipsis.
-    if not cls.get("attributes") and not cls.get("methods"):
+    if not cls.attributes and not cls.methods and not cls.classes:
         lines.append("    ...")
     return "\n".join(lines)
 
-def parse_asset_file(filepath: str) -> Dict[str, Any]:
+def parse_asset_file(filepath: str) -> AssetFileRecord:
     """
     Read a .js or .css file and return a stub representation.
     This stub includes a header comment with the filename and up to ten non-empty lines of content.
+    Lines are streamed and reading stops at the tenth; overlong (minified) lines are cut.
     """
+    snippet = []
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+        for line in iter_lines(filepath, max_line_length=MAX_STUB_LINE_LENGTH):
+            clean_line = line.strip()
+            if (clean_line):
+                snippet.append(clean_line)
+            if len(snippet) >= 10:
+                break
     except Exception as e:
         print(f"Error reading asset file {filepath}: {e}", file=sys.stderr)
-        return {"stub": f"/* Error reading file: {filepath} */"}
-    
-    snippet = []
-    for line in lines:
-        clean_line = line.strip()
-        if (clean_line):
-            snippet.append(clean_line)
-        if len(snippet) >= 10:
-            break
+        return AssetFileRecord(f"/* Error reading file: {filepath} */")
 
     base = os.path.basename(filepath)
     if filepath.endswith(".js"):
@@ -88,261 +162,372 @@ def parse_asset_file(filepath: str) -> Dict[str, Any]:
         header = f"/* CSS File: {base} */"
     else:
         header = f"/* Asset File: {base} */"
-    return {"stub": header + "\n" + "\n".join(snippet)}
+    return AssetFileRecord(header + "\n" + "\n".join(snippet))
 
-def add_parent_info(node, parent=None):
+def get_imported_names(node) -> List[str]:
     """
-    Recursively add a parent attribute to every node in the AST.
+    Return the dotted names referenced by an ast.Import or ast.ImportFrom node.
+    For `from pkg import name` both "pkg" and "pkg.name" are returned, since name may be
+    a submodule or an object defined in pkg. Relative imports keep their leading dots.
     """
-    node.parent = parent
-    for child in ast.iter_child_nodes(node):
-        add_parent_info(child, node)
-
-def parse_gitignore(gitignore_path: str) -> Set[str]:
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    module = "." * node.level + (node.module or "")
+    names = [module] if node.module else []
+    sep = "" if module.endswith(".") else "."
+    names.extend(f"{module}{sep}{alias.name}" for alias in node.names if alias.name != "*")
+    return names
+
+def format_default(node) -> str:
+    """Return the source of a parameter default, or "..." if it is long or cannot be unparsed."""
+    text = unparse_annotation(node)
+    if text is None or len(text) > MAX_DEFAULT_LENGTH:
+        return "..."
+    return text
+
+def get_function_signature(node) -> FunctionRecord:
     """
-    Parse a .gitignore file and return a set of patterns.
+    Given an ast.FunctionDef or ast.AsyncFunctionDef node, return a FunctionRecord with its
+    parameters (name, kind, type and default), return annotation, async flag, decorators
+    and line span (decorators included).
     """
-    patterns = set()
-    if os.path.exists(gitignore_path):
-        with open(gitignore_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                # Skip empty lines and comments
-                if line and not line.startswith('#'):
-                    # Don't add bare * pattern as it's too broad
-                    if line != '*':
-                        patterns.add(line)
-    return patterns
-
-def should_ignore(path: str, root_dir: str, gitignore_patterns: Set[str]) -> bool:
+    args = node.args
+    params = []
+    positional = args.posonlyargs + args.args
+    # Defaults belong to the last len(defaults) positional parameters.
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    for i, (arg, default) in enumerate(zip(positional, defaults)):
+        params.append(_parameter(arg.arg, "posonly" if i < len(args.posonlyargs) else "arg", arg.annotation, default))
+    if args.vararg:
+        params.append(_parameter("*" + args.vararg.arg, "vararg", args.vararg.annotation))
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        params.append(_parameter(arg.arg, "kwonly", arg.annotation, default))
+    if args.kwarg:
+        params.append(_parameter("**" + args.kwarg.arg, "kwarg", args.kwarg.annotation))
+    return FunctionRecord(
+        name=intern(node.name),
+        parameters=tuple(params),
+        returns=intern(unparse_annotation(node.returns)) if node.returns else None,
+        is_async=isinstance(node, ast.AsyncFunctionDef),
+        decorators=intern_all(unparse_annotation(d) for d in node.decorator_list),
+        lineno=_start_line(node),
+        end_lineno=node.end_lineno,
+    )
+
+def _parameter(name, kind, annotation=None, default=None) -> ParamRecord:
+    return ParamRecord(
+        name=intern(name),
+        kind=kind,
+        type=intern(unparse_annotation(annotation)) if annotation else None,
+        default=intern(format_default(default)) if default is not None else None,
+    )
+
+def _start_line(node) -> int:
+    """Return the first line of a definition, including its decorators."""
+    return min([node.lineno] + [d.lineno for d in node.decorator_list])
+
+def extract_python_symbols(tree: ast.Module) -> PythonFileRecord:
     """
-    Check if a path should be ignored based on gitignore patterns.
+    Collect the imports, top-level functions and classes (with nested classes) of a module in a
+    single pass. Only module and class bodies are visited, together with the blocks of if/try/with
+    statements at those levels; function bodies and expressions are never descended into, so large
+    or deeply nested generated code costs little and cannot hit the recursion limit.
     """
-    if not gitignore_patterns:
-        return False
-
-    # Get relative path from root directory
-    rel_path = os.path.relpath(path, root_dir)
-    
-    # Convert path to forward slashes for consistency
-    rel_path = rel_path.replace(os.sep, '/')
-    
-    for pattern in gitignore_patterns:
-        # Handle pattern variations
-        if pattern.endswith('/'):
-            # Directory pattern
-            if fnmatch.fnmatch(rel_path + '/', pattern) or \
-               fnmatch.fnmatch(rel_path + '/*', pattern):
-                return True
-        else:
-            # File pattern
-            if fnmatch.fnmatch(rel_path, pattern):
-                return True
-            # Handle patterns without leading slash
-            if '/' not in pattern and fnmatch.fnmatch(os.path.basename(rel_path), pattern):
-                return True
-    
-    return False
-
-def parse_svelte_file(filepath: str) -> Dict[str, Any]:
+    imports, functions, classes = [], [], []
+    _collect_body(tree.body, imports, functions, classes, None)
+    return PythonFileRecord(tuple(functions), tuple(classes), intern_all(imports))
+
+def _collect_body(body, imports, functions, classes, attributes):
     """
-    Parse a Svelte file and return a dict with:
-      - "components": imported components
-      - "scripts": script block contents
-      - "styles": style block contents
-      - "props": component props
+    Append the definitions in a module or class body to the given lists; attributes is None
+    for module bodies. Imports from every level go to imports.
     """
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            content = f.read()
-    except Exception as e:
-        print(f"Skipping {filepath}: {e}", file=sys.stderr)
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.extend(get_imported_names(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append(get_function_signature(node))
+        elif isinstance(node, ast.ClassDef):
+            classes.append(_class_record(node, imports))
+        elif attributes is not None and isinstance(node, ast.AnnAssign):
+            if isinstance(node.target, ast.Name):
+                attr_type = unparse_annotation(node.annotation) if node.annotation else None
+                attributes.append(AttributeRecord(intern(node.target.id), intern(attr_type), node.lineno))
+        elif attributes is not None and isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    attr_type = getattr(node, "type_comment", None)
+                    attributes.append(AttributeRecord(intern(target.id), intern(attr_type), node.lineno))
+        elif isinstance(node, _BLOCK_STATEMENTS):
+            for block in _statement_blocks(node):
+                _collect_body(block, imports, functions, classes, attributes)
+
+def _class_record(node: ast.ClassDef, imports) -> ClassRecord:
+    methods, nested, attributes = [], [], []
+    _collect_body(node.body, imports, methods, nested, attributes)
+    return ClassRecord(
+        name=intern(node.name),
+        bases=intern_all(_class_bases(node)),
+        decorators=intern_all(unparse_annotation(d) for d in node.decorator_list),
+        methods=tuple(methods),
+        attributes=tuple(attributes),
+        classes=tuple(nested),
+        lineno=_start_line(node),
+        end_lineno=node.end_lineno,
+    )
+
+def _class_bases(node: ast.ClassDef) -> List[str]:
+    """Return the base classes and class keywords (e.g. metaclass=ABCMeta) of a class definition."""
+    bases = [unparse_annotation(base) for base in node.bases]
+    for keyword in node.keywords:
+        value = unparse_annotation(keyword.value)
+        bases.append(f"{keyword.arg}={value}" if keyword.arg else f"**{value}")
+    return bases
+
+# Statements whose blocks still belong to the enclosing module or class body.
+_BLOCK_STATEMENTS = tuple(
+    t for t in (ast.If, ast.Try, getattr(ast, "TryStar", None), ast.With, ast.AsyncWith) if t is not None
+)
+
+def _statement_blocks(node):
+    """Return the statement lists nested in an if/try/with statement."""
+    if isinstance(node, (ast.With, ast.AsyncWith)):
+        return [node.body]
+    if isinstance(node, ast.If):
+        return [node.body, node.orelse]
+    return [node.body] + [handler.body for handler in node.handlers] + [node.orelse, node.finalbody]
+
+def parse_svelte_file(filepath: str) -> SvelteFileRecord:
+    """
+    Parse a Svelte file and return a SvelteFileRecord with its imported components,
+    its props, and whether it has script and style blocks.
+    """
+    text = read_text(filepath, max_parse_bytes())
+    if text is None or text.binary:
+        print(f"Skipping {filepath}: unreadable or binary", file=sys.stderr)
         return None
-
-    svelte_info = {
-        "components": [],
-        "props": [],
-        "hasScript": False,  
-        "hasStyle": False
-    }
+    content = text.text
 
     # Extract imported components
+    components = []
     import_pattern = r'import\s+(?:\{[^}]+\}|[\w\d]+)\s+from\s+[\'"]([^\'"]+)[\'"]'
     for match in re.finditer(import_pattern, content):
         if match.group(1).endswith('.svelte'):
-            svelte_info["components"].append(match.group(1))
+            components.append(match.group(1))
 
     # Check for script and extract props
-    if '<script' in content:
-        svelte_info["hasScript"] = True
+    props = []
+    has_script = '<script' in content
+    if has_script:
         # Look for export let statements to find props
         prop_pattern = r'export\s+let\s+(\w+)(?:\s*=\s*[^;]+)?;'
         props = re.findall(prop_pattern, content)
-        svelte_info["props"].extend(props)
-
-    # Check for style block
-    if '<style' in content:
-        svelte_info["hasStyle"] = True
 
-    return svelte_info
+    return SvelteFileRecord(
+        components=intern_all(components),
+        props=intern_all(props),
+        has_script=has_script,
+        has_style='<style' in content,
+    )
 
 class RepoMap:
-    def __init__(self, root_dir="."):
+    def __init__(self, root_dir=".", use_cache=True, cache_dir=None, workers=None, parallel_threshold=PARALLEL_MIN_FILES, model_name=None):
         self.root_dir = os.path.abspath(root_dir)
         self.repo_map = {}
-        self.gitignore_patterns = set()
-        self._load_gitignore_patterns()
-        print(f"Loaded gitignore patterns: {self.gitignore_patterns}")  # Debug line
-
-    def _load_gitignore_patterns(self):
+        self.workspace = Workspace(self.root_dir)
+        self.cache = RepoMapCache(self.root_dir, cache_dir) if use_cache else None
+        self.workers = workers or get_parse_workers()
+        self.parallel_threshold = parallel_threshold
+        # Tokenizer used for stub budgets and counts; follows the model the stub is sent to.
+        self.encoding_name = encoding_name_for_model(model_name)
+        self.last_stub_report = None
+        # Memoized rendering per file entry, invalidated only when that entry changes.
+        self._fragments = {}
+        self._fragment_tokens = {}
+        self._symbol_tokens = {}
+        self._full_stub = None
+        # Symbol table, built on first use and then updated only for the files that changed.
+        self._symbols = None
+        self._symbols_dirty = set()
+        self._lock = threading.RLock()
+
+    @_synchronized
+    def build_map(self):
         """
-        Load all .gitignore patterns from the root directory and its subdirectories.
+        Enumerate the workspace under self.root_dir, parse every .py, .html, .js, .css and .svelte file,
+        and build the repository map with extracted functions, classes, HTML structures, or asset stubs.
+        Excludes files and directories that match .gitignore rules (via git ls-files inside a git repo).
+        Files whose cached entry is still valid are not re-parsed; the rest are parsed in a
+        process pool when there are at least parallel_threshold of them.
         """
-        for dirpath, _, filenames in os.walk(self.root_dir):
-            if '.gitignore' in filenames:
-                gitignore_path = os.path.join(dirpath, '.gitignore')
-                self.gitignore_patterns.update(parse_gitignore(gitignore_path))
+        records = list(self.workspace.iter_files(SUPPORTED_EXTENSIONS))
+        new_map = {rel_path: parsed for rel_path, parsed in self._load_entries(records) if parsed is not None}
+        for rel_path in self.repo_map.keys() - new_map.keys():
+            self._invalidate(rel_path)
+        for rel_path, parsed in new_map.items():
+            if self.repo_map.get(rel_path) is not parsed:
+                self._invalidate(rel_path)
+        self.repo_map = new_map
+        if self.cache is not None:
+            self.cache.prune(self.repo_map.keys())
+            self.cache.save()
+        return self.repo_map
 
-    def build_map(self):
+    @_synchronized
+    def refresh(self, paths):
         """
-        Walk the directory tree starting at self.root_dir, parse every .py, .html, .js, .css and .svelte file,
-        and build the repository map with extracted functions, classes, HTML structures, or asset stubs.
-        Excludes files and directories that match patterns in .gitignore files.
+        Update the repo_map entries for the given paths in place.
+        Paths may be absolute or relative to the root directory. Files that were deleted,
+        are ignored or are not a supported type are removed from the map.
         """
-        for dirpath, dirnames, filenames in os.walk(self.root_dir):
-            # Remove ignored directories from dirnames (in-place)
-            for d in dirnames[:]:
-                full_path = os.path.join(dirpath, d)
-                if should_ignore(full_path, self.root_dir, self.gitignore_patterns):
-                    dirnames.remove(d)
-            
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                # Skip files that match gitignore patterns
-                if should_ignore(filepath, self.root_dir, self.gitignore_patterns):
-                    continue
-                    
-                rel_path = os.path.relpath(filepath, self.root_dir)
-                if filename.endswith(".py"):
-                    parsed = self.parse_python_file(filepath)
-                    if parsed is not None:
-                        self.repo_map[rel_path] = parsed
-                elif filename.endswith(".html"):
-                    parsed = self.parse_html_file(filepath)
-                    if parsed is not None:
-                        self.repo_map[rel_path] = parsed
-                elif filename.endswith(".svelte"):
-                    parsed = parse_svelte_file(filepath)
-                    if parsed is not None:
-                        self.repo_map[rel_path] = parsed
-                elif filename.endswith(".js") or filename.endswith(".css"):
-                    asset_stub = parse_asset_file(filepath)
-                    self.repo_map[rel_path] = asset_stub
+        records = []
+        filepaths = [os.path.abspath(path if os.path.isabs(path) else os.path.join(self.root_dir, path)) for path in paths]
+        ignored = self.workspace.is_ignored_many(filepaths)
+        for filepath in filepaths:
+            rel_path = os.path.relpath(filepath, self.root_dir)
+            if rel_path.startswith(os.pardir):
+                continue
+            if self.cache is not None:
+                # The caller knows the file changed; don't trust a coarse mtime.
+                self.cache.discard(rel_path)
+            record = self.workspace.stat_file(filepath) if filepath.endswith(SUPPORTED_EXTENSIONS) else None
+            if record is not None and filepath not in ignored:
+                records.append(record)
+            else:
+                self._set_entry(rel_path, None)
+
+        for rel_path, parsed in self._load_entries(records):
+            self._set_entry(rel_path, parsed)
+        if self.cache is not None:
+            self.cache.save()
         return self.repo_map
 
-    @staticmethod
-    def get_function_signature(node):
+    def _set_entry(self, rel_path, info):
+        """Set (or, with None, remove) one repo_map entry, invalidating its memoized rendering."""
+        if info is None:
+            if rel_path in self.repo_map:
+                del self.repo_map[rel_path]
+                self._invalidate(rel_path)
+        elif self.repo_map.get(rel_path) is not info:
+            self.repo_map[rel_path] = info
+            self._invalidate(rel_path)
+
+    def _invalidate(self, rel_path):
+        """Forget the memoized fragment and token counts of one file."""
+        self._fragments.pop(rel_path, None)
+        self._fragment_tokens.pop(rel_path, None)
+        self._symbol_tokens.pop(rel_path, None)
+        self._full_stub = None
+        self._symbols_dirty.add(rel_path)
+
+    @_synchronized
+    def symbol_index(self) -> SymbolIndex:
+        """Return the cross-file symbol index of the map, bringing it up to date with changed entries."""
+        if self._symbols is None:
+            self._symbols = build_symbol_index(self.repo_map)
+        elif self._symbols_dirty:
+            build_symbol_index(self.repo_map, self._symbols_dirty, self._symbols)
+        self._symbols_dirty.clear()
+        return self._symbols
+
+    def _load_entries(self, records):
         """
-        Given an ast.FunctionDef or ast.AsyncFunctionDef node, return a dict with:
-          - "name": function name.
-          - "parameters": list of parameters (each with "name" and optional "type").
-          - "return": return annotation if available.
-          - "async": True if the function is asynchronous.
+        Return [(rel_path, parsed)] for the given WorkspaceFile records, in the same order.
+        Entries are served from the cache when their (mtime, size, hash) still match; cache
+        misses are parsed serially or, for large batches, across a process pool.
         """
-        params = []
-        for arg in node.args.args:
-            param = {"name": arg.arg}
-            if arg.annotation:
-                param["type"] = unparse_annotation(arg.annotation)
-            params.append(param)
-        if node.args.vararg:
-            vararg = {"name": "*" + node.args.vararg.arg}
-            if node.args.vararg.annotation:
-                vararg["type"] = unparse_annotation(node.args.vararg.annotation)
-            params.append(vararg)
-        for arg in node.args.kwonlyargs:
-            param = {"name": arg.arg}
-            if arg.annotation:
-                param["type"] = unparse_annotation(arg.annotation)
-            params.append(param)
-        if node.args.kwarg:
-            kwarg = {"name": "**" + node.args.kwarg.arg}
-            if node.args.kwarg.annotation:
-                kwarg["type"] = unparse_annotation(node.args.kwarg.annotation)
-            params.append(kwarg)
-        func_info = {"name": node.name, "parameters": params}
-        if node.returns:
-            func_info["return"] = unparse_annotation(node.returns)
-        return func_info
-
-    def parse_python_file(self, filepath):
+        results = [None] * len(records)
+        pending = []
+        for i, record in enumerate(records):
+            if self.cache is not None:
+                results[i] = self.cache.get(record.rel_path, record.path, record.stat)
+            if results[i] is None:
+                pending.append(i)
+
+        parsed = None
+        if self.workers > 1 and len(pending) >= self.parallel_threshold:
+            parsed = self._parse_parallel([records[i].path for i in pending])
+        if parsed is None:
+            parsed = [self.parse_file(records[i].path) for i in pending]
+
+        for i, info in zip(pending, parsed):
+            results[i] = info
+            if info is not None and self.cache is not None:
+                self.cache.put(records[i].rel_path, records[i].path, records[i].stat, info)
+        return [(record.rel_path, info) for record, info in zip(records, results)]
+
+    def _parse_parallel(self, filepaths):
         """
-        Parse a Python file and return a dict with keys:
-          - "functions": list of functions (only top-level functions, not methods) with signature details.
-          - "classes": list of classes, each with:
-              • "name": class name,
-              • "methods": list of method signatures,
-              • "attributes": list of attributes.
+        Parse files across a process pool. Results keep the order of filepaths.
+        Returns None if the pool cannot be used so the caller can fall back to serial parsing.
         """
+        workers = min(self.workers, len(filepaths))
+        chunksize = max(1, len(filepaths) // (workers * 4))
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                source = f.read()
+            # Spawned, not forked: the server calls this from a worker thread while other threads
+            # (watchers, warmup, chromadb) may hold locks that a forked child would inherit.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                return list(executor.map(_parse_file_worker, filepaths, chunksize=chunksize))
         except Exception as e:
-            print(f"Skipping {filepath}: {e}", file=sys.stderr)
+            print(f"Parallel parsing failed, falling back to serial: {e}", file=sys.stderr)
             return None
 
+    def parse_file(self, filepath):
+        """
+        Parse a single file with the parser matching its extension.
+        Returns None for unsupported or unparseable files.
+        """
+        if filepath.endswith(".py"):
+            return self.parse_python_file(filepath)
+        elif filepath.endswith(".html"):
+            return self.parse_html_file(filepath)
+        elif filepath.endswith(".svelte"):
+            return parse_svelte_file(filepath)
+        elif filepath.endswith(".js") or filepath.endswith(".css"):
+            return parse_asset_file(filepath)
+        return None
+
+    get_function_signature = staticmethod(get_function_signature)
+
+    def parse_python_file(self, filepath) -> PythonFileRecord:
+        """
+        Parse a Python file and return a PythonFileRecord with:
+          - functions: top-level functions (not methods) with signature details and line spans.
+          - classes: classes with bases, decorators, line span, methods, attributes and nested classes.
+          - imports: dotted names of imported modules and objects (relative imports keep their leading dots).
+        Files larger than max_parse_bytes() are listed without symbols instead of being parsed.
+        """
+        text = read_text(filepath, max_parse_bytes())
+        if text is None or text.binary:
+            print(f"Skipping {filepath}: unreadable or binary", file=sys.stderr)
+            return None
+        if text.truncated:
+            print(f"Not parsing {filepath}: {text.size} bytes exceeds the parse limit", file=sys.stderr)
+            return PythonFileRecord()
+        source = text.text
+
         try:
             tree = ast.parse(source, filename=filepath)
-            add_parent_info(tree)  # add parent pointers to all nodes
         except Exception as e:
             print(f"Failed to parse {filepath}: {e}", file=sys.stderr)
             return None
 
-        file_info = {"functions": [], "classes": []}
-
-        # Collect only top-level functions (skip those defined within a class)
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                if isinstance(getattr(node, "parent", None), ast.ClassDef):
-                    continue
-                is_async = isinstance(node, ast.AsyncFunctionDef)
-                func_info = self.get_function_signature(node)
-                func_info["async"] = is_async
-                file_info["functions"].append(func_info)
-
-        # Process classes by iterating over the immediate children of the module
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, ast.ClassDef):
-                class_info = {"name": node.name, "methods": [], "attributes": []}
-                for item in node.body:
-                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                        is_async = isinstance(item, ast.AsyncFunctionDef)
-                        meth_info = self.get_function_signature(item)
-                        meth_info["async"] = is_async
-                        class_info["methods"].append(meth_info)
-                    elif isinstance(item, ast.AnnAssign):
-                        if isinstance(item.target, ast.Name):
-                            attr_name = item.target.id
-                            attr_type = unparse_annotation(item.annotation) if item.annotation else None
-                            class_info["attributes"].append({"name": attr_name, "type": attr_type})
-                    elif isinstance(item, ast.Assign):
-                        for target in item.targets:
-                            if isinstance(target, ast.Name):
-                                attr_name = target.id
-                                attr_type = getattr(item, "type_comment", None)
-                                class_info["attributes"].append({"name": attr_name, "type": attr_type})
-                file_info["classes"].append(class_info)
-
-        return file_info
-
-    def parse_html_file(self, filepath: str) -> Dict[str, Any]:
+        return extract_python_symbols(tree)
+
+    def parse_html_file(self, filepath: str) -> HtmlFileRecord:
         """
-        Parse an HTML file and return a dict with:
-          - "tags": a dictionary where keys are tag names and values are lists of attributes.
+        Parse an HTML file and return an HtmlFileRecord whose "tags" pair each tag name
+        with the sorted attribute names used on it, in order of first appearance.
+        Only the first max_parse_bytes() of large files are parsed.
         """
+        text = read_text(filepath, max_parse_bytes())
+        if text is None or text.binary:
+            print(f"Skipping {filepath}: unreadable or binary", file=sys.stderr)
+            return None
+        from bs4 import BeautifulSoup  # deferred: only HTML parsing needs it
+
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                soup = BeautifulSoup(f, "html.parser")
+            soup = BeautifulSoup(text.text, "html.parser")
         except Exception as e:
             print(f"Skipping {filepath}: {e}", file=sys.stderr)
             return None
@@ -353,69 +538,199 @@ class RepoMap:
                 tags[tag.name] = set()
             for attr in tag.attrs.keys():
                 tags[tag.name].add(attr)
-        for tag in tags:
-            tags[tag] = sorted(list(tags[tag]))
-        return {"tags": tags}
+        return HtmlFileRecord(tuple((intern(tag), intern_all(sorted(attrs))) for tag, attrs in tags.items()))
 
-    def to_python_stub(self):
+    @_synchronized
+    def to_python_stub(self, max_tokens=None, focus=None, encoding_name=None):
         """
         Return a Python-style stub representation of the repository map.
+
+        With max_tokens, files are ranked by importance (PageRank over the import graph,
+        personalized towards focus) and added greedily until the budget is spent. Files that do
+        not fit whole contribute their highest-scoring symbols. focus is a path, a query string,
+        or a list of either. What was left out is listed at the end of the stub and stored in
+        self.last_stub_report.
+        """
+        if max_tokens is None:
+            self.last_stub_report = None
+            if self._full_stub is None:
+                self._full_stub = "\n".join([self._stub_header()] + [self._fragment(f) for f in self.repo_map])
+            return self._full_stub
+        return self._budgeted_stub(max_tokens, focus, encoding_name or self.encoding_name)
+
+    def _stub_header(self):
+        """Return the first line of the stub."""
+        return f"# Repo Stub for directory: {self.root_dir}"
+
+    def _fragment(self, filepath):
+        """Return the memoized stub fragment of one file."""
+        fragment = self._fragments.get(filepath)
+        if fragment is None:
+            fragment = self._fragments[filepath] = self._render_file(filepath, self.repo_map[filepath])
+        return fragment
+
+    def _fragment_token_count(self, filepath, encoding_name):
+        """
+        Return the memoized token count of one file's fragment, including the newline that joins
+        it to the stub, so that per-file counts add up to (almost exactly) the whole stub's count.
         """
-        lines = []
-        lines.append(f"# Repo Stub for directory: {self.root_dir}")
-        for filepath, info in self.repo_map.items():
-            lines.append(f"\n# File: {filepath}")
-            if filepath.endswith(".py"):
-                if info.get("functions"):
-                    for func in info["functions"]:
-                        lines.append(format_function(func))
-                if info.get("classes"):
-                    for cls in info["classes"]:
-                        lines.append(format_class(cls))
-            elif filepath.endswith(".html"):
-                tags = info.get("tags", {})
-                if tags:
-                    for tag, attrs in tags.items():
-                        attrs_str = ", ".join(attrs) if attrs else ""
-                        lines.append(f"<{tag} {attrs_str}>".strip())
-                else:
-                    lines.append("    ...")
-            elif filepath.endswith(".svelte"):
-                if info.get("components"):
-                    lines.append("  Imported components:")
-                    for comp in info["components"]:
-                        lines.append(f"    - {comp}")
-                if info.get("props"):
-                    lines.append("  Props:")
-                    for prop in info["props"]:
-                        lines.append(f"    - {prop}")
-                if info.get("hasScript"):
-                    lines.append("  Has <script> block")
-                if info.get("hasStyle"):
-                    lines.append("  Has <style> block")
-            elif filepath.endswith(".js") or filepath.endswith(".css"):
-                # For asset files, output the stub text.
-                stub = info.get("stub", "")
-                lines.append(stub)
+        counts = self._fragment_tokens.setdefault(filepath, {})
+        if encoding_name not in counts:
+            counts[encoding_name] = count_tokens("\n" + self._fragment(filepath), encoding_name)
+        return counts[encoding_name]
+
+    def _symbol_token_counts(self, filepath, encoding_name):
+        """Return the memoized token counts of each top-level symbol of a Python file."""
+        counts = self._symbol_tokens.setdefault(filepath, {})
+        if encoding_name not in counts:
+            counts[encoding_name] = [
+                count_tokens("\n" + text, encoding_name) for _, text in self._python_symbols(self.repo_map[filepath])
+            ]
+        return counts[encoding_name]
+
+    def _render_file(self, filepath, info):
+        """Return the stub fragment for one file, starting with its "# File:" header."""
+        lines = [f"\n# File: {filepath}"]
+        if isinstance(info, PythonFileRecord):
+            lines.extend(text for _, text in self._python_symbols(info))
+        elif isinstance(info, HtmlFileRecord):
+            if info.tags:
+                for tag, attrs in info.tags:
+                    attrs_str = ", ".join(attrs) if attrs else ""
+                    lines.append(f"<{tag} {attrs_str}>".strip())
+            else:
+                lines.append("    ...")
+        elif isinstance(info, SvelteFileRecord):
+            if info.components:
+                lines.append("  Imported components:")
+                for comp in info.components:
+                    lines.append(f"    - {comp}")
+            if info.props:
+                lines.append("  Props:")
+                for prop in info.props:
+                    lines.append(f"    - {prop}")
+            if info.has_script:
+                lines.append("  Has <script> block")
+            if info.has_style:
+                lines.append("  Has <style> block")
+        elif isinstance(info, AssetFileRecord):
+            # For asset files, output the stub text.
+            lines.append(info.stub)
         return "\n".join(lines)
 
+    @staticmethod
+    def _python_symbols(info):
+        """Return [(symbol record, stub text)] for the functions and classes of a parsed Python file."""
+        symbols = [(func, format_function(func)) for func in info.functions]
+        symbols.extend((cls, format_class(cls)) for cls in info.classes)
+        return symbols
+
+    def _budgeted_stub(self, max_tokens, focus, encoding_name):
+        """Greedily fill max_tokens with the most important files and symbols. See to_python_stub."""
+        graph = ImportGraph(self.repo_map)
+        seeds, terms = focus_seeds(self.repo_map, self.root_dir, focus)
+        scores = graph.rank(seeds)
+        order = sorted(self.repo_map, key=lambda f: (-scores.get(f, 0.0), f))
+
+        header = f"{self._stub_header()} (ranked to fit {max_tokens} tokens)"
+        header_tokens = count_tokens(header, encoding_name)
+        # Reserve room for the omission note, sized as if the least important files were listed.
+        note_estimate = StubReport(max_tokens, omitted_files=order[-MAX_LISTED_OMISSIONS - 1:], omitted_symbols=[""])
+        reserve = min(count_tokens(note_estimate.describe(), encoding_name), max_tokens // 5)
+        remaining = max_tokens - header_tokens - reserve
+        # filepath -> (fragment, tokens)
+        fragments = {}
+        report = StubReport(max_tokens=max_tokens)
+        for filepath in order:
+            cost = self._fragment_token_count(filepath, encoding_name)
+            if cost <= remaining:
+                fragments[filepath] = (self._fragment(filepath), cost)
+                remaining -= cost
+                continue
+            partial, cost, omitted = self._partial_python_file(filepath, graph, terms, remaining, encoding_name)
+            if partial is None:
+                report.omitted_files.append(filepath)
+                continue
+            fragments[filepath] = (partial, cost)
+            remaining -= cost
+            report.omitted_symbols.extend(f"{filepath}:{name}" for name in omitted)
+
+        # The omission note needs room too; drop the least important files until everything fits.
+        included = [f for f in order if f in fragments]
+        while True:
+            note = report.describe()
+            note_tokens = count_tokens("\n\n" + note, encoding_name) if note else 0
+            report.tokens = header_tokens + sum(cost for _, cost in fragments.values()) + note_tokens
+            if report.tokens <= max_tokens or not included:
+                break
+            dropped = included.pop()
+            del fragments[dropped]
+            report.omitted_files.append(dropped)
+            report.omitted_files.sort(key=order.index)
+            report.omitted_symbols = [s for s in report.omitted_symbols if not s.startswith(f"{dropped}:")]
+
+        body = [header] + [fragments[f][0] for f in self.repo_map if f in fragments]
+        if note:
+            body.append("\n" + note)
+        report.included_files = [f for f in self.repo_map if f in fragments]
+        self.last_stub_report = report
+        return "\n".join(body)
+
+    def _partial_python_file(self, filepath, graph, terms, budget, encoding_name):
+        """
+        Fit the highest-scoring symbols of a Python file into budget tokens.
+        Returns (fragment, tokens, omitted symbol names), or (None, 0, []) if not even one symbol fits.
+        """
+        if not filepath.endswith(".py"):
+            return None, 0, []
+        symbols = self._python_symbols(self.repo_map[filepath])
+        symbol_tokens = self._symbol_token_counts(filepath, encoding_name)
+        header = f"\n# File: {filepath}"
+        cost = count_tokens("\n" + header, encoding_name) + OMISSION_LINE_TOKENS
+        ranked = sorted(
+            range(len(symbols)),
+            key=lambda i: -symbol_score(
+                filepath, symbols[i][0].name, graph, terms,
+                [m.name for m in getattr(symbols[i][0], "methods", ())],
+            ),
+        )
+        chosen = set()
+        for i in ranked:
+            if cost + symbol_tokens[i] <= budget:
+                chosen.add(i)
+                cost += symbol_tokens[i]
+        if not chosen:
+            return None, 0, []
+        omitted = [symbols[i][0].name for i in range(len(symbols)) if i not in chosen]
+        lines = [header] + [symbols[i][1] for i in range(len(symbols)) if i in chosen]
+        if omitted:
+            lines.append(f"# ... {len(omitted)} more symbols omitted")
+        return "\n".join(lines), cost, omitted
+
     def print_python_stub(self):
         """Print the Python stub representation."""
         print(self.to_python_stub())
 
-    def token_count_python_stub(self, encoding_name="gpt2"):
+    @_synchronized
+    def token_count_python_stub(self, encoding_name=None):
         """
-        Compute an accurate token count of the Python stub representation using tiktoken.
+        Count the tokens of the full Python stub using tiktoken.
+        The count is the sum of memoized per-file counts, so only changed files are re-encoded;
+        it can differ from encoding the whole stub at once by a token at some file boundaries.
         """
-        stub_text = self.to_python_stub()
-        encoding = tiktoken.get_encoding(encoding_name)
-        tokens = encoding.encode(stub_text)
-        return len(tokens)
+        encoding_name = encoding_name or self.encoding_name
+        return count_tokens(self._stub_header(), encoding_name) + sum(
+            self._fragment_token_count(filepath, encoding_name) for filepath in self.repo_map
+        )
 
     def print_token_count_python_stub(self):
         """Print the token count for the Python stub representation."""
         count = self.token_count_python_stub()
-        print(f"Accurate token count (Python stub, using tiktoken): {count}")
+        print(f"Token count (Python stub, using tiktoken {self.encoding_name}): {count}")
+
+def _parse_file_worker(filepath):
+    """Process pool entry point. The parsers use no RepoMap state, so skip __init__."""
+    return RepoMap.__new__(RepoMap).parse_file(filepath)
 
 if __name__ == "__main__":
     repo_root = sys.argv[1] if len(sys.argv) > 1 else "."
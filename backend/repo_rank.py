@@ -0,0 +1,212 @@
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# PageRank settings for ranking files in the import graph.
+DAMPING = 0.85
+ITERATIONS = 30
+# Weight of the reverse (imported -> importer) edge relative to the import edge, so that
+# code depending on a focus file is also considered close to it.
+REVERSE_EDGE_WEIGHT = 0.3
+
+# Common words in natural-language requests that should not act as query terms.
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "into", "when", "what", "where", "which",
+    "please", "add", "make", "use", "should", "would", "could", "can", "not", "all", "new", "code",
+    "file", "files", "function", "class", "method", "change", "update", "fix", "how", "why", "are",
+}
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def split_identifier(name: str) -> List[str]:
+    """Split a snake_case or camelCase identifier into lowercase words."""
+    words = []
+    for part in name.split("_"):
+        words.extend(w.lower() for w in _CAMEL_RE.findall(part))
+    return words
+
+def query_terms(text: str) -> Set[str]:
+    """Return the lowercase identifiers and identifier words in a free-text query."""
+    terms = set()
+    for ident in _IDENTIFIER_RE.findall(text):
+        terms.add(ident.lower())
+        terms.update(split_identifier(ident))
+    return {t for t in terms if len(t) > 2 and t not in STOPWORDS}
+
+def module_name(rel_path: str) -> Optional[str]:
+    """Return the dotted module name of a Python file path, or None for other files."""
+    if not rel_path.endswith(".py"):
+        return None
+    parts = rel_path[:-3].replace(os.sep, "/").split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts) if parts else None
+
+def resolve_relative(name: str, rel_path: str) -> str:
+    """Turn a relative import ("..pkg.mod") into an absolute dotted name for the importing file."""
+    level = len(name) - len(name.lstrip("."))
+    if level == 0:
+        return name
+    parts = rel_path[:-3].replace(os.sep, "/").split("/")
+    package = parts[:-1]
+    if level > 1:
+        package = package[:-(level - 1)]
+    rest = name[level:]
+    return ".".join(package + ([rest] if rest else []))
+
+class ImportGraph:
+    """
+    File-level import graph of a repo map.
+
+    Edges point from the importing file to the imported file. Python imports are resolved
+    against the dotted module names of the files in the map, falling back to a unique suffix
+    match so that src/ layouts resolve. Svelte component imports are resolved as relative paths.
+    symbol_refs counts how many other files import each (file, symbol) pair.
+    """
+
+    def __init__(self, repo_map: Dict[str, tuple]):
+        self.files = list(repo_map)
+        self._file_set = set(self.files)
+        self.edges: Dict[str, Set[str]] = defaultdict(set)
+        self.symbol_refs: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._modules: Dict[str, str] = {}
+        self._suffixes: Dict[str, Optional[str]] = {}
+        for rel_path in self.files:
+            name = module_name(rel_path)
+            if name is None:
+                continue
+            self._modules[name] = rel_path
+            parts = name.split(".")
+            for i in range(1, len(parts)):
+                suffix = ".".join(parts[i:])
+                # None marks an ambiguous suffix.
+                self._suffixes[suffix] = rel_path if suffix not in self._suffixes else None
+        for rel_path, info in repo_map.items():
+            if rel_path.endswith(".py"):
+                self._add_python_imports(rel_path, getattr(info, "imports", ()))
+            elif rel_path.endswith(".svelte"):
+                self._add_svelte_imports(rel_path, getattr(info, "components", ()))
+
+    def _lookup(self, name: str) -> Optional[str]:
+        return self._modules.get(name) or self._suffixes.get(name)
+
+    def _add_python_imports(self, rel_path: str, imports: Iterable[str]):
+        for name in imports:
+            name = resolve_relative(name, rel_path)
+            target = self._lookup(name)
+            if target is None and "." in name:
+                # `from pkg.mod import Symbol`: Symbol is defined in pkg.mod.
+                module, symbol = name.rsplit(".", 1)
+                target = self._lookup(module)
+                if target is not None and target != rel_path:
+                    self.symbol_refs[(target, symbol)] += 1
+            if target is not None and target != rel_path:
+                self.edges[rel_path].add(target)
+
+    def _add_svelte_imports(self, rel_path: str, components: Iterable[str]):
+        base = os.path.dirname(rel_path)
+        for component in components:
+            target = os.path.normpath(os.path.join(base, component))
+            if target in self._file_set:
+                self.edges[rel_path].add(target)
+
+    def rank(self, seeds: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Return a PageRank score per file. With seeds, the random walk restarts at the seed files
+        (personalized PageRank), so files close to them in the graph score higher.
+        """
+        if not self.files:
+            return {}
+        total_seed = sum(seeds.values()) if seeds else 0
+        if total_seed > 0:
+            restart = {f: seeds.get(f, 0.0) / total_seed for f in self.files}
+        else:
+            restart = {f: 1.0 / len(self.files) for f in self.files}
+
+        out_links: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        for src, targets in self.edges.items():
+            for dst in targets:
+                out_links[src].append((dst, 1.0))
+                out_links[dst].append((src, REVERSE_EDGE_WEIGHT))
+        out_weight = {f: sum(w for _, w in links) for f, links in out_links.items()}
+
+        scores = dict(restart)
+        for _ in range(ITERATIONS):
+            dangling = sum(scores[f] for f in self.files if not out_weight.get(f))
+            new_scores = {f: (1 - DAMPING + DAMPING * dangling) * restart[f] for f in self.files}
+            for src, links in out_links.items():
+                share = DAMPING * scores[src] / out_weight[src]
+                for dst, weight in links:
+                    new_scores[dst] += share * weight
+            scores = new_scores
+        return scores
+
+def focus_seeds(repo_map: Dict[str, tuple], root_dir: str, focus) -> Tuple[Dict[str, float], Set[str]]:
+    """
+    Turn a focus specification into PageRank seed weights and query terms.
+
+    focus may be a string or a list of strings. Items naming a file in the map (absolute or
+    root-relative) seed that file and, more weakly, its directory neighbours. Any other text
+    is treated as a query: its identifiers seed files whose path or symbols mention them.
+    """
+    if not focus:
+        return {}, set()
+    items = [focus] if isinstance(focus, str) else list(focus)
+    seeds: Dict[str, float] = defaultdict(float)
+    terms: Set[str] = set()
+    focus_dirs = set()
+    for item in items:
+        if not item:
+            continue
+        rel_path = os.path.relpath(item, root_dir) if os.path.isabs(item) else os.path.normpath(item)
+        if rel_path in repo_map:
+            seeds[rel_path] += 1.0
+            focus_dirs.add(os.path.dirname(rel_path))
+        else:
+            terms |= query_terms(item)
+
+    for rel_path, info in repo_map.items():
+        if os.path.dirname(rel_path) in focus_dirs:
+            seeds[rel_path] += 0.3
+        if terms:
+            hits = len(terms & file_terms(rel_path, info))
+            if hits:
+                seeds[rel_path] += 0.5 * hits
+    return dict(seeds), terms
+
+def file_terms(rel_path: str, info) -> Set[str]:
+    """Return the identifier words naming a file and the symbols it defines."""
+    terms = set()
+    for part in re.split(r"[\\/.]", rel_path):
+        terms.add(part.lower())
+        terms.update(split_identifier(part))
+    for name in symbol_names(info):
+        terms.add(name.lower())
+        terms.update(split_identifier(name))
+    return terms
+
+def symbol_names(info) -> List[str]:
+    """Return the names of the top-level functions and classes (and their methods) of a parsed file."""
+    names = [func.name for func in getattr(info, "functions", ())]
+    for cls in getattr(info, "classes", ()):
+        names.append(cls.name)
+        names.extend(meth.name for meth in cls.methods)
+    return names
+
+def symbol_score(rel_path: str, name: str, graph: ImportGraph, terms: Set[str], members: Iterable[str] = ()) -> float:
+    """
+    Score a top-level symbol: referenced from other files and matching the query is better,
+    private names are worse.
+    """
+    score = 1.0 + 2.0 * graph.symbol_refs.get((rel_path, name), 0)
+    if terms:
+        words = {name.lower(), *split_identifier(name)}
+        for member in members:
+            words.add(member.lower())
+            words.update(split_identifier(member))
+        score += 3.0 * len(terms & words)
+    if name.startswith("_"):
+        score *= 0.5
+    return score
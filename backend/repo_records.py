@@ -0,0 +1,105 @@
+"""
+Typed, compact records for repo map entries.
+
+Records are NamedTuples: immutable, tuple-backed (no per-instance __dict__) and cheap to pickle
+across the parser process pool. Identifiers and type names are interned when records are built,
+so the thousands of repeated "self", "str" or "Optional[int]" strings of a large map share storage.
+
+pack() turns a file record into plain nested tuples and unpack() rebuilds it; the packed form is
+what the on-disk cache stores with marshal, which keeps interned strings interned and shared.
+"""
+import sys
+from typing import Any, NamedTuple, Optional, Tuple
+
+class ParamRecord(NamedTuple):
+    name: str
+    kind: str = "arg"  # posonly, arg, vararg, kwonly or kwarg
+    type: Optional[str] = None
+    default: Optional[str] = None
+
+class FunctionRecord(NamedTuple):
+    name: str
+    parameters: Tuple[ParamRecord, ...] = ()
+    returns: Optional[str] = None
+    is_async: bool = False
+    decorators: Tuple[str, ...] = ()
+    lineno: int = 0
+    end_lineno: int = 0
+
+class AttributeRecord(NamedTuple):
+    name: str
+    type: Optional[str] = None
+    lineno: int = 0
+
+class ClassRecord(NamedTuple):
+    name: str
+    bases: Tuple[str, ...] = ()
+    decorators: Tuple[str, ...] = ()
+    methods: Tuple[FunctionRecord, ...] = ()
+    attributes: Tuple[AttributeRecord, ...] = ()
+    classes: Tuple["ClassRecord", ...] = ()
+    lineno: int = 0
+    end_lineno: int = 0
+
+class PythonFileRecord(NamedTuple):
+    functions: Tuple[FunctionRecord, ...] = ()
+    classes: Tuple[ClassRecord, ...] = ()
+    imports: Tuple[str, ...] = ()
+
+class HtmlFileRecord(NamedTuple):
+    # (tag name, sorted attribute names) in order of first appearance
+    tags: Tuple[Tuple[str, Tuple[str, ...]], ...] = ()
+
+class SvelteFileRecord(NamedTuple):
+    components: Tuple[str, ...] = ()
+    props: Tuple[str, ...] = ()
+    has_script: bool = False
+    has_style: bool = False
+
+class AssetFileRecord(NamedTuple):
+    stub: str = ""
+
+def intern(value: Optional[str]) -> Optional[str]:
+    """sys.intern that lets None through."""
+    return sys.intern(value) if value is not None else None
+
+def intern_all(values) -> Tuple[str, ...]:
+    """Return a tuple of interned strings, skipping None."""
+    return tuple(sys.intern(v) for v in values if v is not None)
+
+# File record types in the order of their tag in the packed form. Append only.
+FILE_RECORD_TYPES = (PythonFileRecord, HtmlFileRecord, SvelteFileRecord, AssetFileRecord)
+_FILE_RECORD_TAGS = {cls: tag for tag, cls in enumerate(FILE_RECORD_TYPES)}
+
+def _plain(value):
+    """Recursively convert NamedTuples to plain tuples, which marshal can serialize."""
+    if isinstance(value, tuple):
+        return tuple(_plain(v) for v in value)
+    return value
+
+def pack(record) -> Tuple[int, tuple]:
+    """Return the (tag, plain tuple) form of a file record."""
+    return _FILE_RECORD_TAGS[type(record)], _plain(record)
+
+def _unpack_function(t) -> FunctionRecord:
+    name, params, returns, is_async, decorators, lineno, end_lineno = t
+    return FunctionRecord(name, tuple(map(ParamRecord._make, params)), returns, is_async, decorators, lineno, end_lineno)
+
+def _unpack_class(t) -> ClassRecord:
+    name, bases, decorators, methods, attributes, classes, lineno, end_lineno = t
+    return ClassRecord(
+        name, bases, decorators,
+        tuple(map(_unpack_function, methods)),
+        tuple(map(AttributeRecord._make, attributes)),
+        tuple(map(_unpack_class, classes)),
+        lineno, end_lineno,
+    )
+
+def unpack(packed: Tuple[int, tuple]) -> Any:
+    """Rebuild a file record from its packed form."""
+    tag, t = packed
+    cls = FILE_RECORD_TYPES[tag]
+    if cls is PythonFileRecord:
+        functions, classes, imports = t
+        return PythonFileRecord(tuple(map(_unpack_function, functions)), tuple(map(_unpack_class, classes)), imports)
+    return cls._make(t)
@@ -4,10 +4,13 @@ from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
 import asyncio
-from backend.repo_map import RepoMap
+import threading
+from contextlib import asynccontextmanager
+from backend.config import env_bool, env_int
+from backend.watcher import get_repo_map, stop_watchers
 from backend.agents.orchestrator_agent import OrchestratorAgent
 from backend.communication import WebSocketCommunicator
-from backend.utils import get_file_content
+from backend.utils import close_search_indexes, get_file_content, warm_search, warm_search_roots
 import logging
 
 # Load environment variables
@@ -26,7 +29,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Token budget for the repository stub pasted into agent prompts (0 disables the limit).
+STUB_MAX_TOKENS = env_int("CODEPILOT_STUB_MAX_TOKENS", 20000) or None
+# Load the embedding model and index CODEPILOT_WARM_ROOTS at startup instead of in the first session.
+WARMUP = env_bool("CODEPILOT_WARMUP", True)
+
+
+def warm_up(roots):
+    """Build the repository map of each root (starting its watcher), then warm up code search."""
+    for root in roots:
+        try:
+            get_repo_map(root, OrchestratorAgent.MODEL_NAME)
+            logger.info(f"Repository map of {root} ready.")
+        except Exception as e:
+            logger.warning(f"Failed to build the repository map of {root}: {e}")
+    warm_search(roots).join()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The warmup runs in a daemon thread so that startup and shutdown never wait for it.
+    if WARMUP:
+        threading.Thread(target=warm_up, args=(warm_search_roots(),), name="warmup", daemon=True).start()
+    yield
+    stop_watchers()
+    close_search_indexes()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 
@@ -82,16 +112,21 @@ async def websocket_endpoint(websocket: WebSocket):
         review = config.get("review", True)
         max_iterations = config.get("max_iterations", 1)
         root_directory = config.get("root_directory", ".")
+        # 0 (or null) means no limit, as for CODEPILOT_STUB_MAX_TOKENS.
+        stub_max_tokens = config.get("stub_max_tokens", STUB_MAX_TOKENS) or None
         
-        # Build the repository map and generate the stub.
-        rm = RepoMap(root_directory)
-        rm.build_map()
-        repo_stub = rm.to_python_stub()
-        logger.info("Repository map built and stub generated.")
+        # Get the repository map (kept current by the workspace watcher, so only the first
+        # session on a root builds it) and generate a stub ranked towards the user request.
+        rm = await asyncio.to_thread(get_repo_map, root_directory, OrchestratorAgent.MODEL_NAME)
+        repo_stub = await asyncio.to_thread(rm.to_python_stub, max_tokens=stub_max_tokens, focus=user_prompt)
+        logger.info("Repository map ready and stub generated.")
+        if rm.last_stub_report and rm.last_stub_report.omitted_files:
+            logger.info(f"Repository stub omitted {len(rm.last_stub_report.omitted_files)} files to fit {stub_max_tokens} tokens.")
         
         # Create and run the orchestrator agent.
         orchestrator = OrchestratorAgent(
-            repo_stub, comm, review=review, max_iterations=max_iterations, root_directory=root_directory
+            repo_stub, comm, review=review, max_iterations=max_iterations, root_directory=root_directory,
+            repo_map=rm, stub_max_tokens=stub_max_tokens
         )
         await comm.send("log", "Starting orchestration...")
         logger.info("Starting orchestration.")
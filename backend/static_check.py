@@ -0,0 +1,313 @@
+"""
+Fast local checks of merged files, run before the LLM review so that an update which cannot
+work is sent back to the coder without a review round trip.
+
+Every file is checked for leftover merge conflict markers (<<<<<<< and >>>>>>> lines; a bare
+======= may be a heading underline) and for code fences wrapping its content. Python files
+and JSON must parse. These are definite errors, which fail the change without a review.
+
+The remaining checks can be wrong and are advisory, passed on to the LLM review: Python files
+should use only names they define, import or get from builtins, and import only modules and
+names that exist in the repository (imports of repository modules are resolved against the
+RepoMap records, the files on disk and, for module-level variables, the module source), and
+HTML tags should be properly nested and closed, except in Jinja or Django templates, whose
+tags can open and close elements in separate branches.
+"""
+import ast
+import builtins
+import importlib.machinery
+import json
+import os
+import re
+import threading
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from backend.agents.models import ReviewFeedback
+from backend.repo_rank import resolve_relative, module_name
+from backend.repo_records import PythonFileRecord
+
+# Undefined names reported per file; more are summarized.
+MAX_NAME_PROBLEMS = 10
+
+_MERGE_MARKER_RE = re.compile(r"^(?:<{7}|>{7})(?: |$)")
+_PROSE_EXTENSIONS = (".md", ".markdown", ".rst", ".txt")
+_MODULE_NAMES = {"__file__", "__name__", "__doc__", "__spec__", "__loader__", "__package__", "__path__", "__builtins__", "__annotations__", "__cached__", "__all__"}
+_CLASS_NAMES = {"__qualname__", "__module__", "__dict__", "__slots__", "__weakref__", "__classcell__"}
+_BUILTIN_NAMES = set(dir(builtins)) | _MODULE_NAMES | _CLASS_NAMES
+# Files that make a module importable: sources, stubs and compiled extensions.
+_MODULE_SUFFIXES = (".py", ".pyi", *importlib.machinery.EXTENSION_SUFFIXES)
+
+class Problem(NamedTuple):
+    """A problem found in a file; advisory ones may be false positives and do not fail a change."""
+    filename: str
+    line: int
+    message: str
+    advisory: bool = False
+
+    def __str__(self) -> str:
+        return f"{self.filename}:{self.line}: {self.message}" if self.line else f"{self.filename}: {self.message}"
+
+class StaticChecker:
+    """
+    Checks merged files of one change set. repo_map (a RepoMap's path -> record dict) enables
+    import resolution; modules in pending (files of the same change set, possibly still being
+    merged) are not resolved against, since their new names are not known yet. check() is
+    thread-safe, so files can be checked in parallel.
+    """
+
+    def __init__(self, root_directory: str = ".", repo_map: Optional[Dict[str, object]] = None, pending: Iterable[str] = ()):
+        self.root_directory = os.path.abspath(root_directory)
+        self.records = dict(repo_map or {})
+        self.modules: Dict[str, str] = {}
+        for rel_path in self.records:
+            module = module_name(rel_path)
+            if module:
+                self.modules[module] = rel_path
+        # Packages without an __init__.py still exist as prefixes of their modules.
+        self.packages = {module.rsplit(".", i)[0] for module in self.modules for i in range(1, module.count(".") + 1)}
+        self.top_level = {module.split(".")[0] for module in self.modules}
+        self.pending = {module_name(self._rel_path(path)) for path in pending} - {None}
+        self._names: Dict[str, Optional[Set[str]]] = {}
+        self._names_lock = threading.Lock()
+
+    def check(self, filename: str, code: str) -> List[Problem]:
+        """Return the problems found in one merged file (empty if it passes)."""
+        problems = _check_markers(filename, code)
+        lower = filename.lower()
+        if lower.endswith(".py"):
+            problems.extend(self._check_python(filename, code))
+        elif lower.endswith(".json"):
+            problems.extend(_check_json(filename, code))
+        elif lower.endswith((".html", ".htm")):
+            problems.extend(_check_html(filename, code))
+        return problems
+
+    def _rel_path(self, filename: str) -> str:
+        path = filename if os.path.isabs(filename) else os.path.join(self.root_directory, filename)
+        return os.path.relpath(path, self.root_directory)
+
+    def _check_python(self, filename: str, code: str) -> List[Problem]:
+        try:
+            tree = ast.parse(code, filename)
+            compile(tree, filename, "exec")
+        except SyntaxError as e:
+            return [Problem(filename, e.lineno or 0, f"syntax error: {e.msg}")]
+        except ValueError as e:
+            return [Problem(filename, 0, f"cannot be compiled: {e}")]
+        problems = _undefined_names(filename, tree)
+        if self.modules:
+            problems.extend(self._unresolved_imports(filename, tree))
+        return problems
+
+    def _unresolved_imports(self, filename: str, tree: ast.AST) -> List[Problem]:
+        rel_path = self._rel_path(filename)
+        problems = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if not self._module_exists(alias.name):
+                        problems.append(Problem(filename, node.lineno, f"no module named '{alias.name}' in the repository", True))
+            elif isinstance(node, ast.ImportFrom):
+                module = resolve_relative("." * node.level + (node.module or ""), rel_path)
+                if not self._module_exists(module):
+                    problems.append(Problem(filename, node.lineno, f"no module named '{module}' in the repository", True))
+                    continue
+                if module not in self.modules or module in self.pending:
+                    continue
+                names = self._module_names(module)
+                for alias in node.names:
+                    submodule = f"{module}.{alias.name}"
+                    if names is None or alias.name == "*" or alias.name in names or submodule in self.modules or self._module_on_disk(submodule):
+                        continue
+                    problems.append(Problem(filename, node.lineno, f"cannot import name '{alias.name}' from '{module}'", True))
+        return problems
+
+    def _module_exists(self, module: str) -> bool:
+        """False only for a module under a repository package that is not in the repository."""
+        if module.split(".")[0] not in self.top_level:
+            return True  # standard library or third party
+        if module in self.modules or module in self.packages or module in self.pending:
+            return True
+        # Not in the map: it may still be unparseable, ignored by git, a stub or an extension.
+        return self._module_on_disk(module)
+
+    def _module_on_disk(self, module: str) -> bool:
+        path = os.path.join(self.root_directory, *module.split("."))
+        return os.path.isdir(path) or any(os.path.isfile(path + suffix) for suffix in _MODULE_SUFFIXES)
+
+    def _module_names(self, module: str) -> Optional[Set[str]]:
+        """Names defined at the top level of a repository module, or None if they cannot be known."""
+        with self._names_lock:
+            if module in self._names:
+                return self._names[module]
+        rel_path = self.modules[module]
+        record = self.records.get(rel_path)
+        names: Optional[Set[str]] = None
+        if isinstance(record, PythonFileRecord):
+            names = {f.name for f in record.functions} | {c.name for c in record.classes}
+            names.update(name.rsplit(".", 1)[-1] for name in record.imports)
+        # Module-level variables are not in the records; read them from the source.
+        source_names = _top_level_names(os.path.join(self.root_directory, rel_path))
+        if source_names is None:
+            names = None  # star import, or unreadable source: anything may be defined
+        elif names is not None:
+            names |= source_names
+        else:
+            names = source_names
+        with self._names_lock:
+            self._names[module] = names
+        return names
+
+def static_review(problems: List[Problem]) -> Optional[ReviewFeedback]:
+    """Return a failed ReviewFeedback listing the definite problems, or None if there are none."""
+    errors = [problem for problem in problems if not problem.advisory]
+    if not errors:
+        return None
+    return ReviewFeedback(
+        passed=False,
+        feedback="Static checks failed before review:\n" + "\n".join(str(problem) for problem in errors),
+        suggestions=(
+            "Fix the errors listed above, and output only code: no merge conflict markers and no "
+            "``` fences around file contents."
+        ),
+    )
+
+def static_notes(problems: List[Problem]) -> str:
+    """The advisory problems, one per line, for the LLM review to confirm or dismiss."""
+    return "\n".join(str(problem) for problem in problems if problem.advisory)
+
+def _check_markers(filename: str, code: str) -> List[Problem]:
+    problems = []
+    lines = code.splitlines()
+    if not filename.lower().endswith(_PROSE_EXTENSIONS):
+        for lineno, line in enumerate(lines, 1):
+            if _MERGE_MARKER_RE.match(line):
+                problems.append(Problem(filename, lineno, "merge conflict marker"))
+                break
+        content = [(lineno, line) for lineno, line in enumerate(lines, 1) if line.strip()]
+        for lineno, line in content[:1] + content[-1:]:
+            if line.lstrip().startswith("```"):
+                problems.append(Problem(filename, lineno, "code fence around the file content"))
+                break
+    return problems
+
+def _undefined_names(filename: str, tree: ast.AST) -> List[Problem]:
+    """Names loaded anywhere in the module that nothing in it binds (scopes are not distinguished)."""
+    bound = set(_BUILTIN_NAMES)
+    loads = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loads.append(node)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+            if not isinstance(node, ast.ClassDef):
+                bound.add("__class__")
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return []  # anything may be defined
+                bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+        elif type(node).__name__ in ("TypeVar", "ParamSpec", "TypeVarTuple"):
+            bound.add(node.name)
+    problems = []
+    seen = set()
+    for node in loads:
+        if node.id not in bound and node.id not in seen:
+            seen.add(node.id)
+            problems.append(Problem(filename, node.lineno, f"undefined name '{node.id}'", True))
+    if len(problems) > MAX_NAME_PROBLEMS:
+        problems = problems[:MAX_NAME_PROBLEMS] + [Problem(filename, 0, f"{len(problems) - MAX_NAME_PROBLEMS} more undefined names", True)]
+    return problems
+
+def _top_level_names(path: str) -> Optional[Set[str]]:
+    """Names bound at the top level of a Python file (also inside if/try/with blocks), or None if unknown."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return None
+    names = set()
+    body = list(tree.body)
+    while body:
+        node = body.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                names.update(n.id for n in ast.walk(target) if isinstance(n, ast.Name))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return None
+                names.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, (ast.If, ast.Try, ast.With, ast.For, ast.While)):
+            for field in ("body", "orelse", "finalbody"):
+                body.extend(getattr(node, field, ()))
+            for handler in getattr(node, "handlers", ()):
+                body.extend(handler.body)
+    return names
+
+def _check_json(filename: str, code: str) -> List[Problem]:
+    try:
+        json.loads(code)
+    except json.JSONDecodeError as e:
+        return [Problem(filename, e.lineno, f"invalid JSON: {e.msg}")]
+    return []
+
+# Elements without an end tag, and elements whose end tag may be omitted.
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+_OPTIONAL_END_TAGS = {"html", "head", "body", "p", "li", "dt", "dd", "option", "optgroup", "thead", "tbody", "tfoot", "tr", "td", "th", "colgroup", "rp", "rt"}
+
+class _TagBalance(HTMLParser):
+    def __init__(self, filename: str):
+        super().__init__(convert_charrefs=True)
+        self.filename = filename
+        self.stack: List[tuple] = []
+        self.problems: List[Problem] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in _VOID_TAGS:
+            self.stack.append((tag, self.getpos()[0]))
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        open_tags = [name for name, _ in self.stack]
+        if tag not in open_tags:
+            self.problems.append(Problem(self.filename, self.getpos()[0], f"</{tag}> closes no open element"))
+            return
+        while self.stack:
+            name, lineno = self.stack.pop()
+            if name == tag:
+                break
+            if name not in _OPTIONAL_END_TAGS:
+                self.problems.append(Problem(self.filename, lineno, f"<{name}> is not closed before </{tag}>"))
+
+def _check_html(filename: str, code: str) -> List[Problem]:
+    if "{%" in code or "{{" in code:
+        return []  # a template: {% if %} branches may each open an element closed after them
+    parser = _TagBalance(filename)
+    parser.feed(code)
+    parser.close()
+    problems = parser.problems
+    problems.extend(
+        Problem(filename, lineno, f"<{name}> is never closed")
+        for name, lineno in parser.stack if name not in _OPTIONAL_END_TAGS
+    )
+    # The parser does not know every browser recovery rule, so nesting problems are advisory.
+    return [problem._replace(advisory=True) for problem in problems]
@@ -0,0 +1,145 @@
+import os
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from backend.readers import iter_lines
+from backend.repo_rank import resolve_relative, module_name
+from backend.repo_records import ClassRecord, PythonFileRecord
+
+class Definition(NamedTuple):
+    """A function, class or method definition and where it lives."""
+    name: str
+    qualname: str  # dotted within its module, e.g. "SearchIndex.query"
+    kind: str  # function, class or method
+    rel_path: str
+    lineno: int
+    end_lineno: int
+
+class SymbolIndex:
+    """
+    Cross-file symbol table built from the RepoMap's parsed Python records.
+
+    Definitions are indexed by bare name and by qualified name, so lookups are dictionary hits.
+    The reverse index maps each (module, top-level name) to the files that import it, which is
+    the reference information available without parsing function bodies.
+    Files are added and removed individually so the index follows RepoMap updates.
+    """
+
+    def __init__(self):
+        self.by_name: Dict[str, List[Definition]] = defaultdict(list)
+        self.by_qualname: Dict[str, List[Definition]] = defaultdict(list)
+        self.importers: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        # rel_path -> what the file contributed, so it can be removed again.
+        self._definitions: Dict[str, List[Definition]] = {}
+        self._imports: Dict[str, List[Tuple[str, str]]] = {}
+
+    def add_file(self, rel_path: str, info):
+        """Index the definitions and imports of one parsed file, replacing any previous entry."""
+        self.remove_file(rel_path)
+        if not isinstance(info, PythonFileRecord):
+            return
+        definitions = [
+            Definition(func.name, func.name, "function", rel_path, func.lineno, func.end_lineno)
+            for func in info.functions
+        ]
+        for cls in info.classes:
+            _class_definitions(cls, "", rel_path, definitions)
+        for definition in definitions:
+            self.by_name[definition.name].append(definition)
+            self.by_qualname[definition.qualname].append(definition)
+        self._definitions[rel_path] = definitions
+
+        imports = []
+        for name in info.imports:
+            module, _, symbol = resolve_relative(name, rel_path).rpartition(".")
+            if module and symbol:
+                imports.append((module, symbol))
+                self.importers[(module, symbol)].add(rel_path)
+        self._imports[rel_path] = imports
+
+    def remove_file(self, rel_path: str):
+        """Forget everything indexed for one file."""
+        for definition in self._definitions.pop(rel_path, ()):
+            _remove(self.by_name, definition.name, definition)
+            _remove(self.by_qualname, definition.qualname, definition)
+        for key in self._imports.pop(rel_path, ()):
+            importers = self.importers.get(key)
+            if importers is not None:
+                importers.discard(rel_path)
+                if not importers:
+                    del self.importers[key]
+
+    def find(self, name: str) -> List[Definition]:
+        """
+        Return the definitions matching name, which may be a bare name ("query"), a qualified
+        name ("SearchIndex.query") or either prefixed with its module ("backend.utils.SearchIndex.query").
+        """
+        name = name.strip().strip("`").rstrip("()")
+        definitions = set(self.by_qualname.get(name, ())) | set(self.by_name.get(name, ()))
+        if definitions:
+            return sorted(definitions, key=lambda d: (d.rel_path, d.lineno))
+        # Try splitting off a module prefix: the longest qualified name that matches wins.
+        parts = name.split(".")
+        for i in range(1, len(parts)):
+            module, qualname = ".".join(parts[:i]), ".".join(parts[i:])
+            matches = [d for d in self.by_qualname.get(qualname, ()) if module_name(d.rel_path) == module]
+            if matches:
+                return sorted(matches, key=lambda d: d.lineno)
+        return []
+
+    def references(self, definition: Definition) -> List[str]:
+        """Return the files importing the top-level symbol that contains definition."""
+        module = module_name(definition.rel_path)
+        if module is None:
+            return []
+        top_level = definition.qualname.split(".")[0]
+        return sorted(self.importers.get((module, top_level), ()))
+
+def _class_definitions(cls: ClassRecord, prefix: str, rel_path: str, out: List[Definition]):
+    qualname = prefix + cls.name
+    out.append(Definition(cls.name, qualname, "class", rel_path, cls.lineno, cls.end_lineno))
+    for meth in cls.methods:
+        out.append(Definition(meth.name, f"{qualname}.{meth.name}", "method", rel_path, meth.lineno, meth.end_lineno))
+    for nested in cls.classes:
+        _class_definitions(nested, qualname + ".", rel_path, out)
+
+def _remove(index: Dict[str, List[Definition]], key: str, definition: Definition):
+    definitions = index.get(key)
+    if definitions is None:
+        return
+    try:
+        definitions.remove(definition)
+    except ValueError:
+        return
+    if not definitions:
+        del index[key]
+
+def definition_source(definition: Definition, root_dir: str, max_lines: Optional[int] = None) -> str:
+    """
+    Return the source lines of a definition (decorators included) from the file on disk.
+    With max_lines, longer definitions are cut off with a "# ... N more lines" marker.
+    """
+    path = os.path.join(root_dir, definition.rel_path)
+    try:
+        # Stream only up to the end of the definition.
+        lines = list(islice(iter_lines(path, definition.end_lineno), definition.lineno - 1, None))
+    except OSError:
+        return ""
+    if max_lines is not None and len(lines) > max_lines:
+        hidden = len(lines) - max_lines
+        lines = lines[:max_lines] + [f"# ... {hidden} more lines"]
+    return "\n".join(lines)
+
+def build_symbol_index(repo_map: Dict[str, object], paths: Optional[Iterable[str]] = None, index: Optional[SymbolIndex] = None) -> SymbolIndex:
+    """
+    Index the given repo_map entries (all of them by default) into index, or a new SymbolIndex.
+    Paths missing from repo_map are removed from the index.
+    """
+    index = index if index is not None else SymbolIndex()
+    for rel_path in (repo_map if paths is None else paths):
+        info = repo_map.get(rel_path)
+        if info is None:
+            index.remove_file(rel_path)
+        else:
+            index.add_file(rel_path, info)
+    return index
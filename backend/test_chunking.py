@@ -0,0 +1,92 @@
+from backend.chunking import Chunk, chunk_source
+
+PYTHON = '''import os
+
+def alpha():
+    return 1
+
+@decorated
+def beta(x):
+    return x * 2
+
+class Gamma:
+    """A class."""
+
+    def one(self):
+        return 1
+
+    def two(self):
+        return 2
+'''
+
+def test_python_chunks_follow_top_level_symbols():
+    chunks = chunk_source("mod.py", PYTHON)
+    assert [(c.symbol, c.start_line, c.end_line) for c in chunks] == [
+        ("alpha", 1, 4),  # the import joins the first function
+        ("beta", 6, 8),
+        ("Gamma", 10, 17),
+    ]
+    assert chunks[1].text.startswith("@decorated")
+
+def test_oversized_class_is_split_by_method():
+    chunks = chunk_source("mod.py", PYTHON, max_chars=60)
+    symbols = [c.symbol for c in chunks]
+    assert "Gamma.one" in symbols and "Gamma.two" in symbols
+    two = next(c for c in chunks if c.symbol == "Gamma.two")
+    assert two.text.strip().startswith("def two") and two.end_line == 17
+
+def test_oversized_symbol_is_split_by_lines():
+    text = "def big():\n" + "    x = 1\n" * 100
+    chunks = chunk_source("big.py", text, max_chars=200)
+    assert len(chunks) > 1
+    assert all(c.symbol == "big" and len(c.text) <= 200 for c in chunks)
+    assert chunks[0].start_line == 1 and chunks[-1].end_line == 101
+    assert all(a.end_line + 1 == b.start_line for a, b in zip(chunks, chunks[1:]))
+
+def test_script_declarations_keep_their_comments():
+    text = (
+        "import x from 'x';\n"
+        "\n"
+        "// Adds two numbers.\n"
+        "export function add(a, b) {\n"
+        "  return a + b;\n"
+        "}\n"
+        "\n"
+        "export const Widget = (props) => {\n"
+        "  return props;\n"
+        "};\n"
+    )
+    chunks = {c.symbol: c for c in chunk_source("util.js", text)}
+    assert chunks["add"].text.startswith("import x")  # small code between symbols joins the next one
+    assert "// Adds two numbers." in chunks["add"].text
+    assert chunks["add"].end_line == 6
+    assert (chunks["Widget"].start_line, chunks["Widget"].end_line) == (8, 10)
+
+def test_svelte_script_and_style_blocks():
+    text = (
+        "<script>\n"
+        "  export let title;\n"
+        "  function go() {\n"
+        "    return 1;\n"
+        "  }\n"
+        "</script>\n"
+        "\n"
+        "<h1>{title}</h1>\n"
+        "\n"
+        "<style>\n"
+        "  h1 {\n"
+        "    color: red;\n"
+        "  }\n"
+        "</style>\n"
+    )
+    chunks = chunk_source("App.svelte", text)
+    symbols = [c.symbol for c in chunks]
+    assert "go" in symbols and "h1" in symbols
+    # Together the chunks cover the file in order, without overlap.
+    assert chunks[0].start_line == 1 and chunks[-1].end_line == 14
+    assert all(a.end_line < b.start_line for a, b in zip(chunks, chunks[1:]))
+
+def test_unparsable_and_unknown_files_fall_back_to_whole_file():
+    assert chunk_source("bad.py", "def broken(:\n    pass\n") == [Chunk("def broken(:\n    pass", 1, 2, "")]
+    assert [c.symbol for c in chunk_source("notes.md", "# title\ntext\n")] == [""]
+    assert chunk_source("empty.py", "") == []
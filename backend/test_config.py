@@ -0,0 +1,21 @@
+from backend.config import env_bool, env_int
+
+def test_env_int_clamps_and_falls_back_to_the_default(monkeypatch):
+    monkeypatch.delenv("CODEPILOT_TEST_VALUE", raising=False)
+    assert env_int("CODEPILOT_TEST_VALUE", 7) == 7
+    monkeypatch.setenv("CODEPILOT_TEST_VALUE", "not a number")
+    assert env_int("CODEPILOT_TEST_VALUE", 7) == 7
+    monkeypatch.setenv("CODEPILOT_TEST_VALUE", "-3")
+    assert env_int("CODEPILOT_TEST_VALUE", 7) == 0
+    assert env_int("CODEPILOT_TEST_VALUE", 7, minimum=1) == 1
+    monkeypatch.setenv("CODEPILOT_TEST_VALUE", "12")
+    assert env_int("CODEPILOT_TEST_VALUE", 7) == 12
+
+def test_env_bool_is_true_unless_switched_off(monkeypatch):
+    monkeypatch.delenv("CODEPILOT_TEST_FLAG", raising=False)
+    assert env_bool("CODEPILOT_TEST_FLAG", True) and not env_bool("CODEPILOT_TEST_FLAG", False)
+    for value in ("0", "false", "No", "OFF"):
+        monkeypatch.setenv("CODEPILOT_TEST_FLAG", value)
+        assert not env_bool("CODEPILOT_TEST_FLAG", True)
+    monkeypatch.setenv("CODEPILOT_TEST_FLAG", "yes")
+    assert env_bool("CODEPILOT_TEST_FLAG", False)
@@ -0,0 +1,30 @@
+from backend.diffs import diff_hunks
+
+ORIGINAL = """class Greeter:
+    def hello(self):
+        return "Hello"
+
+    def bye(self):
+        return "Bye"
+
+def main():
+    Greeter().hello()
+"""
+
+def test_hunks_have_context_and_line_ranges():
+    updated = ORIGINAL.replace('"Bye"', '"Goodbye"')
+    [hunk] = diff_hunks("greeter.py", ORIGINAL, updated, context_lines=1)
+    assert (hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count) == (5, 3, 5, 3)
+    assert hunk.lines == ["     def bye(self):", '-        return "Bye"', '+        return "Goodbye"', " "]
+    assert (hunk.added, hunk.removed) == (1, 1)
+
+def test_hunks_are_named_after_the_enclosing_symbol():
+    updated = ORIGINAL.replace('"Hello"', '"Hi"').replace("Greeter().hello()", "print(Greeter().hello())")
+    hunks = diff_hunks("greeter.py", ORIGINAL, updated, context_lines=0)
+    assert [hunk.symbol for hunk in hunks] == ["Greeter", "main"]
+    assert hunks[1].header == "@@ -9,1 +9,1 @@ main"
+
+def test_whitespace_only_hunks_are_detected():
+    [hunk] = diff_hunks("greeter.py", ORIGINAL, ORIGINAL.replace("Greeter().hello()", "Greeter( ).hello()"))
+    assert hunk.whitespace_only
+    assert diff_hunks("greeter.py", ORIGINAL, ORIGINAL) == []
@@ -0,0 +1,47 @@
+import numpy as np
+from backend.embedding_cache import EmbeddingCache, embedding_model_id, text_key
+
+class FakeModel:
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, documents):
+        self.calls.append(list(documents))
+        return [[len(doc) / 10, 0.5, -1.0] for doc in documents]
+
+def test_only_unseen_texts_reach_the_model(tmp_path):
+    model = FakeModel()
+    cache = EmbeddingCache(str(tmp_path), embedding_model_id(model))
+    first = cache.embed(["a", "bb", "a"], model)
+    assert model.calls == [["a", "bb"]]
+    assert np.allclose(first[0], first[2]) and np.allclose(first[1], [0.2, 0.5, -1.0], atol=1e-3)
+    cache.embed(["bb", "ccc"], model)
+    assert model.calls[-1] == ["ccc"]
+    assert (cache.hits, cache.misses) == (2, 3)
+
+def test_vectors_persist_as_float16_and_are_shared_between_instances(tmp_path):
+    model = FakeModel()
+    EmbeddingCache(str(tmp_path), "fake-model").embed(["x" * 7, "y"], model)
+    reopened = EmbeddingCache(str(tmp_path), "fake-model")
+    vectors = reopened.get_many([text_key("x" * 7), text_key("y"), text_key("z")])
+    assert vectors[2] is None
+    assert vectors[0].dtype == np.float32 and np.allclose(vectors[0], [0.7, 0.5, -1.0], atol=1e-3)
+    assert len(reopened) == 2
+    assert (tmp_path / "fake-model" / "vectors.f16").stat().st_size == 2 * 3 * 2
+    # Another model gets its own directory.
+    assert EmbeddingCache(str(tmp_path), "other-model").get_many([text_key("y")]) == [None]
+
+def test_interrupted_append_is_discarded(tmp_path):
+    model = FakeModel()
+    cache = EmbeddingCache(str(tmp_path), "fake-model")
+    cache.embed(["a"], model)
+    with open(cache.vectors_path, "ab") as f:
+        f.write(b"\0" * 6)  # a vector whose key was never written
+    cache = EmbeddingCache(str(tmp_path), "fake-model")
+    cache.embed(["b"], model)
+    reopened = EmbeddingCache(str(tmp_path), "fake-model")
+    a, b = reopened.get_many([text_key("a"), text_key("b")])
+    assert np.allclose(a, [0.1, 0.5, -1.0], atol=1e-3) and np.allclose(b, [0.1, 0.5, -1.0], atol=1e-3)
+    assert (tmp_path / "fake-model" / "vectors.f16").stat().st_size == 2 * 3 * 2
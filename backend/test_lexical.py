@@ -0,0 +1,38 @@
+from backend.lexical import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+def test_tokenize_splits_snake_and_camel_case():
+    assert tokenize("sendUsage(ctx)") == ["sendusage", "send", "usage", "ctx"]
+    assert tokenize("_INDEX_CACHE_TTL = 300") == ["_index_cache_ttl", "index", "cache", "ttl", "300"]
+    assert tokenize("parseXMLFile") == ["parsexmlfile", "parse", "xml", "file"]
+
+def _index():
+    index = LexicalIndex()
+    index.add("a.py::chunk0", "def send_usage(comm, result):\n    comm.send(result)", {"filepath": "a.py", "symbol": "send_usage", "start_line": 1, "end_line": 2})
+    index.add("b.py::chunk0", "_INDEX_CACHE_TTL = 300\n\ndef usage():\n    return _INDEX_CACHE_TTL", {"filepath": "b.py", "start_line": 1, "end_line": 4})
+    index.add("b.py::chunk1", "class SearchIndex:\n    def query(self):\n        pass", {"filepath": "b.py", "symbol": "SearchIndex", "start_line": 6, "end_line": 8})
+    return index
+
+def test_exact_identifier_ranks_first():
+    index = _index()
+    assert index.search("send_usage")[0][0] == "a.py::chunk0"
+    assert index.search("_INDEX_CACHE_TTL")[0][0] == "b.py::chunk0"
+    # Chunks sharing only a word with an indexed identifier ("index") are not ranked.
+    assert [chunk_id for chunk_id, _ in index.search("SearchIndex.query")] == ["b.py::chunk1"]
+    assert [chunk_id for chunk_id, _ in index.search("search index")] == ["b.py::chunk1", "b.py::chunk0"]
+    assert index.search("nothing_like_this") == []
+
+def test_substring_queries_use_trigrams():
+    index = _index()
+    assert [chunk_id for chunk_id, _ in index.search("CACHE_T")] == ["b.py::chunk0"]
+    assert index.search("earchInd")[0][0] == "b.py::chunk1"
+
+def test_removing_a_file_forgets_its_chunks():
+    index = _index()
+    index.remove_file("b.py")
+    assert len(index) == 1
+    assert index.search("_INDEX_CACHE_TTL") == [] and index.search("CACHE_T") == []
+    assert "_index_cache_ttl" not in index.postings and not any("_index_cache_ttl" in terms for terms in index.trigrams.values())
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
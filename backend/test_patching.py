@@ -0,0 +1,67 @@
+from backend.patching import ANCHOR, EXACT, FUZZY, FUZZY_ANCHOR, NEW_FILE, apply_update, find_lines
+
+CODE = """class Greeter:
+    def hello(self):
+        print("Hello")
+
+    def bye(self):
+        print("Bye")
+"""
+
+def test_exact_replacement():
+    result = apply_update(CODE, 'print("Hello")', 'print("Hello, World!")')
+    assert result.method == EXACT
+    assert result.code == CODE.replace('print("Hello")', 'print("Hello, World!")')
+
+def test_exact_replacement_reindents_multiline_code_to_the_match():
+    result = apply_update(CODE, 'print("Hello")', 'print("Hello")\nif True:\n    print("World")')
+    assert result.method == EXACT
+    assert '        print("Hello")\n        if True:\n            print("World")\n\n    def bye' in result.code
+    compile(result.code, "greeter.py", "exec")
+
+def test_fuzzy_replacement_ignores_indentation_and_reindents():
+    old = 'def  hello(self):\n    print("Hello")  '
+    new = 'def hello(self, name):\n    print("Hello", name)\n'
+    result = apply_update(CODE, old, new)
+    assert result.method == FUZZY
+    assert '    def hello(self, name):\n        print("Hello", name)\n\n    def bye' in result.code
+
+def test_fuzzy_replacement_skips_blank_lines():
+    old = '        print("Hello")\n    def bye(self):'
+    result = apply_update(CODE, old, '        print("Hi")\n\n    def farewell(self):')
+    assert result.method == FUZZY
+    assert 'print("Hi")\n\n    def farewell(self):\n        print("Bye")' in result.code
+
+def test_insertion_after_anchor():
+    result = apply_update(CODE, "", '        return "Hello"', anchor_context='print("Hello")')
+    assert result.method == ANCHOR
+    assert 'print("Hello")\n        return "Hello"\n\n    def bye' in result.code
+    fuzzy = apply_update(CODE, "", "        pass", anchor_context="def bye(self):\n  print('Bye')".replace("'", '"'))
+    assert fuzzy.method == FUZZY_ANCHOR and fuzzy.code.endswith('print("Bye")\n        pass\n')
+
+def test_ambiguous_and_missing_matches_are_not_applied():
+    code = "x = 1\ny = 2\nx = 1\n"
+    result = apply_update(code, "x = 1", "x = 3")
+    assert not result.applied and result.code == code and "2 times" in result.error
+    spaced = apply_update(code, "x  =  1", "x = 3")
+    assert not spaced.applied and "lines 1-1, 3-3" in spaced.error
+    missing = apply_update(code, "z = 1", "z = 3")
+    assert not missing.applied and "not found" in missing.error
+    assert not apply_update(code, "", "z = 3").applied  # insertion without an anchor
+
+def test_exact_matches_do_not_start_or_end_inside_a_line():
+    result = apply_update("max = 10\n", "x = 1", "x = 2")
+    assert not result.applied and result.code == "max = 10\n" and "not found" in result.error
+    assert apply_update("max = 10\nx = 1\n", "x = 1", "x = 2") == ("max = 10\nx = 2\n", EXACT, "")
+    code = "limit = 10\nx = 1\n"
+    inserted = apply_update(code, "", "y = 2", anchor_context="it = 1")
+    assert not inserted.applied and "not found" in inserted.error
+    assert apply_update(code, "", "y = 2", anchor_context="x = 1").code == "limit = 10\nx = 1\ny = 2\n"
+
+def test_insertion_into_empty_file_creates_it():
+    assert apply_update("", "", "print(1)\n") == ("print(1)\n", NEW_FILE, "")
+
+def test_find_lines_compares_normalized_non_blank_lines():
+    lines = ["a = 1", "", "  b =   2", "c = 3"]
+    assert find_lines(lines, "a = 1\nb = 2") == [(0, 2)]
+    assert find_lines(lines, "\n\n") == []
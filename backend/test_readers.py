@@ -0,0 +1,35 @@
+from unittest.mock import patch
+from backend import readers
+from backend.readers import iter_lines, read_text
+from backend.repo_map import parse_asset_file
+from backend.utils import get_file_content
+
+def test_read_text_truncates_at_line_boundary_with_and_without_mmap(tmp_path):
+    path = tmp_path / "big.py"
+    path.write_text("".join(f"line_{i} = {i}\n" for i in range(1000)))
+    size = path.stat().st_size
+    for mmap_min in (size + 1, 0):
+        with patch.object(readers, "MMAP_MIN_BYTES", mmap_min):
+            text = read_text(str(path), max_bytes=100)
+        assert text.truncated and text.size == size
+        assert text.text.endswith("\n") and len(text.text) <= 100
+        assert text.text.splitlines()[0] == "line_0 = 0"
+    assert read_text(str(path)).text == path.read_text()
+
+def test_binary_and_minified_detection(tmp_path):
+    (tmp_path / "blob.bin").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0")
+    assert read_text(str(tmp_path / "blob.bin")).binary
+    assert get_file_content(str(tmp_path / "blob.bin"), max_bytes=1000) == "[binary file, 11 bytes, not shown]"
+
+    (tmp_path / "app.min.js").write_text("var a=1;" * 5000 + "\n")
+    assert read_text(str(tmp_path / "app.min.js")).minified
+    assert not read_text(str(tmp_path / "app.min.js")).binary
+
+def test_asset_stub_streams_and_cuts_long_lines(tmp_path):
+    path = tmp_path / "bundle.js"
+    path.write_text("\n\n" + "x" * 100_000 + "\n" + "".join(f"let v{i};\n" for i in range(50)))
+    assert list(iter_lines(str(path), max_lines=3, max_line_length=10)) == ["", "", "x" * 10]
+    stub = parse_asset_file(str(path)).stub.splitlines()
+    assert stub[0] == "/* JavaScript File: bundle.js */"
+    assert stub[1] == "x" * readers.MAX_STUB_LINE_LENGTH
+    assert stub[2:] == [f"let v{i};" for i in range(9)]
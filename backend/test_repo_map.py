@@ -0,0 +1,129 @@
+import os
+import pytest
+from unittest.mock import patch
+from backend.repo_map import RepoMap
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def foo(x: int) -> str:\n    return str(x)\n")
+    (root / "b.py").write_text("class Bar:\n    y: int\n    def baz(self): ...\n")
+    return root
+
+def test_rebuild_reuses_cached_entries(repo, tmp_path):
+    (repo / "page.html").write_text('<div class="x" id="y"><a href="#">link</a></div>\n')
+    (repo / "App.svelte").write_text("<script>\n  import Nav from './Nav.svelte';\n  export let title;\n</script>\n")
+    cache_dir = tmp_path / "cache"
+    first = RepoMap(str(repo), cache_dir=str(cache_dir))
+    first.build_map()
+    assert set(first.repo_map) == {"a.py", "b.py", "page.html", "App.svelte"}
+
+    second = RepoMap(str(repo), cache_dir=str(cache_dir))
+    with patch.object(RepoMap, "parse_file") as parse:
+        second.build_map()
+    parse.assert_not_called()
+    # Records survive the binary round trip with their types intact.
+    assert second.repo_map == first.repo_map
+    assert [type(info) for info in second.repo_map.values()] == [type(info) for info in first.repo_map.values()]
+    assert second.to_python_stub() == first.to_python_stub()
+
+def test_rebuild_reparses_only_changed_files(repo, tmp_path):
+    cache_dir = tmp_path / "cache"
+    RepoMap(str(repo), cache_dir=str(cache_dir)).build_map()
+    (repo / "a.py").write_text("def foo(x: int, y: int) -> str:\n    return str(x + y)\n")
+
+    rm = RepoMap(str(repo), cache_dir=str(cache_dir))
+    original_parse = RepoMap.parse_python_file
+    parsed = []
+    def tracking_parse(self, filepath):
+        parsed.append(os.path.basename(filepath))
+        return original_parse(self, filepath)
+    with patch.object(RepoMap, "parse_python_file", tracking_parse):
+        rm.build_map()
+    assert parsed == ["a.py"]
+    assert [p.name for p in rm.repo_map["a.py"].functions[0].parameters] == ["x", "y"]
+
+def test_refresh_updates_adds_and_removes_entries(repo, tmp_path):
+    rm = RepoMap(str(repo), cache_dir=str(tmp_path / "cache"))
+    rm.build_map()
+
+    (repo / "c.py").write_text("def new(): ...\n")
+    (repo / "b.py").unlink()
+    rm.refresh([str(repo / "c.py"), "b.py"])
+
+    assert "b.py" not in rm.repo_map
+    assert rm.repo_map["c.py"].functions[0].name == "new"
+    assert "a.py" in rm.repo_map
+
+def test_parallel_build_matches_serial_build(repo):
+    for i in range(8):
+        (repo / f"mod{i}.py").write_text(f"def f{i}(a, *args, k: int = {i}, **kw) -> None: ...\n")
+    (repo / "style.css").write_text("body { color: red; }\n")
+
+    serial = RepoMap(str(repo), use_cache=False, workers=1)
+    serial.build_map()
+    parallel = RepoMap(str(repo), use_cache=False, workers=2, parallel_threshold=1)
+    parallel.build_map()
+    assert list(parallel.repo_map.items()) == list(serial.repo_map.items())
+
+def _word_count(text, encoding_name="gpt2"):
+    return len(text.split())
+
+def test_budgeted_stub_ranks_imported_and_focus_files(repo):
+    (repo / "core.py").write_text("def shared_helper(a: int) -> int: ...\ndef _private(): ...\n")
+    for i in range(6):
+        (repo / f"user{i}.py").write_text(
+            f"from core import shared_helper\n" + "".join(f"def func{i}_{j}(value: int) -> int: ...\n" for j in range(10))
+        )
+    rm = RepoMap(str(repo), use_cache=False)
+    rm.build_map()
+    with patch("backend.repo_map.count_tokens", _word_count):
+        full = rm.to_python_stub()
+        stub = rm.to_python_stub(max_tokens=120, focus="explain Bar.baz")
+    report = rm.last_stub_report
+    assert report.tokens <= 120 < _word_count(full)
+    assert "# File: core.py" in stub and "# File: b.py" in stub
+    assert report.omitted_files and all(f"#   {f}" in stub for f in report.omitted_files)
+    assert set(report.included_files).isdisjoint(report.omitted_files)
+
+def test_stub_fragments_and_token_counts_are_memoized_per_file(repo, tmp_path):
+    rm = RepoMap(str(repo), cache_dir=str(tmp_path / "cache"))
+    rm.build_map()
+    counted = []
+    def counting(text, encoding_name="gpt2"):
+        counted.append(text)
+        return _word_count(text)
+    with patch("backend.repo_map.count_tokens", counting):
+        total = rm.token_count_python_stub()
+        assert total == _word_count(rm.to_python_stub())
+        counted.clear()
+        assert rm.token_count_python_stub() == total
+        assert len(counted) == 1  # only the header
+
+        (repo / "a.py").write_text("def foo(x: int, y: int, z: int) -> str: ...\n")
+        rm.refresh(["a.py"])
+        counted.clear()
+        assert rm.token_count_python_stub() == total + 4
+        assert [text.split("\n")[2] for text in counted if "# File:" in text] == ["# File: a.py"]
+
+def test_python_extractor_handles_signatures_nesting_and_deep_expressions(repo):
+    (repo / "c.py").write_text(
+        "TOTAL = " + " + ".join(f"v{i}" for i in range(1500)) + "\n"
+        "def f(a, b=1, /, c: int = 2, *, d, **kw) -> None: ...\n"
+        "@decorate\n"
+        "class Outer(Base):\n"
+        "    class Inner:\n"
+        "        def m(self): ...\n"
+        "    def helper(self):\n"
+        "        def closure(): ...\n"
+    )
+    rm = RepoMap(str(repo), use_cache=False)
+    info = rm.parse_python_file(str(repo / "c.py"))
+    assert [func.name for func in info.functions] == ["f"]
+    stub = rm._render_file("c.py", info)
+    assert "def f(a: Any, b: Any = 1, /, c: int = 2, *, d: Any, **kw: Any) -> None: ..." in stub
+    assert "@decorate\nclass Outer(Base):\n    class Inner:\n        def m(self: Any) -> Any: ..." in stub
+    outer = info.classes[0]
+    assert (outer.lineno, outer.end_lineno) == (3, 8)
+    assert [meth.name for meth in outer.methods] == ["helper"]
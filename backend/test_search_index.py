@@ -0,0 +1,328 @@
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from backend import utils
+from backend.utils import IndexRegistry, SearchIndex
+
+class CountingEmbeddings(EmbeddingFunction):
+    """Cheap deterministic embeddings that record which documents were embedded."""
+
+    def __init__(self):
+        self.documents = []
+        self.calls = 0
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.calls += 1
+        self.documents.extend(input)
+        return [[float(len(doc)), float(sum(map(ord, doc)) % 97), 1.0] for doc in input]
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def alpha():\n    return 1\n")
+    (root / "b.py").write_text("def beta():\n    return 2\n")
+    (root / "notes.txt").write_text("not indexed\n")
+    return root
+
+def _open(repo, tmp_path):
+    embeddings = CountingEmbeddings()
+    return SearchIndex(str(repo), cache_dir=str(tmp_path / "cache"), embedding_function=embeddings), embeddings
+
+def test_reopening_unchanged_repo_embeds_nothing(repo, tmp_path):
+    index, embeddings = _open(repo, tmp_path)
+    assert index.sync() == 2
+    assert len(embeddings.documents) == 2
+    del index
+
+    index, embeddings = _open(repo, tmp_path)
+    assert set(index.files) == {str(repo / "a.py"), str(repo / "b.py")}
+    assert index.sync() == 0
+    assert embeddings.documents == []
+
+def test_sync_reembeds_only_changed_added_and_removed_files(repo, tmp_path):
+    index, embeddings = _open(repo, tmp_path)
+    index.sync()
+    embeddings.documents.clear()
+
+    (repo / "a.py").write_text("def alpha():\n    return 10\n")
+    (repo / "c.py").write_text("def gamma():\n    return 3\n")
+    (repo / "b.py").unlink()
+    assert index.sync() == 2
+    assert sorted(embeddings.documents) == ["def alpha():\n    return 10", "def gamma():\n    return 3"]
+    stored = index.collection.get(include=["metadatas"])
+    assert sorted(m["filepath"] for m in stored["metadatas"]) == [str(repo / "a.py"), str(repo / "c.py")]
+
+def test_touched_but_unchanged_file_is_not_reembedded(repo, tmp_path):
+    index, embeddings = _open(repo, tmp_path)
+    index.sync()
+    embeddings.documents.clear()
+    (repo / "a.py").write_text((repo / "a.py").read_text())
+    assert index.update_files([str(repo / "a.py")]) == 0
+    assert embeddings.documents == []
+
+def test_failed_embedding_leaves_files_to_reindex(repo, tmp_path, monkeypatch):
+    index, embeddings = _open(repo, tmp_path)
+
+    def fail(documents):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(index, "_embed", fail)
+    with pytest.raises(RuntimeError):
+        index.sync()
+    assert index.files == {}
+    monkeypatch.undo()
+    assert index.sync() == 2
+
+def test_bulk_ingestion_batches_embeddings_across_files(repo, tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEPILOT_EMBED_BATCH_SIZE", "4")
+    for i in range(8):
+        (repo / f"m{i}.py").write_text(f"VALUE_{i} = {i}\n")
+    (repo / "long.py").write_text("x = 1\n" * 600)  # 3600 chars: 3 chunks
+    index, embeddings = _open(repo, tmp_path)
+    assert index.sync() == 11
+    # 2 + 8 + 3 = 13 chunks embedded four at a time.
+    assert embeddings.calls == 4
+    assert index.last_ingest.files == 11 and index.last_ingest.chunks == 13
+    assert index.collection.count() == 13
+    assert index.files[str(repo / "long.py")].chunks == 3
+
+def test_chunks_carry_symbol_and_line_range(repo, tmp_path):
+    (repo / "c.py").write_text("import os\n\ndef gamma():\n    return 3\n\nclass Delta:\n    pass\n")
+    index, _ = _open(repo, tmp_path)
+    index.sync()
+    metadatas = index.collection.get(where={"filepath": str(repo / "c.py")}, include=["metadatas"])["metadatas"]
+    ranges = sorted((m["symbol"], m["start_line"], m["end_line"]) for m in metadatas)
+    assert ranges == [("Delta", 6, 7), ("gamma", 1, 4)]
+
+class FakeIndex:
+    def __init__(self, root, chunks=10):
+        self.root = root
+        self.chunk_count = chunks
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_registry_evicts_least_recently_used_idle_roots(tmp_path):
+    registry = IndexRegistry(max_indexes=2, max_chunks=0, factory=FakeIndex)
+    a, b = registry.get("/ws/a"), registry.get("/ws/b")
+    registry.get("/ws/a")  # b is now the coldest
+    c = registry.get("/ws/c")
+    assert registry.peek("/ws/b") is None and b.closed and b.index.closed
+    assert registry.peek("/ws/a") is a and registry.peek("/ws/c") is c
+
+    with a.lock:  # a is busy, so c's neighbour goes first even though a is colder
+        registry.get("/ws/c")
+        registry.get("/ws/d")
+        assert registry.peek("/ws/a") is a and registry.peek("/ws/c") is None
+
+def test_registry_chunk_budget(tmp_path):
+    registry = IndexRegistry(max_indexes=10, max_chunks=25, factory=FakeIndex)
+    for root in ("/ws/a", "/ws/b", "/ws/c"):
+        registry.get(root)
+    assert registry.peek("/ws/a") is None
+    assert registry.peek("/ws/b") is not None and registry.peek("/ws/c") is not None
+
+def test_chunk_count_does_not_wait_for_a_writer(repo, tmp_path):
+    index, _ = _open(repo, tmp_path)
+    index.sync()
+    (repo / "a.py").unlink()
+    with index._lexical_lock.write():  # a sync holding the write lock must not stall the registry
+        assert index.chunk_count == 2
+    index.sync()
+    assert index.chunk_count == 1 == sum(indexed.chunks for indexed in index.files.values())
+
+def _word_count(text, encoding_name=None):
+    return len(text.split())
+
+def test_roots_are_searched_in_separate_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "count_tokens", _word_count)
+    embeddings = CountingEmbeddings()
+    registry = IndexRegistry(factory=lambda root: SearchIndex(root, cache_dir=str(tmp_path / "cache"), embedding_function=embeddings))
+    monkeypatch.setattr(utils, "_index_registry", registry)
+    for name in ("one", "two"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f"{name}.py").write_text(f"def {name}():\n    pass\n")
+    for name in ("one", "two"):
+        hits = utils.get_relevant_snippets(name, str(tmp_path / name))
+        assert [hit["filename"] for hit in hits] == [str(tmp_path / name / f"{name}.py")]
+
+def test_merge_hits_joins_nearby_ranges_of_one_file():
+    hits = [
+        utils.SearchHit("/r/a.py", 11, 20, ("b",), 0.5, "b"),
+        utils.SearchHit("/r/a.py", 1, 8, ("a",), 0.2, "a"),
+        utils.SearchHit("/r/a.py", 40, 50, ("c",), 0.1, "c"),
+        utils.SearchHit("/r/b.py", 1, 5, ("d",), 0.3, "d"),
+    ]
+    merged = utils.merge_hits(hits)
+    assert [(h.filepath, h.start_line, h.end_line, h.symbols, h.score) for h in merged] == [
+        ("/r/a.py", 1, 20, ("a", "b"), 0.5),
+        ("/r/b.py", 1, 5, ("d",), 0.3),
+        ("/r/a.py", 40, 50, ("c",), 0.1),
+    ]
+    assert merged[0].text is None and merged[2].text == "c"
+    # A context window makes the gap between 20 and 40 disappear.
+    assert [(h.start_line, h.end_line) for h in utils.merge_hits(hits, context_lines=10)] == [(1, 60), (1, 15)]
+
+def _search_repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "count_tokens", _word_count)
+    registry = IndexRegistry(factory=lambda root: SearchIndex(root, cache_dir=str(tmp_path / "cache"), embedding_function=CountingEmbeddings()))
+    monkeypatch.setattr(utils, "_index_registry", registry)
+    root = tmp_path / "ws"
+    root.mkdir()
+    body = "".join(f"def f{i}():\n" + "    x = 1\n" * 30 + "\n" for i in range(3))
+    (root / "mod.py").write_text(body)
+    return root
+
+def test_snippets_are_chunks_with_line_ranges(tmp_path, monkeypatch):
+    root = _search_repo(tmp_path, monkeypatch)
+    snippets = utils.get_relevant_snippets("f1", str(root), top_k=1)
+    assert len(snippets) == 1
+    snippet = snippets[0]
+    start, end = map(int, snippet["lines"].split("-"))
+    lines = (root / "mod.py").read_text().splitlines()
+    assert snippet["snippet"] == "\n".join(lines[start - 1:end])
+    assert snippet["symbols"] and end - start < 40
+
+def test_snippets_of_one_file_are_merged_and_budgeted(tmp_path, monkeypatch):
+    root = _search_repo(tmp_path, monkeypatch)
+    snippets = utils.get_relevant_snippets("f", str(root), top_k=3)
+    assert len(snippets) == 1 and snippets[0]["lines"] == "1-95"
+    assert sorted(snippets[0]["symbols"]) == ["f0", "f1", "f2"]
+    # With context the window is clamped to the file (96 lines, the last one blank).
+    snippets = utils.get_relevant_snippets("f", str(root), top_k=1, context_lines=500)
+    assert snippets[0]["lines"] == "1-96"
+    small = utils.get_relevant_snippets("f", str(root), top_k=3, max_tokens=50)
+    assert len(small) == 1 and "more lines]" in small[0]["snippet"]
+
+def test_identifier_queries_skip_the_embedding_model(repo, tmp_path):
+    (repo / "c.py").write_text("_INDEX_CACHE_TTL = 300\n")
+    index, embeddings = _open(repo, tmp_path)
+    index.sync()
+    index.close()
+    index, embeddings = _open(repo, tmp_path)  # the lexical index is rebuilt from the stored chunks
+    index.sync()
+    calls = embeddings.calls
+    hits = index.search("_INDEX_CACHE_TTL")
+    assert [(hit.filepath, hit.start_line) for hit in hits] == [(str(repo / "c.py"), 1)]
+    assert embeddings.calls == calls
+    # Other queries fuse both rankings.
+    hits = index.search("return a value", n_results=2)
+    assert embeddings.calls == calls + 1 and len(hits) == 2
+
+class BlockingEmbeddings(CountingEmbeddings):
+    """Embeddings that wait for a signal once blocking is switched on."""
+
+    def __init__(self):
+        super().__init__()
+        self.block = False
+        self.entered = threading.Event()
+        self.proceed = threading.Event()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self.block:
+            self.entered.set()
+            self.proceed.wait(5)
+        return super().__call__(input)
+
+def test_searches_use_the_previous_generation_while_a_sync_runs(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "count_tokens", _word_count)
+    embeddings = BlockingEmbeddings()
+    registry = IndexRegistry(factory=lambda root: SearchIndex(root, cache_dir=str(tmp_path / "cache"), embedding_function=embeddings))
+    monkeypatch.setattr(utils, "_index_registry", registry)
+    assert utils.get_relevant_snippets("alpha", str(repo))[0]["snippet"] == "def alpha():\n    return 1"
+
+    (repo / "a.py").write_text("def alpha():\n    return 10\n")
+    entry = registry.peek(str(repo))
+    entry.last_sync -= utils._INDEX_CACHE_TTL + 1  # stale: the next search schedules a re-sync
+    embeddings.block = True
+    started = time.perf_counter()
+    # The re-sync blocks in the embedding model, but searches are answered from the old chunks.
+    assert utils.get_relevant_snippets("alpha", str(repo))[0]["snippet"] == "def alpha():\n    return 1"
+    assert embeddings.entered.wait(5) and entry.syncing
+    assert utils.get_relevant_snippets("alpha", str(repo))[0]["snippet"] == "def alpha():\n    return 1"
+    assert time.perf_counter() - started < 2
+    embeddings.proceed.set()
+    with entry.lock:  # wait for the sync to finish
+        pass
+    assert utils.get_relevant_snippets("alpha", str(repo))[0]["snippet"] == "def alpha():\n    return 10"
+    assert entry.index.collection.count() == 2
+
+def test_read_write_lock_admits_concurrent_readers():
+    lock = utils.ReadWriteLock()
+    events = []
+    def write():
+        with lock.write():
+            events.append("write")
+    with lock.read():
+        with lock.read():  # a second reader does not wait
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(0.1)
+            assert events == []  # the writer waits for the readers
+    writer.join(1)
+    assert events == ["write"]
+
+def test_identical_chunks_are_embedded_once_across_workspaces(repo, tmp_path):
+    index, embeddings = _open(repo, tmp_path)
+    index.sync()
+    assert index.last_ingest.cached == 0
+    clone = tmp_path / "clone"
+    clone.mkdir()
+    for name in ("a.py", "b.py"):
+        (clone / name).write_text((repo / name).read_text())
+    calls = embeddings.calls
+    other = SearchIndex(str(clone), cache_dir=str(tmp_path / "cache"), embedding_function=embeddings)
+    assert other.sync() == 2
+    assert embeddings.calls == calls  # every vector came from the shared cache
+    assert other.last_ingest.cached == 2 and other.collection.count() == 2
+
+def test_search_results_are_cached_until_files_change(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "count_tokens", _word_count)
+    monkeypatch.setattr(utils, "_search_cache", utils.SearchResultCache(max_entries=8))
+    embeddings = CountingEmbeddings()
+    registry = IndexRegistry(factory=lambda root: SearchIndex(root, cache_dir=str(tmp_path / "cache"), embedding_function=embeddings))
+    monkeypatch.setattr(utils, "_index_registry", registry)
+    first = utils.get_relevant_snippets("return the value", str(repo))
+    calls = embeddings.calls
+    again = utils.get_relevant_snippets("  Return the VALUE ", str(repo))
+    assert again == first and embeddings.calls == calls  # no query embedding
+    assert utils.search_cache_stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    # A write reported by the orchestrator invalidates the root's results right away.
+    (repo / "a.py").write_text("def alpha():\n    return 10\n")
+    update = utils.mark_files_changed(str(repo), [str(repo / "a.py")])
+    utils.get_relevant_snippets("return the value", str(repo))
+    assert utils.search_cache_stats()["misses"] == 2
+    update.join(5)
+
+    # So does a change of the index itself, e.g. from the watcher.
+    utils.get_relevant_snippets("return the value", str(repo))
+    hits = utils.search_cache_stats()["hits"]
+    utils.update_search_index(str(repo), [str(repo / "b.py")])  # unchanged: same generation
+    utils.get_relevant_snippets("return the value", str(repo))
+    assert utils.search_cache_stats()["hits"] == hits + 1
+    (repo / "b.py").unlink()
+    utils.update_search_index(str(repo), [str(repo / "b.py")])
+    snippets = utils.get_relevant_snippets("return the value", str(repo))
+    assert utils.search_cache_stats()["hits"] == hits + 1
+    assert all(not s["filename"].endswith("b.py") for s in snippets)
+
+def test_warm_search_loads_the_model_and_syncs_roots(repo, tmp_path, monkeypatch):
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(utils, "_embedding_function", embeddings)
+    registry = IndexRegistry(factory=lambda root: SearchIndex(root, cache_dir=str(tmp_path / "cache"), embedding_function=utils._default_embedding_function()))
+    monkeypatch.setattr(utils, "_index_registry", registry)
+    utils.warm_search([str(repo)]).join(5)
+    assert embeddings.documents[0] == "warm up"
+    entry = registry.peek(str(repo))
+    assert entry.ready.is_set() and entry.index.chunk_count == 2
+
+def test_importing_search_utils_defers_chromadb():
+    code = "import sys, backend.utils, backend.repo_map; print(sorted({'chromadb', 'numpy', 'bs4'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,74 @@
+import pytest
+from backend.repo_map import RepoMap
+from backend.static_check import StaticChecker, static_notes, static_review
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (tmp_path / "pkg" / "core.py").write_text("LIMIT = 3\n\ndef run():\n    return LIMIT\n\nclass Engine:\n    pass\n")
+    (tmp_path / "pkg" / "cli.py").write_text("from pkg.core import run\n")
+    rm = RepoMap(str(tmp_path), use_cache=False)
+    rm.build_map()
+    return tmp_path, rm.repo_map
+
+def _messages(problems):
+    return [(p.line, p.message) for p in problems]
+
+def test_python_syntax_and_undefined_names():
+    checker = StaticChecker()
+    assert _messages(checker.check("a.py", "def f(:\n    pass\n")) == [(1, "syntax error: invalid syntax")]
+    code = "import os\n\ndef f(x):\n    try:\n        return os.sep + x + y\n    except ValueError as e:\n        raise e\n"
+    assert _messages(checker.check("a.py", code)) == [(5, "undefined name 'y'")]
+    assert checker.check("a.py", "from os import *\nprint(sep)\n") == []
+
+def test_imports_are_resolved_against_the_repository(repo):
+    root, repo_map = repo
+    checker = StaticChecker(str(root), repo_map)
+    good = "import json\nimport pkg.core\nfrom pkg import cli\nfrom pkg.core import LIMIT, Engine, run\nfrom .core import run as go\n"
+    assert checker.check(str(root / "pkg" / "new.py"), good) == []
+    bad = "from pkg.core import walk\nimport pkg.missing\n"
+    assert _messages(checker.check(str(root / "pkg" / "new.py"), bad)) == [
+        (1, "cannot import name 'walk' from 'pkg.core'"), (2, "no module named 'pkg.missing' in the repository"),
+    ]
+    # Names of modules changed in the same update may not exist yet and are not checked.
+    pending = StaticChecker(str(root), repo_map, pending=[str(root / "pkg" / "core.py")])
+    assert pending.check(str(root / "pkg" / "new.py"), "from pkg.core import walk\n") == []
+
+def test_markers_fences_json_and_html():
+    checker = StaticChecker()
+    conflict = "a = 1\n<<<<<<< HEAD\nb = 2\n=======\nb = 3\n>>>>>>> branch\n"
+    assert (2, "merge conflict marker") in _messages(checker.check("a.py", conflict))
+    assert _messages(checker.check("app.js", "```javascript\nlet a = 1;\n```\n")) == [(1, "code fence around the file content")]
+    assert checker.check("README.md", "```python\nx = 1\n```\n") == []
+    assert _messages(checker.check("a.json", '{"a": 1,}')) == [(1, "invalid JSON: Expecting property name enclosed in double quotes")]
+    assert checker.check("a.html", "<ul><li>one<li>two</ul><p>text<br></p>") == []
+    assert _messages(checker.check("a.html", "<div>\n<span>text</div>\n")) == [(2, "<span> is not closed before </div>")]
+
+def test_heading_underlines_and_templates_are_not_flagged():
+    checker = StaticChecker()
+    assert checker.check("m.py", '"""\nTitle\n=======\n"""\n') == []
+    template = '{% if a %}<div class="a">{% else %}<div class="b">{% endif %}{{ body }}</div>'
+    assert checker.check("page.html", template) == []
+
+def test_modules_missing_from_the_map_are_resolved_on_disk(repo):
+    root, repo_map = repo
+    (root / "pkg" / "broken.py").write_text("def f(:\n")  # unparseable, so not in the map
+    (root / "pkg" / "ext.pyi").write_text("def fast() -> int: ...\n")
+    (root / "pkg" / "native.cpython-311-x86_64-linux-gnu.so").write_bytes(b"")
+    checker = StaticChecker(str(root), repo_map)
+    code = "import pkg.broken\nfrom pkg import ext, native\nfrom pkg.ext import fast\n"
+    assert checker.check(str(root / "pkg" / "new.py"), code) == []
+
+def test_class_and_module_dunders_are_defined():
+    code = "class A:\n    name = __qualname__\n    where = __module__\n\nprint(__all__, __cached__)\n"
+    assert StaticChecker().check("a.py", code) == []
+
+def test_only_definite_problems_fail_without_review():
+    assert static_review([]) is None
+    advisory = StaticChecker().check("a.py", "print(undefined)\n")
+    assert [p.advisory for p in advisory] == [True]
+    assert static_review(advisory) is None and static_notes(advisory) == "a.py:1: undefined name 'undefined'"
+    errors = StaticChecker().check("a.py", "print(undefined\n")
+    review = static_review(errors + advisory)
+    assert not review.passed and "a.py:1: syntax error" in review.feedback and "undefined name" not in review.feedback
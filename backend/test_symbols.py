@@ -0,0 +1,49 @@
+import pytest
+from backend.repo_map import RepoMap
+from backend.symbols import definition_source
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "__init__.py").write_text("")
+    (root / "pkg" / "index.py").write_text(
+        "class SearchIndex:\n"
+        "    def add(self, doc):\n"
+        "        pass\n"
+        "\n"
+        "    @staticmethod\n"
+        "    def query(text):\n"
+        "        return [text]\n"
+        "\n"
+        "def query(text):\n"
+        "    return SearchIndex.query(text)\n"
+    )
+    (root / "pkg" / "app.py").write_text("from .index import SearchIndex\n\ndef main():\n    pass\n")
+    return root
+
+def test_find_symbol_by_bare_qualified_and_module_name(repo):
+    rm = RepoMap(str(repo), use_cache=False)
+    rm.build_map()
+    symbols = rm.symbol_index()
+
+    method = symbols.find("SearchIndex.query")
+    assert [(d.rel_path, d.kind, d.lineno, d.end_lineno) for d in method] == [("pkg/index.py", "method", 5, 7)]
+    assert definition_source(method[0], str(repo)) == "    @staticmethod\n    def query(text):\n        return [text]"
+    assert symbols.references(method[0]) == ["pkg/app.py"]
+
+    assert [d.qualname for d in symbols.find("query")] == ["SearchIndex.query", "query"]
+    assert [d.kind for d in symbols.find("pkg.index.query")] == ["function"]
+    assert symbols.find("missing") == []
+
+def test_symbol_index_follows_refresh(repo):
+    rm = RepoMap(str(repo), use_cache=False)
+    rm.build_map()
+    assert rm.symbol_index().find("main")
+
+    (repo / "pkg" / "app.py").write_text("def run():\n    pass\n")
+    rm.refresh(["pkg/app.py"])
+    symbols = rm.symbol_index()
+    assert symbols.find("main") == []
+    assert [d.rel_path for d in symbols.find("run")] == ["pkg/app.py"]
+    assert symbols.references(symbols.find("SearchIndex")[0]) == []
@@ -0,0 +1,121 @@
+import sys
+import threading
+import pytest
+from backend.repo_map import RepoMap
+from backend.watcher import WorkspaceWatcher, get_repo_map, stop_watchers, watch_root
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def alpha(x):\n    return x\n")
+    (root / "b.py").write_text("def beta():\n    pass\n")
+    return root
+
+class Batches:
+    """Collects the batches delivered to a watcher subscriber."""
+
+    def __init__(self):
+        self.batches = []
+        self.event = threading.Event()
+
+    def __call__(self, paths):
+        self.batches.append(paths)
+        self.event.set()
+
+    def wait(self, timeout=5):
+        assert self.event.wait(timeout), "no change batch delivered"
+        self.event.clear()
+        return self.batches[-1]
+
+def _start(root, use_inotify):
+    watcher = WorkspaceWatcher(str(root), debounce=0.05, poll_interval=0.05, use_inotify=use_inotify)
+    watcher.workspace._is_git = False
+    watcher.start()
+    return watcher
+
+@pytest.mark.parametrize("use_inotify", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")),
+])
+def test_watcher_coalesces_changes_into_one_batch(repo, use_inotify):
+    watcher = _start(repo, use_inotify)
+    try:
+        assert watcher.backend.name == ("inotify" if use_inotify else "polling")
+        batches = Batches()
+        watcher.subscribe(batches)
+        (repo / "a.py").write_text("def alpha(x, y):\n    return x\n")
+        (repo / "a.py").write_text("def alpha(x, y, z):\n    return x\n")
+        (repo / "c.py").write_text("def gamma():\n    pass\n")
+        (repo / "b.py").unlink()
+        changed = batches.wait()
+        # Events that arrive in two polls may be split; collect until every path was reported.
+        while not {str(repo / "a.py"), str(repo / "b.py"), str(repo / "c.py")} <= changed:
+            changed = changed | batches.wait()
+        assert changed == {str(repo / "a.py"), str(repo / "b.py"), str(repo / "c.py")}
+    finally:
+        watcher.stop()
+
+def test_watched_repo_map_stays_current_and_is_shared(repo, tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEPILOT_CACHE_DIR", str(tmp_path / "cache"))
+    try:
+        watcher = watch_root(str(repo), debounce=0.05, poll_interval=0.05)
+        rm = get_repo_map(str(repo))
+        assert set(rm.repo_map) == {"a.py", "b.py"}
+        assert get_repo_map(str(repo)) is rm
+
+        batches = Batches()
+        watcher.subscribe(batches)
+        (repo / "c.py").write_text("def gamma():\n    pass\n")
+        (repo / "b.py").unlink()
+        batches.wait()
+        while "b.py" in rm.repo_map or "c.py" not in rm.repo_map:
+            batches.wait()
+        assert rm.repo_map["c.py"].functions[0].name == "gamma"
+    finally:
+        stop_watchers()
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_watches_directories_that_were_empty_at_startup(repo):
+    (repo / "empty").mkdir()
+    watcher = _start(repo, True)
+    try:
+        batches = Batches()
+        watcher.subscribe(batches)
+        (repo / "empty" / "new.py").write_text("x = 1\n")
+        changed = batches.wait()
+        assert changed is not None and str(repo / "empty" / "new.py") in changed
+    finally:
+        watcher.stop()
+
+def test_a_cold_repo_map_build_does_not_block_other_roots(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEPILOT_CACHE_DIR", str(tmp_path / "cache"))
+    slow, fast = tmp_path / "slow", tmp_path / "fast"
+    for root in (slow, fast):
+        root.mkdir()
+        (root / "a.py").write_text("def alpha():\n    pass\n")
+    building, release = threading.Event(), threading.Event()
+    build_map = RepoMap.build_map
+
+    def blocking_build(self):
+        if self.root_dir == str(slow):
+            building.set()
+            assert release.wait(10)
+        return build_map(self)
+
+    monkeypatch.setattr(RepoMap, "build_map", blocking_build)
+    try:
+        thread = threading.Thread(target=get_repo_map, args=(str(slow),))
+        thread.start()
+        assert building.wait(5)
+        maps = []
+        other = threading.Thread(target=lambda: maps.append(get_repo_map(str(fast))))
+        other.start()
+        other.join(3)
+        assert maps and set(maps[0].repo_map) == {"a.py"}  # while slow is still building
+        release.set()
+        thread.join(5)
+        assert get_repo_map(str(slow)) is get_repo_map(str(slow))
+    finally:
+        release.set()
+        stop_watchers()
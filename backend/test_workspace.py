@@ -0,0 +1,58 @@
+import os
+import shutil
+import subprocess
+import pytest
+from backend.workspace import Workspace
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "ws"
+    (root / "src" / "gen").mkdir(parents=True)
+    (root / "node_modules" / "pkg").mkdir(parents=True)
+    (root / ".gitignore").write_text("node_modules/\n*.log\n")
+    (root / "src" / ".gitignore").write_text("gen/\n!keep.log\n")
+    (root / "main.py").write_text("")
+    (root / "debug.log").write_text("")
+    (root / "node_modules" / "pkg" / "index.js").write_text("")
+    (root / "src" / "app.py").write_text("")
+    (root / "src" / "keep.log").write_text("")
+    (root / "src" / "gen" / "out.py").write_text("")
+    return root
+
+def _rel_paths(workspace, extensions=None):
+    return sorted(record.rel_path.replace(os.sep, "/") for record in workspace.iter_files(extensions))
+
+def test_walk_applies_scoped_gitignore_rules(tree):
+    workspace = Workspace(str(tree))
+    workspace._is_git = False
+    assert _rel_paths(workspace) == [".gitignore", "main.py", "src/.gitignore", "src/app.py", "src/keep.log"]
+    assert _rel_paths(workspace, (".py",)) == ["main.py", "src/app.py"]
+    assert workspace.is_ignored("src/gen/out.py")
+    assert workspace.is_ignored(str(tree / "node_modules" / "pkg" / "index.js"))
+    assert not workspace.is_ignored("src/keep.log")
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_git_fast_path_matches_walk(tree):
+    subprocess.run(["git", "init", "-q", str(tree)], check=True)
+    workspace = Workspace(str(tree))
+    assert workspace.is_git
+    walked = Workspace(str(tree))
+    walked._is_git = False
+    assert _rel_paths(workspace) == _rel_paths(walked)
+    assert workspace.is_ignored("src/gen/out.py")
+    assert not workspace.is_ignored("src/app.py")
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_is_ignored_many_checks_git_rules_in_one_call(tree, monkeypatch):
+    subprocess.run(["git", "init", "-q", str(tree)], check=True)
+    workspace = Workspace(str(tree))
+    assert workspace.is_git
+    calls = []
+    run = subprocess.run
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: calls.append(args) or run(*args, **kwargs))
+    paths = ["main.py", "debug.log", "src/gen/out.py", str(tree / "src" / "keep.log"), "node_modules/pkg/index.js", "../outside.py"]
+    assert workspace.is_ignored_many(paths) == {"debug.log", "src/gen/out.py", "node_modules/pkg/index.js", "../outside.py"}
+    assert len(calls) == 1
+    walked = Workspace(str(tree))
+    walked._is_git = False
+    assert walked.is_ignored_many(paths) == workspace.is_ignored_many(paths)
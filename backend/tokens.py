@@ -0,0 +1,25 @@
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+# Encoding used when no model is given or the model is unknown to tiktoken (GPT-4o family).
+DEFAULT_ENCODING = "o200k_base"
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> "tiktoken.Encoding":
+    """Return a tiktoken encoding, loading it only once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+@lru_cache(maxsize=None)
+def encoding_name_for_model(model_name: Optional[str] = None) -> str:
+    """Return the tiktoken encoding name for a model, or DEFAULT_ENCODING if it is unknown."""
+    if not model_name:
+        return DEFAULT_ENCODING
+    try:
+        return tiktoken.encoding_name_for_model(model_name)
+    except (KeyError, AttributeError):
+        return DEFAULT_ENCODING
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Count the tokens of text with the given tiktoken encoding."""
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
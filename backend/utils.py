@@ -1,49 +1,38 @@
 import os
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
 from backend.models.shared import RelevantFiles
-from typing import List, Dict, Optional, Any
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Dict, NamedTuple, Optional, Any, Tuple
 import time
-from pathspec import PathSpec
-from pathspec.patterns import GitWildMatchPattern
 import logging
 import glob
 import json
+import re
 from backend.agents.models import CodeChunkUpdate
+from backend.chunking import MAX_CHUNK_CHARS, Chunk, chunk_source
+from backend.cache import file_digest, get_cache_dir, root_cache_key
+from backend.config import env_int
+from backend.workspace import Workspace, WorkspaceFile
+from backend.watcher import find_watcher
+from backend.readers import iter_lines, max_context_bytes, read_text, truncation_notice
+from backend.lexical import LexicalIndex, reciprocal_rank_fusion
+from backend.tokens import count_tokens
 import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import weakref
+import itertools
 import backoff
 
+# chromadb and numpy (through the embedding cache) take most of a second to import, so they are
+# imported when the first SearchIndex is opened rather than by everything that imports this module.
+if TYPE_CHECKING:
+    from backend.embedding_cache import EmbeddingCache
+
 logger = logging.getLogger(__name__)
 
-# Cache for index
-_index_cache = None
-_last_index_update = 0
+# Watchers that already forward their changes to update_search_index.
+_subscribed_watchers = weakref.WeakSet()
+# Re-sync interval for roots without a workspace watcher; watched roots are updated per file instead.
 _INDEX_CACHE_TTL = 300  # 5 minutes
-_index_lock = threading.Lock()
-
-def _get_gitignore_spec(root_directory: str) -> PathSpec:
-    """Build a PathSpec from all .gitignore files in the directory tree."""
-    gitignore_patterns = []
-    
-    # Walk up the directory tree looking for .gitignore files
-    current_dir = root_directory
-    while True:
-        gitignore_path = os.path.join(current_dir, '.gitignore')
-        if os.path.isfile(gitignore_path):
-            try:
-                with open(gitignore_path, 'r') as f:
-                    patterns = f.readlines()
-                    gitignore_patterns.extend(p.strip() for p in patterns if p.strip() and not p.startswith('#'))
-            except:
-                pass
-                
-        parent_dir = os.path.dirname(current_dir)
-        if parent_dir == current_dir:  # Reached root
-            break
-        current_dir = parent_dir
-        
-    return PathSpec.from_lines(GitWildMatchPattern, gitignore_patterns)
 
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
     """Splits the text into chunks with specified overlap."""
@@ -58,68 +47,562 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str
         start += chunk_size - overlap  # move start forward with overlap
     return chunks
 
-class SearchIndex:
-    _instance = None
-    _lock = threading.Lock()
+class IndexedFile(NamedTuple):
+    """What the search index knows about one indexed file."""
+    hash: str
+    mtime: int
+    size: int
+    chunks: int
+
+class IngestStats(NamedTuple):
+    """Outcome of one bulk ingestion."""
+    files: int
+    chunks: int
+    seconds: float
+    cached: int = 0  # chunks whose vectors came from the embedding cache
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+def embed_batch_size() -> int:
+    """Chunks per embedding call, from CODEPILOT_EMBED_BATCH_SIZE."""
+    return env_int("CODEPILOT_EMBED_BATCH_SIZE", 128) or 128
+
+# Chunks per collection write (capped by the collection's own limit).
+WRITE_BATCH_SIZE = 4096
+# Bumped when the stored chunk format changes, so indexes written by older versions are rebuilt.
+SEARCH_INDEX_VERSION = 2
 
-    def __new__(cls):
-        with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(SearchIndex, cls).__new__(cls)
-                cls._instance._initialized = False
-            return cls._instance
+# Ranking modes of SearchIndex.search. auto answers identifier-like queries lexically and the rest with hybrid.
+SEARCH_MODES = ("auto", "lexical", "vector", "hybrid")
+
+class SearchHit(NamedTuple):
+    """A matched chunk, or several merged ones, of one file."""
+    filepath: str
+    start_line: int
+    end_line: int
+    symbols: Tuple[str, ...]
+    score: float  # higher is better; only comparable within one result list
+    text: Optional[str]  # the chunk text, or None when the lines must be read from the file
+
+def _is_identifier_query(query: str) -> bool:
+    """True for a single identifier or dotted name, e.g. "send_usage" or "SearchIndex.query"."""
+    return re.fullmatch(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*(?:\(\))?", query.strip()) is not None
+
+# Source of index generations: every content change of any SearchIndex takes a new, unique value.
+_generations = itertools.count(1)
+
+class ReadWriteLock:
+    """Any number of readers or one writer. A waiting writer holds off new readers, so writers cannot starve."""
 
     def __init__(self):
-        if self._initialized:
-            return
-            
-        with self._lock:
-            if not self._initialized:
-                self.client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
-                self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
-                self._create_collection()
-                self._initialized = True
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class SearchIndex:
+    """
+    Persistent embedding index of one workspace root.
+
+    Files are split into symbol-aligned chunks (see backend.chunking) and stored in an on-disk
+    chroma collection under the cache directory. Each chunk is tagged with its symbol and line
+    range and with its file's path, content hash, mtime and size. sync() compares the workspace against
+    those tags and only deletes and re-embeds chunks of files that were added, changed or
+    removed, so reopening an unchanged repository does no embedding work.
+
+    A LexicalIndex over the same chunks is kept in memory alongside the collection, so
+    identifier lookups are answered by BM25 without running the embedding model.
+
+    Searches may run while the index is being updated (by one writer at a time) and see the
+    previous generation of a file until its new chunks are complete: changed files are
+    re-embedded and upserted over their old chunk ids before the leftover ids are deleted, and
+    their lexical entries are swapped in under a short write lock.
+
+    generation changes whenever the indexed content does, so cached search results can be validated.
+    """
+
+    def __init__(self, root_directory: str = ".", cache_dir: Optional[str] = None, embedding_function=None, embedding_cache: Optional["EmbeddingCache"] = None):
+        import chromadb
+        from chromadb.config import Settings
+        from backend.embedding_cache import embedding_model_id, get_embedding_cache
+
+        self.root_directory = os.path.abspath(root_directory)
+        self.workspace = Workspace(self.root_directory)
+        cache_dir = cache_dir or get_cache_dir()
+        self.path = os.path.join(cache_dir, f"search_v{SEARCH_INDEX_VERSION}_{root_cache_key(self.root_directory)}")
+        self.client = chromadb.PersistentClient(path=self.path, settings=Settings(anonymized_telemetry=False))
+        self.embedding_function = embedding_function or _default_embedding_function()
+        # Chunk vectors are shared by every workspace through the content-addressed cache.
+        self.embedding_cache = embedding_cache or get_embedding_cache(
+            os.path.join(cache_dir, "embeddings"), embedding_model_id(self.embedding_function)
+        )
+        self._create_collection()
+        self.lexical = LexicalIndex()
+        self._lexical_lock = ReadWriteLock()
+        self.generation = next(_generations)
+        self.files: Dict[str, IndexedFile] = self._load_files()
+        # Kept in step with files so chunk_count can be read without the lexical lock.
+        self._chunk_total = sum(indexed.chunks for indexed in self.files.values())
+        self.last_ingest: Optional[IngestStats] = None
     
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def _create_collection(self):
-        try:
-            self.collection = self.client.create_collection(
-                name='code_documents',
-                embedding_function=self.embedding_function
-            )
-        except Exception as e:
-            logger.warning(f"Failed to create collection: {e}")
-            # If collection exists, try getting it
-            try:
-                self.collection = self.client.get_collection(
-                    name='code_documents',
-                    embedding_function=self.embedding_function
-                )
-            except Exception as inner_e:
-                logger.error(f"Could not create or get collection: {inner_e}")
-                raise
+        self.collection = self.client.get_or_create_collection(
+            name='code_documents',
+            embedding_function=self.embedding_function
+        )
+
+    def _load_files(self) -> Dict[str, IndexedFile]:
+        """Rebuild the per-file bookkeeping and the lexical index from the chunks stored in the collection."""
+        files = {}
+        stored = self.collection.get(include=["metadatas", "documents"])
+        for chunk_id, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            filepath = metadata.get("filepath") if metadata else None
+            if filepath is None or "hash" not in metadata:
+                continue
+            self.lexical.add(chunk_id, document, metadata)
+            known = files.get(filepath)
+            # Chunks of two versions of a file (an interrupted update) clear its hash, so sync re-embeds it.
+            digest = metadata["hash"] if known is None or known.hash == metadata["hash"] else ""
+            files[filepath] = IndexedFile(digest, metadata["mtime"], metadata["size"], (known.chunks if known else 0) + 1)
+        return files
     
+    def add_file(self, filepath: str, content: str, max_chars: int = MAX_CHUNK_CHARS, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Chunk, embed and store one file. Returns the number of chunks. Use add_files for many files."""
+        return self.add_files([(filepath, content, metadata)], max_chars=max_chars).chunks
+
+    def add_files(self, files: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]], max_chars: int = MAX_CHUNK_CHARS) -> "IngestStats":
+        """Bulk ingestion of (filepath, content, metadata) items, chunked with chunk_source. See add_chunks."""
+        return self.add_chunks(
+            (filepath, chunk_source(filepath, content, max_chars), metadata)
+            for filepath, content, metadata in files
+        )
+
+    def add_chunks(self, files: Iterable[Tuple[str, List[Chunk], Optional[Dict[str, Any]]]]) -> "IngestStats":
+        """
+        Embed the chunks of many (filepath, chunks, metadata) items together in batches of
+        embed_batch_size() and write them to the collection in batches of up to WRITE_BATCH_SIZE.
+        Each chunk's metadata is the file's metadata plus its symbol and line range. Chunks
+        replace those stored under the same ids; the lexical entries of the given files are
+        replaced once all their chunks are written.
+        """
+        start = time.perf_counter()
+        hits = self.embedding_cache.hits
+        embed_batch = embed_batch_size()
+        write_batch = min(WRITE_BATCH_SIZE, self.client.get_max_batch_size())
+        ids, documents, metadatas, embeddings = [], [], [], []
+        filepaths, staged = [], []
+        n_chunks = 0
+        for filepath, chunks, metadata in files:
+            metadata = {**(metadata or {}), "filepath": filepath}
+            filepaths.append(filepath)
+            for i, chunk in enumerate(chunks):
+                ids.append(f"{filepath}::chunk{i}")
+                documents.append(chunk.text)
+                metadatas.append({**metadata, "symbol": chunk.symbol, "start_line": chunk.start_line, "end_line": chunk.end_line})
+                staged.append((ids[-1], chunk.text, metadatas[-1]))
+                if len(documents) - len(embeddings) >= embed_batch:
+                    embeddings.extend(self._embed(documents[len(embeddings):]))
+                if len(embeddings) >= write_batch:
+                    n_chunks += self._write(ids, documents, metadatas, embeddings, write_batch)
+        if len(documents) > len(embeddings):
+            embeddings.extend(self._embed(documents[len(embeddings):]))
+        while ids:
+            n_chunks += self._write(ids, documents, metadatas, embeddings, write_batch)
+        with self._lexical_lock.write():
+            for filepath in filepaths:
+                self.lexical.remove_file(filepath)
+            for chunk_id, text, metadata in staged:
+                self.lexical.add(chunk_id, text, metadata)
+            if filepaths:
+                self.generation = next(_generations)
+        # Approximate if other indexes share the cache concurrently; only used for reporting.
+        cached = min(n_chunks, self.embedding_cache.hits - hits)
+        stats = IngestStats(len(filepaths), n_chunks, time.perf_counter() - start, cached)
+        if n_chunks:
+            logger.info(
+                f"Indexed {stats.chunks} chunks from {stats.files} files in {stats.seconds:.2f}s "
+                f"({stats.chunks_per_second:.0f} chunks/sec, {stats.cached} from the embedding cache)."
+            )
+        self.last_ingest = stats
+        return stats
+
+    def _embed(self, documents: List[str]) -> List[Any]:
+        return self.embedding_cache.embed(documents, self._embed_uncached)
+
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
-    def add_file(self, filepath: str, content: str, chunk_size: int = 500, overlap: int = 100):
-        chunks = chunk_text(content, chunk_size=chunk_size, overlap=overlap)
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{filepath}::chunk{i}"
-            try:
-                self.collection.add(documents=[chunk], ids=[chunk_id])
-            except Exception as e:
-                logger.warning(f"Failed to add chunk {i} of {filepath}: {e}")
-                raise
+    def _embed_uncached(self, documents: List[str]) -> List[Any]:
+        return list(self.embedding_function(documents))
+
+    def _write(self, ids, documents, metadatas, embeddings, batch_size: int) -> int:
+        """Write the first batch_size embedded chunks to the collection and drop them from the lists."""
+        n = min(batch_size, len(embeddings))
+        self._add_batch(ids[:n], documents[:n], metadatas[:n], embeddings[:n])
+        for items in (ids, documents, metadatas, embeddings):
+            del items[:n]
+        return n
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
+    def _add_batch(self, ids, documents, metadatas, embeddings):
+        # upsert so that a retried batch cannot fail on ids it already wrote
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def remove_file(self, filepath: str):
+        """Delete every chunk of a file from the collection."""
+        self.remove_files([filepath])
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
+    def remove_files(self, filepaths: Iterable[str]):
+        """Delete every chunk of the given files with a single collection delete."""
+        filepaths = list(filepaths)
+        if not filepaths:
+            return
+        where = {"filepath": filepaths[0]} if len(filepaths) == 1 else {"filepath": {"$in": filepaths}}
+        self.collection.delete(where=where)
+        with self._lexical_lock.write():
+            for filepath in filepaths:
+                removed = self.files.pop(filepath, None)
+                if removed is not None:
+                    self._chunk_total -= removed.chunks
+                self.lexical.remove_file(filepath)
+            self.generation = next(_generations)
+
+    def sync(self) -> int:
+        """
+        Bring the index up to date with the workspace: index new and changed files and drop
+        removed ones. Returns the number of files that were (re-)embedded.
+        """
+        seen = set()
+        changed = []
+        for record in self.workspace.iter_files(SEARCH_EXTENSIONS):
+            seen.add(record.path)
+            digest = self._changed_digest(record)
+            if digest is not None:
+                changed.append((record, digest))
+        self.remove_files(self.files.keys() - seen)
+        return self._reindex(changed)
+
+    def update_files(self, paths: Iterable[str]) -> int:
+        """Re-check the given absolute paths only. Returns the number of files that were (re-)embedded."""
+        changed, removed = [], []
+        paths = list(paths)
+        ignored = self.workspace.is_ignored_many(path for path in paths if path.endswith(SEARCH_EXTENSIONS))
+        for path in paths:
+            record = self.workspace.stat_file(path) if path.endswith(SEARCH_EXTENSIONS) and path not in ignored else None
+            if record is None:
+                if path in self.files:
+                    removed.append(path)
+                continue
+            digest = self._changed_digest(record)
+            if digest is not None:
+                changed.append((record, digest))
+        self.remove_files(removed)
+        return self._reindex(changed)
+
+    def _changed_digest(self, record: WorkspaceFile) -> Optional[str]:
+        """Return the content hash of a file that must be (re-)embedded, or None if its index entry is current."""
+        st = record.stat
+        known = self.files.get(record.path)
+        if known is not None and known.size == st.st_size and known.mtime == st.st_mtime_ns:
+            return None
+        digest = file_digest(record.path)
+        if digest is None:
+            return None
+        if known is not None and known.hash == digest:
+            # Touched but unchanged: refresh the stored mtime so the next sync trusts it again.
+            self._set_metadata(record.path, known._replace(mtime=st.st_mtime_ns))
+            return None
+        return digest
+
+    def _reindex(self, changed: List[Tuple[WorkspaceFile, str]]) -> int:
+        """
+        Replace the chunks of the given (record, content hash) pairs in one bulk ingestion. New
+        chunks overwrite the old ones in place and only the old ids beyond the new chunk count are
+        deleted afterwards, so a file stays searchable throughout.
+        """
+        items = []
+        stale_ids, emptied = [], []
+        indexed = {}
+        for record, digest in changed:
+            st = record.stat
+            content = _searchable_content(record.path)
+            chunks = chunk_source(record.path, content) if content else []
+            if chunks:
+                items.append((record.path, chunks, {"hash": digest, "mtime": st.st_mtime_ns, "size": st.st_size}))
+            elif record.path in self.files:
+                emptied.append(record.path)
+            old_chunks = self.files[record.path].chunks if record.path in self.files else 0
+            stale_ids.extend(f"{record.path}::chunk{i}" for i in range(len(chunks), old_chunks))
+            # Files without searchable content are remembered for this session only, as they have no chunks to tag.
+            indexed[record.path] = IndexedFile(digest, st.st_mtime_ns, st.st_size, len(chunks))
+        self.add_chunks(items)
+        if stale_ids:
+            self._delete_ids(stale_ids)
+        with self._lexical_lock.write():
+            for filepath in emptied:
+                self.lexical.remove_file(filepath)
+            for filepath, indexed_file in indexed.items():
+                known = self.files.get(filepath)
+                self._chunk_total += indexed_file.chunks - (known.chunks if known is not None else 0)
+            self.files.update(indexed)
+            if stale_ids or emptied:
+                self.generation = next(_generations)
+        return len(items)
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
+    def _delete_ids(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def _set_metadata(self, filepath: str, indexed: IndexedFile):
+        # update() merges metadata keys, so each chunk keeps its symbol and line range.
+        if indexed.chunks:
+            metadata = {"filepath": filepath, "hash": indexed.hash, "mtime": indexed.mtime, "size": indexed.size}
+            self.collection.update(
+                ids=[f"{filepath}::chunk{i}" for i in range(indexed.chunks)],
+                metadatas=[metadata] * indexed.chunks,
+            )
+        with self._lexical_lock.write():
+            known = self.files.get(filepath)
+            self._chunk_total += indexed.chunks - (known.chunks if known is not None else 0)
+            self.files[filepath] = indexed
+
+    @property
+    def chunk_count(self) -> int:
+        """
+        Number of chunks stored for this root, used to size the index registry's budget. Reads a
+        running total rather than taking the lexical lock, so the registry never waits on a writer.
+        """
+        return self._chunk_total
+
+    def close(self):
+        """Release the chroma client; the collection stays on disk for the next open."""
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
 
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def query(self, query_text: str, n_results: int = 10):
         return self.collection.query(query_texts=[query_text], n_results=n_results)
 
-def get_file_content(file_path: str, root_directory: str = None) -> str:
+    def search(self, query_text: str, n_results: int = 10, mode: str = "auto") -> List[SearchHit]:
+        """
+        Return up to n_results matching chunks, best first, ranked by mode (see SEARCH_MODES):
+        BM25 over the lexical index, embedding similarity, or both fused by reciprocal rank.
+        auto uses the lexical index alone for identifier-like queries that it matches.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        if mode == "auto":
+            if _is_identifier_query(query_text):
+                lexical = self._lexical_hits(query_text, n_results)
+                if lexical:
+                    return lexical
+            mode = "hybrid"
+        if mode == "lexical":
+            return self._lexical_hits(query_text, n_results)
+        if mode == "vector":
+            return self._vector_hits(query_text, n_results)
+        # Rank a wider candidate list from each side so the fusion has overlap to work with.
+        lexical = self._lexical_hits(query_text, 2 * n_results)
+        vector = self._vector_hits(query_text, 2 * n_results)
+        hits = {_hit_id(hit): hit for hit in vector + lexical}
+        fused = reciprocal_rank_fusion([[_hit_id(hit) for hit in lexical], [_hit_id(hit) for hit in vector]])
+        return [hits[hit_id]._replace(score=score) for hit_id, score in fused[:n_results]]
+
+    def _lexical_hits(self, query_text: str, n_results: int) -> List[SearchHit]:
+        hits = []
+        with self._lexical_lock.read():
+            for chunk_id, score in self.lexical.search(query_text, n_results):
+                document = self.lexical.documents[chunk_id]
+                symbols = (document.symbol,) if document.symbol else ()
+                hits.append(SearchHit(document.filepath, document.start_line, document.end_line, symbols, score, document.text))
+        return hits
+
+    def _vector_hits(self, query_text: str, n_results: int) -> List[SearchHit]:
+        if not self.lexical:
+            return []  # nothing indexed
+        results = self.query(query_text=query_text, n_results=n_results)
+        hits = []
+        for doc_id, document, metadata, distance in zip(
+            results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+        ):
+            metadata = metadata or {}
+            filepath = metadata.get("filepath", doc_id.split("::")[0])
+            start_line, end_line = metadata.get("start_line", 1), metadata.get("end_line", document.count("\n") + 1)
+            symbols = (metadata["symbol"],) if metadata.get("symbol") else ()
+            hits.append(SearchHit(filepath, start_line, end_line, symbols, 1.0 / (1.0 + distance), document))
+        return hits
+
+def _hit_id(hit: SearchHit) -> Tuple[str, int]:
+    return hit.filepath, hit.start_line
+
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+def _default_embedding_function():
+    """Return the embedding model shared by every open SearchIndex, loading it once."""
+    global _embedding_function
+    with _embedding_function_lock:
+        if _embedding_function is None:
+            from chromadb.utils import embedding_functions
+            _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        return _embedding_function
+
+class _IndexEntry:
+    """An open SearchIndex with its per-root writer lock, reader count and sync bookkeeping."""
+
+    def __init__(self, index: SearchIndex):
+        self.index = index
+        # Held while the index is synced or updated; searches run concurrently with it.
+        self.lock = threading.Lock()
+        # Searches in progress, guarded by the registry lock.
+        self.readers = 0
+        self.last_sync = 0.0
+        # Guards syncing and last_sync; a sync is scheduled at most once at a time.
+        self.sync_lock = threading.Lock()
+        self.syncing = False
+        # Set once the first sync finished; until then there is no generation to search.
+        self.ready = threading.Event()
+        # Set when the registry evicts the entry; holders of a stale reference must get() again.
+        self.closed = False
+
+class IndexRegistry:
+    """
+    Open search indexes keyed by normalized root path, least recently used first.
+
+    Opening more than max_indexes roots, or more than max_chunks chunks in total, closes the
+    coldest indexes that are not in use. Their collections stay on disk, so reopening one
+    later only re-checks the workspace instead of re-embedding it.
+    """
+
+    def __init__(self, max_indexes: Optional[int] = None, max_chunks: Optional[int] = None, factory=SearchIndex):
+        self.max_indexes = max_indexes if max_indexes is not None else env_int("CODEPILOT_MAX_OPEN_INDEXES", 4)
+        self.max_chunks = max_chunks if max_chunks is not None else env_int("CODEPILOT_MAX_OPEN_INDEX_CHUNKS", 500_000)
+        self.factory = factory
+        self._entries: "OrderedDict[str, _IndexEntry]" = OrderedDict()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, root_directory: str) -> _IndexEntry:
+        """Return the entry for a root, opening its index if needed, and mark it most recently used."""
+        root_directory = os.path.abspath(root_directory)
+        with self._lock:
+            entry = self._entries.get(root_directory)
+            if entry is not None:
+                self._entries.move_to_end(root_directory)
+                return entry
+            opening = self._opening.setdefault(root_directory, threading.Lock())
+        # Open outside the registry lock so a slow open does not block other roots.
+        with opening:
+            with self._lock:
+                entry = self._entries.get(root_directory)
+            if entry is None:
+                try:
+                    entry = _IndexEntry(self.factory(root_directory))
+                    with self._lock:
+                        self._entries[root_directory] = entry
+                finally:
+                    with self._lock:
+                        self._opening.pop(root_directory, None)
+        self.evict()
+        return entry
+
+    def acquire(self, root_directory: str) -> _IndexEntry:
+        """get() the entry for a root and register a reader on it, so it is not evicted until release()."""
+        while True:
+            entry = self.get(root_directory)
+            with self._lock:
+                if not entry.closed:
+                    entry.readers += 1
+                    return entry
+            # Evicted between get() and registering: reopen.
+
+    def release(self, entry: _IndexEntry):
+        with self._lock:
+            entry.readers -= 1
+
+    def peek(self, root_directory: str) -> Optional[_IndexEntry]:
+        """Return the entry for a root if its index is open, without opening it or changing its recency."""
+        with self._lock:
+            return self._entries.get(os.path.abspath(root_directory))
+
+    def evict(self):
+        """Close least recently used indexes that are not in use until the registry fits its budget."""
+        closed = []
+        with self._lock:
+            total = sum(entry.index.chunk_count for entry in self._entries.values())
+            for root in list(self._entries)[:-1]:
+                if len(self._entries) <= self.max_indexes and (not self.max_chunks or total <= self.max_chunks):
+                    break
+                entry = self._entries[root]
+                if entry.readers or not entry.lock.acquire(blocking=False):
+                    continue  # in use by a search, sync or update
+                del self._entries[root]
+                entry.closed = True
+                total -= entry.index.chunk_count
+                closed.append((root, entry))
+        for root, entry in closed:
+            try:
+                entry.index.close()
+            finally:
+                entry.lock.release()
+            logger.info(f"Closed search index for {root} (least recently used).")
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            with entry.lock:
+                entry.closed = True
+                entry.index.close()
+
+_index_registry = IndexRegistry()
+
+def close_search_indexes():
+    """Close every open search index (at server shutdown)."""
+    _index_registry.close_all()
+
+def get_file_content(file_path: str, root_directory: str = None, max_bytes: Optional[int] = None) -> str:
     """Get the content of a file, ensuring absolute paths are used.
     
     Args:
         file_path: The path to the file to read
         root_directory: The root directory to resolve relative paths against. If None, uses current directory.
+        max_bytes: If set, larger files are truncated at a line boundary with a notice appended,
+            and binary files are replaced by a short placeholder. Leave unset when the content
+            will be edited and written back.
     """
     # Convert to absolute path if relative
     if not os.path.isabs(file_path):
@@ -128,63 +611,327 @@ def get_file_content(file_path: str, root_directory: str = None) -> str:
         else:
             file_path = os.path.join(os.getcwd(), file_path)
     
+    if max_bytes is not None:
+        text = read_text(file_path, max_bytes)
+        if text is None:
+            return ""
+        if text.binary:
+            return f"[binary file, {text.size} bytes, not shown]"
+        return text.text + truncation_notice(text) if text.truncated else text.text
+
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             return f.read()
     except Exception as e:
         return ""
 
-def _build_search_index(root_directory: str) -> SearchIndex:
-    index = SearchIndex()
-    gitignore_spec = _get_gitignore_spec(root_directory)
-    
-    for root, dirs, files in os.walk(root_directory):
-        # Filter out ignored directories to skip them entirely
-        dirs[:] = [d for d in dirs if not gitignore_spec.match_file(os.path.join(root, d))]
-        
-        for file in files:
-            if not file.endswith(('.py', '.js', '.ts', '.svelte', '.html', '.css')):
-                continue
-            
-            file_path = os.path.join(root, file)
-            # Skip files that match gitignore patterns
-            if gitignore_spec.match_file(file_path):
-                continue
-            
-            content = get_file_content(file_path, root_directory)
-            index.add_file(file_path, content)
-    
-    return index
+def get_context_content(file_path: str, root_directory: str = None) -> str:
+    """get_file_content capped at max_context_bytes(), for content that is only shown to a model."""
+    return get_file_content(file_path, root_directory, max_bytes=max_context_bytes() or None)
 
-def _get_or_build_index(root_directory: str) -> SearchIndex:
-    global _index_cache, _last_index_update
-    
-    current_time = time.time()
-    if _index_cache is None or (current_time - _last_index_update) > _INDEX_CACHE_TTL:
-        _index_cache = _build_search_index(root_directory)
-        _last_index_update = current_time
-    
-    return _index_cache
+SEARCH_EXTENSIONS = ('.py', '.js', '.ts', '.svelte', '.html', '.css')
+
+def _searchable_content(filepath: str) -> Optional[str]:
+    """Return the (capped) text to index for a file, or None for binary and minified files."""
+    text = read_text(filepath, max_context_bytes() or None)
+    if text is None or text.binary or text.minified:
+        return None
+    return text.text
+
+def _schedule_sync(entry: _IndexEntry, root_directory: str) -> Optional[threading.Thread]:
+    """
+    Start a background sync of an entry's index if it is stale and none is running. Returns the
+    sync thread, or None if no sync was started.
+    """
+    with entry.sync_lock:
+        watcher = find_watcher(root_directory)
+        stale = entry.last_sync == 0 or (watcher is None and (time.time() - entry.last_sync) > _INDEX_CACHE_TTL)
+        if watcher is not None and watcher not in _subscribed_watchers:
+            watcher.subscribe(lambda paths: update_search_index(root_directory, paths))
+            _subscribed_watchers.add(watcher)
+            stale = True
+        if not stale or entry.syncing:
+            return None
+        entry.syncing = True
+    thread = threading.Thread(target=_run_sync, args=(entry, root_directory), name="search-index-sync", daemon=True)
+    thread.start()
+    return thread
+
+def _run_sync(entry: _IndexEntry, root_directory: str):
+    started = time.time()
+    try:
+        with entry.lock:
+            if not entry.closed:
+                embedded = entry.index.sync()
+                logger.info(f"Search index for {root_directory} synced, {embedded} files embedded.")
+    except Exception as e:
+        logger.error(f"Failed to sync search index for {root_directory}: {e}")
+    finally:
+        with entry.sync_lock:
+            entry.syncing = False
+            entry.last_sync = started
+        entry.ready.set()
+
+@contextmanager
+def _reading_index(root_directory: str) -> Iterator[SearchIndex]:
+    """
+    Yield the SearchIndex of a root for searching. A stale index is re-synced in the background
+    while searches keep using the current generation; only the very first sync is waited for.
+    """
+    entry = _index_registry.acquire(root_directory)
+    try:
+        _schedule_sync(entry, root_directory)
+        entry.ready.wait()
+        yield entry.index
+    finally:
+        _index_registry.release(entry)
+
+def update_search_index(root_directory: str, paths: Optional[Iterable[str]]):
+    """
+    Apply file changes reported by the workspace watcher to the search index of root_directory,
+    if it is open. Only files whose content changed are re-embedded; paths=None re-syncs the
+    whole workspace.
+    """
+    entry = _index_registry.peek(root_directory)
+    if entry is None:
+        return
+    with entry.lock:
+        if entry.closed:
+            return
+        try:
+            if paths is None:
+                entry.index.sync()
+            else:
+                entry.index.update_files(paths)
+        except Exception as e:
+            logger.warning(f"Failed to update search index for {root_directory}: {e}")
+
+def warm_search_roots() -> List[str]:
+    """Return the roots listed in CODEPILOT_WARM_ROOTS (separated by os.pathsep)."""
+    return [root for root in os.getenv("CODEPILOT_WARM_ROOTS", "").split(os.pathsep) if root.strip()]
+
+def warm_search(roots: Iterable[str] = ()) -> threading.Thread:
+    """
+    Load the embedding model and sync the search index of each root in a background thread,
+    so the first search of a session does not pay for them. Returns the started thread.
+    """
+    thread = threading.Thread(target=_warm_search, args=(list(roots),), name="search-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def _warm_search(roots: List[str]):
+    started = time.time()
+    try:
+        # The default model loads its ONNX weights (downloading them once) on the first call.
+        _default_embedding_function()(["warm up"])
+    except Exception as e:
+        logger.warning(f"Failed to load the embedding model: {e}")
+        return
+    logger.info(f"Embedding model loaded in {time.time() - started:.1f}s.")
+    for root_directory in roots:
+        try:
+            sync = _schedule_sync(_index_registry.get(root_directory), root_directory)
+        except Exception as e:
+            logger.warning(f"Failed to open search index for {root_directory}: {e}")
+            continue
+        if sync is not None:
+            sync.join()  # one root at a time, leaving the CPU to requests
+
+class SearchResultCache:
+    """
+    LRU cache of search results keyed by (root, normalized query, search options).
+
+    Each entry remembers the generation it was computed at: the root's SearchIndex generation
+    and a per-root counter bumped by mark_files_changed. An entry whose generation is no longer
+    current is a miss, so results never outlive a change to the files they were computed from.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else env_int("CODEPILOT_SEARCH_CACHE_SIZE", 256)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Tuple[tuple, List[Dict[str, Any]]]]" = OrderedDict()
+        self._root_generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, root_directory: str, index: SearchIndex) -> tuple:
+        with self._lock:
+            return index.generation, self._root_generations.get(root_directory, 0)
+
+    def get(self, key: tuple, generation: tuple) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copy_snippets(entry[1])
+
+    def put(self, key: tuple, generation: tuple, snippets: List[Dict[str, Any]]):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (generation, _copy_snippets(snippets))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, root_directory: str):
+        """Make every cached result of a root stale."""
+        with self._lock:
+            self._root_generations[root_directory] = self._root_generations.get(root_directory, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+def _copy_snippets(snippets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{**snippet, "symbols": list(snippet["symbols"])} for snippet in snippets]
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case, so trivially different spellings of a query share a cache entry."""
+    return " ".join(query.split()).lower()
+
+_search_cache = SearchResultCache()
 
-def get_relevant_snippets(search_terms: str, root_directory: str, top_k: int = 10) -> List[Dict[str, str]]:
-    """Searches through files in the codebase for search_terms using ChromaDB."""
-    with _index_lock:
-        index = _get_or_build_index(root_directory)
+def search_cache_stats() -> Dict[str, int]:
+    """Hit and miss counts and size of the search result cache."""
+    return _search_cache.stats()
+
+def mark_files_changed(root_directory: str, paths: Iterable[str]) -> Optional[threading.Thread]:
+    """
+    Record that files of root_directory were written: cached search results of the root are
+    dropped and, if its search index is open, the files are re-indexed in the background
+    (without waiting for the workspace watcher, which may be disabled). Returns that thread.
+    """
+    root_directory = os.path.abspath(root_directory)
+    _search_cache.invalidate(root_directory)
+    if _index_registry.peek(root_directory) is None:
+        return None
+    paths = [os.path.abspath(path) for path in paths]
+    thread = threading.Thread(
+        target=update_search_index, args=(root_directory, paths), name="search-index-update", daemon=True
+    )
+    thread.start()
+    return thread
+
+def search_max_tokens() -> int:
+    """Token budget of one search result list, from CODEPILOT_SEARCH_MAX_TOKENS (0 disables it)."""
+    return env_int("CODEPILOT_SEARCH_MAX_TOKENS", 4000)
+
+# Hits of one file at most this many lines apart are merged (chunks are separated by the blank lines trimmed off them).
+MERGE_GAP_LINES = 2
+
+def merge_hits(hits: Iterable[SearchHit], context_lines: int = 0) -> List[SearchHit]:
+    """
+    Widen each hit by context_lines on both sides and merge hits of the same file whose line
+    ranges overlap or are at most MERGE_GAP_LINES apart. Merged hits keep the best score; the result is sorted by it.
+    """
+    by_file: Dict[str, List[SearchHit]] = {}
+    for hit in hits:
+        by_file.setdefault(hit.filepath, []).append(hit)
+    merged = []
+    for file_hits in by_file.values():
+        file_hits.sort(key=lambda hit: hit.start_line)
+        current = None
+        for hit in file_hits:
+            if context_lines:
+                hit = hit._replace(start_line=max(1, hit.start_line - context_lines), end_line=hit.end_line + context_lines, text=None)
+            if current is not None and hit.start_line <= current.end_line + MERGE_GAP_LINES + 1:
+                symbols = current.symbols + tuple(s for s in hit.symbols if s not in current.symbols)
+                current = current._replace(
+                    end_line=max(current.end_line, hit.end_line), symbols=symbols,
+                    score=max(current.score, hit.score), text=None,
+                )
+            else:
+                if current is not None:
+                    merged.append(current)
+                current = hit
+        merged.append(current)
+    return sorted(merged, key=lambda hit: -hit.score)
+
+def _hit_texts(hits: List[SearchHit]) -> Iterator[Tuple[SearchHit, str]]:
+    """
+    Yield each hit with its text. Hits without a chunk text are read from disk, each file once
+    and only up to the last line any of its hits needs.
+    """
+    read_to: Dict[str, int] = {}
+    for hit in hits:
+        if hit.text is None:
+            read_to[hit.filepath] = max(read_to.get(hit.filepath, 0), hit.end_line)
+    file_lines: Dict[str, List[str]] = {}
+    for hit in hits:
+        if hit.text is not None:
+            yield hit, hit.text
+            continue
+        lines = file_lines.get(hit.filepath)
+        if lines is None:
+            try:
+                lines = list(iter_lines(hit.filepath, read_to[hit.filepath]))
+            except OSError:
+                lines = []
+            file_lines[hit.filepath] = lines
+        if len(lines) < read_to[hit.filepath]:
+            # The context window ran past the end of the file.
+            hit = hit._replace(end_line=max(hit.start_line, min(hit.end_line, len(lines))))
+        yield hit, "\n".join(lines[hit.start_line - 1:hit.end_line])
+
+def _fit_lines(text: str, max_tokens: int) -> Tuple[str, int]:
+    """Return the longest head of text (whole lines) within max_tokens, with a marker for the cut lines, and its token count."""
+    lines = text.split("\n")
+    kept, tokens = [], 0
+    for line in lines:
+        line_tokens = count_tokens(line + "\n")
+        if tokens + line_tokens > max_tokens:
+            break
+        kept.append(line)
+        tokens += line_tokens
+    return "\n".join(kept + [f"... [{len(lines) - len(kept)} more lines]"]), tokens
+
+def get_relevant_snippets(search_terms: str, root_directory: str, top_k: int = 10, context_lines: int = 0, max_tokens: Optional[int] = None, mode: str = "auto") -> List[Dict[str, Any]]:
+    """
+    Searches through files in the codebase for search_terms with SearchIndex.search in the given mode.
+
+    Returns the matched chunks with their line ranges, best match first. Hits of one file that
+    overlap or nearly touch (after widening them by context_lines) are merged into one snippet, and the
+    list is cut off at max_tokens (search_max_tokens() by default; 0 disables the limit).
+    Results are cached until the root's files change (see SearchResultCache).
+    """
+    root_directory = os.path.abspath(root_directory)
+    budget = search_max_tokens() if max_tokens is None else max_tokens
+    key = (root_directory, normalize_query(search_terms), top_k, context_lines, budget, mode)
+    with _reading_index(root_directory) as index:
+        generation = _search_cache.generation(root_directory, index)
+        cached = _search_cache.get(key, generation)
+        if cached is not None:
+            return cached
         try:
-            results = index.query(query_text=search_terms, n_results=top_k)
-            snippets = []
-            for doc_id, distance in zip(results['ids'][0], results['distances'][0]):
-                snippet = {
-                    "filename": doc_id.split("::")[0],
-                    "snippet": get_file_content(doc_id.split("::")[0], root_directory),  # Get content of the full file
-                    "distance": distance
-                }
-                snippets.append(snippet)
-            return snippets
+            hits = index.search(search_terms, n_results=top_k, mode=mode)
         except Exception as e:
             logger.error(f"Search failed: {e}")
             return []
 
+    snippets = []
+    used = 0
+    for hit, text in _hit_texts(merge_hits(hits, context_lines)):
+        tokens = count_tokens(text)
+        if budget and used + tokens > budget:
+            if snippets:
+                break
+            # Always return (the head of) the best match.
+            text, tokens = _fit_lines(text, budget)
+        snippets.append({
+            "filename": hit.filepath,
+            "lines": f"{hit.start_line}-{hit.end_line}",
+            "symbols": list(hit.symbols),
+            "snippet": text,
+            "score": round(hit.score, 4),
+        })
+        used += tokens
+    _search_cache.put(key, generation, snippets)
+    return snippets
+
 def build_full_context(repo_map: str, files: RelevantFiles, root_directory: str = None) -> str:
     """
     Given a repo_map (as a string) and a list of file objects (each with a 'filename' key),
@@ -201,7 +948,7 @@ def build_full_context(repo_map: str, files: RelevantFiles, root_directory: str
         if not os.path.isabs(filename) and root_directory:
             filename = os.path.join(root_directory, filename)
         if filename and os.path.isfile(filename):
-            content = get_file_content(filename, root_directory)
+            content = get_context_content(filename, root_directory)
             context_parts.append(f"File: {filename}\n{content}\n")
         else:
             context_parts.append(f"File: {filename} not found.\n")
@@ -0,0 +1,344 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from backend.config import env_bool
+from backend.repo_map import RepoMap
+from backend.workspace import ALWAYS_IGNORED_DIRS, Workspace
+
+logger = logging.getLogger(__name__)
+
+# Quiet period after the last event before a batch of changes is delivered.
+DEBOUNCE_SECONDS = 0.3
+# Upper bound on how long a continuous stream of events can delay delivery.
+MAX_DELAY_SECONDS = 2.0
+# How often the polling scanner re-stats the workspace.
+POLL_INTERVAL_SECONDS = 2.0
+# How long the watcher thread blocks waiting for events before checking for stop().
+_IDLE_TIMEOUT = 0.5
+
+# Callbacks receive the absolute paths of changed, added or deleted files, or None when the
+# watcher lost track of events (queue overflow, directory moves) and everything must be rescanned.
+ChangeCallback = Callable[[Optional[Set[str]]], None]
+
+def watching_enabled() -> bool:
+    """Return False if CODEPILOT_WATCH disables the workspace watcher."""
+    return env_bool("CODEPILOT_WATCH", True)
+
+class _PollingBackend:
+    """Detects changes by periodically re-enumerating the workspace and comparing (mtime, size)."""
+
+    name = "polling"
+
+    def __init__(self, workspace: Workspace, interval: float = POLL_INTERVAL_SECONDS):
+        self.workspace = workspace
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        return {record.path: (record.stat.st_mtime_ns, record.stat.st_size) for record in self.workspace.iter_files()}
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        """Wait up to timeout for the next scan and return (changed paths, rescan needed)."""
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set(), False
+        if delay > 0:
+            time.sleep(delay)
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = {path for path, sig in snapshot.items() if self._snapshot.get(path) != sig}
+        changed.update(self._snapshot.keys() - snapshot.keys())
+        self._snapshot = snapshot
+        return changed, False
+
+    def close(self):
+        pass
+
+class _InotifyBackend:
+    """
+    Linux inotify watches on every workspace directory, through ctypes so no extra dependency
+    is needed. File events are reported per path; directory creation, deletion and moves
+    (and queue overflows) ask for a rescan since their contents are not tracked individually.
+    """
+
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+                  | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, workspace: Workspace):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.workspace = workspace
+        self._dirs: Dict[int, str] = {}
+        try:
+            # Directories holding workspace files are known not to be ignored; the walk only
+            # checks the others (such as empty directories) against the ignore rules.
+            directories = {workspace.root_dir}
+            for record in workspace.iter_files():
+                parent = os.path.dirname(record.path)
+                while parent not in directories and parent.startswith(workspace.root_dir):
+                    directories.add(parent)
+                    parent = os.path.dirname(parent)
+            self._watch_tree(workspace.root_dir, directories)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC means fs.inotify.max_user_watches is exhausted.
+            raise OSError(err, f"inotify_add_watch failed for {directory}: {os.strerror(err)}")
+        self._dirs[wd] = directory
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        """Wait up to timeout for events and return (changed paths, rescan needed)."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+        changed, rescan = set(), False
+        created = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                rescan = True
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._dirs[wd]
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                rescan = True
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if name in ALWAYS_IGNORED_DIRS:
+                    continue
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    created.append(path)
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    rescan = True
+                continue
+            changed.add(path)
+        if created:
+            ignored = self.workspace.is_ignored_many(created)
+            for path in created:
+                if path not in ignored:
+                    self._watch_tree(path)
+                    rescan = True
+        return changed, rescan
+
+    def _watch_tree(self, directory: str, known: Set[str] = frozenset()):
+        """Watch a directory and the non-ignored directories below it; known ones are not checked."""
+        for dirpath, dirnames, _ in os.walk(directory):
+            subdirs = [os.path.join(dirpath, d) for d in dirnames if d not in ALWAYS_IGNORED_DIRS]
+            ignored = self.workspace.is_ignored_many(d for d in subdirs if d not in known)
+            dirnames[:] = [os.path.basename(d) for d in subdirs if d not in ignored]
+            self._add_watch(dirpath)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class WorkspaceWatcher:
+    """
+    Watches a workspace root on a background thread and reports batches of changed files.
+
+    Uses inotify on Linux and falls back to a stat-polling scanner elsewhere (or when inotify
+    watches are exhausted). Events are debounced and coalesced: subscribers are called once per
+    burst of activity with the set of paths that changed, after DEBOUNCE_SECONDS of quiet or at
+    most MAX_DELAY_SECONDS after the first event.
+    """
+
+    def __init__(self, root_dir: str = ".", debounce: float = DEBOUNCE_SECONDS, max_delay: float = MAX_DELAY_SECONDS,
+                 poll_interval: float = POLL_INTERVAL_SECONDS, use_inotify: Optional[bool] = None):
+        self.root_dir = os.path.abspath(root_dir)
+        self.workspace = Workspace(self.root_dir)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self.backend = None
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback: ChangeCallback):
+        """Register a callback for batches of changed paths. Callbacks run on the watcher thread."""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+    def start(self):
+        """Set up the watch backend and start the watcher thread. Does nothing if already running."""
+        if self._thread is not None:
+            return
+        self.backend = self._create_backend()
+        logger.info(f"Watching {self.root_dir} with the {self.backend.name} backend.")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"watcher:{self.root_dir}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and release the backend."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+
+    def _create_backend(self):
+        if self.use_inotify:
+            try:
+                return _InotifyBackend(self.workspace)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify unavailable for {self.root_dir}, falling back to polling: {e}")
+        return _PollingBackend(self.workspace, self.poll_interval)
+
+    def _run(self):
+        pending: Set[str] = set()
+        rescan = False
+        first_event = last_event = 0.0
+        while not self._stop.is_set():
+            timeout = self.debounce if pending or rescan else _IDLE_TIMEOUT
+            try:
+                changed, needs_rescan = self.backend.read(timeout)
+            except OSError as e:
+                logger.error(f"Watching {self.root_dir} failed: {e}")
+                changed, needs_rescan = set(), True
+                self.backend.close()
+                self.backend = _PollingBackend(self.workspace, self.poll_interval)
+            now = time.monotonic()
+            if changed or needs_rescan:
+                if not pending and not rescan:
+                    first_event = now
+                last_event = now
+                pending.update(changed)
+                rescan = rescan or needs_rescan
+            if (pending or rescan) and (now - last_event >= self.debounce or now - first_event >= self.max_delay):
+                self._dispatch(None if rescan else pending)
+                pending, rescan = set(), False
+
+    def _dispatch(self, paths: Optional[Set[str]]):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(set(paths) if paths is not None else None)
+            except Exception as e:
+                logger.error(f"Watcher callback for {self.root_dir} failed: {e}")
+
+_watchers: Dict[str, WorkspaceWatcher] = {}
+_repo_maps: Dict[str, RepoMap] = {}
+# Per-root locks held while a repo map is built, so each root is built once.
+_opening: Dict[str, threading.Lock] = {}
+_registry_lock = threading.RLock()
+
+def watch_root(root_dir: str, **options) -> WorkspaceWatcher:
+    """
+    Return the running watcher for root_dir, starting one if the root is not watched yet.
+    options are passed to WorkspaceWatcher when a new watcher is created.
+    """
+    root_dir = os.path.abspath(root_dir)
+    with _registry_lock:
+        watcher = _watchers.get(root_dir)
+        if watcher is None:
+            watcher = WorkspaceWatcher(root_dir, **options)
+            watcher.start()
+            _watchers[root_dir] = watcher
+        return watcher
+
+def find_watcher(root_dir: str) -> Optional[WorkspaceWatcher]:
+    """Return the watcher for root_dir if it is being watched."""
+    return _watchers.get(os.path.abspath(root_dir))
+
+def get_repo_map(root_dir: str, model_name: Optional[str] = None) -> RepoMap:
+    """
+    Return a built RepoMap for root_dir that the root's watcher keeps up to date.
+    The first call builds the map and starts watching; later calls for the same root return
+    the same map immediately. With CODEPILOT_WATCH disabled a fresh map is built every time.
+    """
+    root_dir = os.path.abspath(root_dir)
+    if not watching_enabled():
+        rm = RepoMap(root_dir, model_name=model_name)
+        rm.build_map()
+        return rm
+    with _registry_lock:
+        rm = _repo_maps.get(root_dir)
+        if rm is not None:
+            return rm
+        opening = _opening.setdefault(root_dir, threading.Lock())
+    # Build outside the registry lock so a cold build does not block other roots.
+    with opening:
+        with _registry_lock:
+            rm = _repo_maps.get(root_dir)
+        if rm is None:
+            try:
+                rm = RepoMap(root_dir, model_name=model_name)
+                watcher = watch_root(root_dir)
+                # Subscribe before the initial build so changes made while it runs are not lost.
+                watcher.subscribe(lambda paths: rm.build_map() if paths is None else rm.refresh(paths))
+                rm.build_map()
+                with _registry_lock:
+                    # Not shared if stop_watchers() stopped the root's watcher during the build.
+                    if _watchers.get(root_dir) is watcher:
+                        _repo_maps[root_dir] = rm
+            finally:
+                with _registry_lock:
+                    _opening.pop(root_dir, None)
+    return rm
+
+def stop_watchers(roots: Optional[Iterable[str]] = None):
+    """Stop the watchers for the given roots (all of them by default) and forget their repo maps."""
+    with _registry_lock:
+        roots = list(_watchers) if roots is None else [os.path.abspath(root) for root in roots]
+        watchers = [_watchers.pop(root) for root in roots if root in _watchers]
+        for root in roots:
+            _repo_maps.pop(root, None)
+    for watcher in watchers:
+        watcher.stop()
@@ -0,0 +1,226 @@
+import os
+import subprocess
+import logging
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from pathspec import GitIgnoreSpec
+
+logger = logging.getLogger(__name__)
+
+# Directories that are never part of the workspace, whatever the ignore rules say.
+ALWAYS_IGNORED_DIRS = {".git"}
+
+class WorkspaceFile(NamedTuple):
+    """A file in the workspace: absolute path, path relative to the root, and its stat result."""
+    path: str
+    rel_path: str
+    stat: os.stat_result
+
+def _git_ls_files(root_dir: str) -> Optional[List[str]]:
+    """
+    List tracked and untracked-but-not-ignored files under root_dir, relative to it.
+    Returns None if root_dir is not inside a git work tree or git is unavailable.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", root_dir, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    paths = result.stdout.decode("utf-8", errors="surrogateescape").split("\0")
+    return [p for p in paths if p]
+
+def _load_gitignore(path: str) -> Optional[GitIgnoreSpec]:
+    """Compile a .gitignore file, or return None if it is missing, unreadable or empty."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = [line.rstrip("\n") for line in f]
+    except OSError:
+        return None
+    spec = GitIgnoreSpec.from_lines(lines)
+    return spec if len(spec) else None
+
+def _parent_rel(rel_path: str) -> str:
+    """Return the parent of a root-relative, '/'-separated path ("" for top-level entries)."""
+    return rel_path.rsplit("/", 1)[0] if "/" in rel_path else ""
+
+# A compiled .gitignore together with the root-relative directory it applies to ("" for the root).
+Scope = Tuple[str, GitIgnoreSpec]
+
+def _is_ignored_by(scopes: List[Scope], rel_path: str, is_dir: bool) -> bool:
+    """
+    Apply scoped .gitignore rules to a root-relative, '/'-separated path.
+    Scopes are ordered from the root down, so a deeper file can re-include what a parent ignored.
+    """
+    ignored = False
+    for base, spec in scopes:
+        local = rel_path[len(base) + 1:] if base else rel_path
+        if is_dir:
+            local += "/"
+        include = spec.check_file(local).include
+        if include is not None:
+            ignored = include
+    return ignored
+
+class Workspace:
+    """
+    Enumerates the files of a workspace root in a single pass.
+
+    Inside a git work tree the file list comes from `git ls-files`, which already applies every
+    .gitignore and the repository's exclude files. Elsewhere the tree is walked once, compiling
+    each directory's .gitignore when the walk enters it and pruning ignored directories.
+    """
+
+    def __init__(self, root_dir: str = "."):
+        self.root_dir = os.path.abspath(root_dir)
+        self._scopes: Dict[str, List[Scope]] = {}
+        self._is_git: Optional[bool] = None
+
+    @property
+    def is_git(self) -> bool:
+        if self._is_git is None:
+            try:
+                subprocess.run(
+                    ["git", "-C", self.root_dir, "rev-parse", "--is-inside-work-tree"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True,
+                )
+                self._is_git = True
+            except (OSError, subprocess.CalledProcessError):
+                self._is_git = False
+        return self._is_git
+
+    def iter_files(self, extensions: Optional[Tuple[str, ...]] = None) -> Iterator[WorkspaceFile]:
+        """
+        Yield a WorkspaceFile for every non-ignored regular file, optionally filtered by extension.
+        """
+        rel_paths = _git_ls_files(self.root_dir) if self.is_git else None
+        if rel_paths is None:
+            yield from self._walk(extensions)
+            return
+        for rel_path in rel_paths:
+            if extensions and not rel_path.endswith(extensions):
+                continue
+            record = self.stat_file(rel_path)
+            if record is not None:
+                yield record
+
+    def stat_file(self, path: str) -> Optional[WorkspaceFile]:
+        """Return the WorkspaceFile for a path (absolute or root-relative), or None if it is not a regular file."""
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_dir, path)
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return WorkspaceFile(path, os.path.relpath(path, self.root_dir), st)
+
+    def is_ignored(self, path: str) -> bool:
+        """
+        Return True if a path (absolute or root-relative) lies outside the root or is excluded by ignore rules.
+        Use is_ignored_many to check many paths.
+        """
+        return bool(self.is_ignored_many([path]))
+
+    def is_ignored_many(self, paths: Iterable[str]) -> Set[str]:
+        """
+        Return the paths (as given) that is_ignored would report as ignored. In a git work tree
+        the ignore rules of all the paths are checked by a single `git check-ignore` call.
+        """
+        ignored = set()
+        candidates: Dict[str, List[str]] = {}  # root-relative path -> the given paths it came from
+        for path in paths:
+            full_path = os.path.abspath(path if os.path.isabs(path) else os.path.join(self.root_dir, path))
+            rel_path = os.path.relpath(full_path, self.root_dir)
+            if rel_path.startswith(os.pardir) or any(part in ALWAYS_IGNORED_DIRS for part in rel_path.split(os.sep)):
+                ignored.add(path)
+            else:
+                candidates.setdefault(rel_path, []).append(path)
+        if not candidates:
+            return ignored
+        if self.is_git:
+            matched = self._git_check_ignore(list(candidates))
+        else:
+            matched = [rel_path for rel_path in candidates if self._is_ignored_walk(rel_path)]
+        for rel_path in matched:
+            ignored.update(candidates.get(rel_path, ()))
+        return ignored
+
+    def _git_check_ignore(self, rel_paths: List[str]) -> List[str]:
+        """Return the root-relative paths that git ignores, with one `git check-ignore --stdin` call."""
+        try:
+            result = subprocess.run(
+                ["git", "-C", self.root_dir, "check-ignore", "--stdin", "-z"],
+                input=b"\0".join(os.fsencode(rel_path) for rel_path in rel_paths) + b"\0",
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return []
+        # Exit status 1 means no path is ignored; anything else but 0 is an error.
+        if result.returncode != 0:
+            return []
+        return [os.fsdecode(p) for p in result.stdout.split(b"\0") if p]
+
+    def _is_ignored_walk(self, rel_path: str) -> bool:
+        """Apply the scoped .gitignore rules to a root-relative path outside of git."""
+        parts = rel_path.split(os.sep)
+        # Every ancestor directory must itself be included for the file to be.
+        for depth in range(1, len(parts)):
+            dir_rel = "/".join(parts[:depth])
+            if _is_ignored_by(self._scopes_for(_parent_rel(dir_rel)), dir_rel, True):
+                return True
+        file_rel = "/".join(parts)
+        return _is_ignored_by(self._scopes_for(_parent_rel(file_rel)), file_rel, os.path.isdir(os.path.join(self.root_dir, rel_path)))
+
+    def _scopes_for(self, dir_rel: str) -> List[Scope]:
+        """Return the .gitignore scopes that apply inside a root-relative directory, loading them once."""
+        scopes = self._scopes.get(dir_rel)
+        if scopes is None:
+            parent_scopes = self._scopes_for(_parent_rel(dir_rel)) if dir_rel else []
+            spec = _load_gitignore(os.path.join(self.root_dir, dir_rel, ".gitignore"))
+            scopes = parent_scopes + [(dir_rel, spec)] if spec else parent_scopes
+            self._scopes[dir_rel] = scopes
+        return scopes
+
+    def _walk(self, extensions: Optional[Tuple[str, ...]]) -> Iterator[WorkspaceFile]:
+        """Single sorted walk of the tree, applying scoped .gitignore rules as directories are entered."""
+        stack = [""]
+        while stack:
+            dir_rel = stack.pop()
+            scopes = self._scopes_for(dir_rel)
+            dir_path = os.path.join(self.root_dir, dir_rel) if dir_rel else self.root_dir
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                logger.warning(f"Cannot list {dir_path}: {e}")
+                continue
+            subdirs = []
+            for entry in entries:
+                entry_rel = f"{dir_rel}/{entry.name}" if dir_rel else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in ALWAYS_IGNORED_DIRS and not _is_ignored_by(scopes, entry_rel, True):
+                            subdirs.append(entry_rel)
+                        continue
+                    if extensions and not entry.name.endswith(extensions):
+                        continue
+                    if not entry.is_file() or _is_ignored_by(scopes, entry_rel, False):
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                yield WorkspaceFile(entry.path, entry_rel.replace("/", os.sep), st)
+            # Reverse so the stack pops subdirectories in sorted order.
+            stack.extend(reversed(subdirs))
+
+def iter_workspace_files(root_dir: str, extensions: Optional[Tuple[str, ...]] = None) -> Iterator[WorkspaceFile]:
+    """Convenience wrapper around Workspace(root_dir).iter_files(extensions)."""
+    return Workspace(root_dir).iter_files(extensions)
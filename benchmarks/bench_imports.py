@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Benchmark the import time of the backend modules, each in a fresh interpreter, and list the
+heavy dependencies each one pulls in. Search and stub-only paths should not load chromadb,
+numpy or bs4 until they are used.
+
+Usage: python benchmarks/bench_imports.py [runs]
+"""
+import os
+import subprocess
+import sys
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["backend.repo_map", "backend.watcher", "backend.utils", "backend.agents.coder_agent"]
+HEAVY = ["chromadb", "numpy", "bs4", "tiktoken", "pydantic_ai"]
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(" ".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+def import_once(module):
+    """Return (seconds, heavy modules loaded) of importing module in a new interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(module=module, heavy=HEAVY)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    return float(output[0]), output[1] if len(output) > 1 else ""
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'module':<30}{'median':>10}{'min':>10}  heavy imports")
+    for module in MODULES:
+        results = [import_once(module) for _ in range(runs)]
+        times = [seconds for seconds, _ in results]
+        print(f"{module:<30}{statistics.median(times) * 1000:>8.0f}ms{min(times) * 1000:>8.0f}ms  {results[-1][1] or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark the single-pass Python symbol extractor used by RepoMap against the previous
+implementation (add_parent_info + two ast.walk passes) on large generated modules.
+
+Usage: python benchmarks/bench_python_extractor.py [repeats]
+"""
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.repo_map import extract_python_symbols, unparse_annotation
+
+def legacy_add_parent_info(node, parent=None):
+    node.parent = parent
+    for child in ast.iter_child_nodes(node):
+        legacy_add_parent_info(child, node)
+
+def legacy_signature(node):
+    params = []
+    for arg in node.args.args:
+        param = {"name": arg.arg}
+        if arg.annotation:
+            param["type"] = unparse_annotation(arg.annotation)
+        params.append(param)
+    if node.args.vararg:
+        params.append({"name": "*" + node.args.vararg.arg})
+    for arg in node.args.kwonlyargs:
+        params.append({"name": arg.arg})
+    if node.args.kwarg:
+        params.append({"name": "**" + node.args.kwarg.arg})
+    func_info = {"name": node.name, "parameters": params}
+    if node.returns:
+        func_info["return"] = unparse_annotation(node.returns)
+    return func_info
+
+def legacy_extract(tree):
+    """The RepoMap.parse_python_file logic before the single-pass extractor."""
+    legacy_add_parent_info(tree)
+    file_info = {"functions": [], "classes": []}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if isinstance(getattr(node, "parent", None), ast.ClassDef):
+                continue
+            file_info["functions"].append(legacy_signature(node))
+    for node in ast.iter_child_nodes(tree):
+        if isinstance(node, ast.ClassDef):
+            class_info = {"name": node.name, "methods": [], "attributes": []}
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    class_info["methods"].append(legacy_signature(item))
+                elif isinstance(item, ast.AnnAssign) and isinstance(item.target, ast.Name):
+                    class_info["attributes"].append({"name": item.target.id})
+            file_info["classes"].append(class_info)
+    return file_info
+
+def generated_classes(n_classes=150, n_methods=12, body_lines=15):
+    """Many classes with long method bodies, like generated API clients or ORM models."""
+    lines = ["import os", "from typing import Any, Dict, List", ""]
+    for c in range(n_classes):
+        lines.append(f"class Model{c}(Base):")
+        lines.append(f"    field_{c}: Dict[str, Any] = {{}}")
+        for m in range(n_methods):
+            lines.append(f"    def method_{m}(self, a: int, b: str = 'x', *args, flag: bool = False, **kw) -> List[int]:")
+            for b in range(body_lines):
+                lines.append(f"        value_{b} = [a + {b} * i for i in range(10) if i % 2] + [len(b)]")
+            lines.append("        return value_0")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def generated_tables(n_rows=300, row_width=40):
+    """A module dominated by a large literal table, like generated lookup tables or fixtures."""
+    rows = [f"    ({', '.join(str(r * row_width + c) for c in range(row_width))})," for r in range(n_rows)]
+    return "TABLE = (\n" + "\n".join(rows) + "\n)\n\ndef lookup(i: int) -> int:\n    return TABLE[i][0]\n"
+
+def generated_deep_expression(terms=2000):
+    """One very long expression chain; its AST is ~terms levels deep."""
+    return "TOTAL = " + " + ".join(f"v{i}" for i in range(terms)) + "\n\ndef total() -> int:\n    return TOTAL\n"
+
+def bench(fn, source, repeats):
+    """Return the best extraction time (parsing excluded) over repeats runs, or the RecursionError raised."""
+    best = None
+    for _ in range(repeats):
+        tree = ast.parse(source)
+        start = time.perf_counter()
+        try:
+            fn(tree)
+        except RecursionError as e:
+            return e
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    cases = [
+        ("150 classes x 12 methods", generated_classes()),
+        ("300x40 literal table", generated_tables()),
+        ("2000-term expression", generated_deep_expression()),
+    ]
+    print(f"{'module':<28}{'size':>10}{'legacy':>16}{'single-pass':>14}{'speedup':>10}")
+    for name, source in cases:
+        legacy = bench(legacy_extract, source, repeats)
+        current = bench(extract_python_symbols, source, repeats)
+        size = f"{len(source) // 1024} KiB"
+        if isinstance(legacy, RecursionError):
+            print(f"{name:<28}{size:>10}{'RecursionError':>16}{current * 1000:>12.1f}ms{'-':>10}")
+        else:
+            print(f"{name:<28}{size:>10}{legacy * 1000:>14.1f}ms{current * 1000:>12.1f}ms{legacy / current:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
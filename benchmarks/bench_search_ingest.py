@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark SearchIndex bulk ingestion against the previous one-chunk-per-call path
+(one embedding call and one collection write per chunk) on generated source files.
+
+Uses chroma's default ONNX embedding model, which is downloaded on first use.
+
+Usage: python benchmarks/bench_search_ingest.py [n_files]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils import SearchIndex, chunk_text
+
+def generated_file(i, n_functions=12):
+    lines = [f"# module {i}", "import os", ""]
+    for f in range(n_functions):
+        lines.append(f"def handler_{i}_{f}(request, retries: int = 3) -> dict:")
+        lines.append(f"    path = os.path.join('/srv', request['name'], '{f}')")
+        lines.append("    return {'path': path, 'retries': retries}")
+        lines.append("")
+    return "\n".join(lines)
+
+def legacy_ingest(index, files):
+    """The SearchIndex.add_file loop before bulk ingestion."""
+    for filepath, content in files:
+        for i, chunk in enumerate(chunk_text(content)):
+            index.collection.add(documents=[chunk], ids=[f"{filepath}::chunk{i}"], metadatas=[{"filepath": filepath}])
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    files = [(f"/bench/file_{i}.py", generated_file(i)) for i in range(n_files)]
+    n_chunks = sum(len(chunk_text(content)) for _, content in files)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = SearchIndex(os.path.join(tmp, "legacy"), cache_dir=os.path.join(tmp, "cache"))
+        legacy.collection.query(query_texts=["warm up"], n_results=1)
+        start = time.perf_counter()
+        legacy_ingest(legacy, files)
+        legacy_seconds = time.perf_counter() - start
+
+        bulk = SearchIndex(os.path.join(tmp, "bulk"), cache_dir=os.path.join(tmp, "cache"))
+        stats = bulk.add_files((filepath, content, None) for filepath, content in files)
+    print(f"{n_files} files, {n_chunks} fixed-size chunks, {stats.chunks} symbol chunks")
+    print(f"{'per-chunk':<12}{legacy_seconds:>10.2f}s{n_chunks / legacy_seconds:>12.0f} chunks/sec")
+    print(f"{'bulk':<12}{stats.seconds:>10.2f}s{stats.chunks_per_second:>12.0f} chunks/sec")
+
+if __name__ == "__main__":
+    main()